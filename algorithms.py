@@ -1,17 +1,55 @@
 from models import Item, Container, Zone
-from octree import Octree
+from database import place_items
+from octree import GRID_SEARCH, FRONT_FIRST_SEARCH, COARSE_TO_FINE_SEARCH
+from occupancy import FINE_RESOLUTION, OccupancyGrid
+from spatial_cache import get_octree, get_octrees, get_blocking_graph, get_capacities
+from retrieval import PLAN_TIME_BUDGET
+from placement_pool import container_task, search_containers
+from snapshots import ItemSnapshot
+from spatial_db import get_blocker_ids, get_container_versions
 import numpy as np
-from app import db, logger
+import time
+from app import app, db, logger
 from datetime import datetime
 
-def find_optimal_placement(item, containers=None):
-    """Find the optimal placement for an item across all containers."""
+# Search modes that visit every grid position, so a miss proves the item does not fit
+EXHAUSTIVE_SEARCHES = (GRID_SEARCH, FRONT_FIRST_SEARCH)
+
+def score_placement(item, container, y):
+    """Score a placement: preferred zone first, then closeness to the front, plus priority."""
+    # Prioritize containers in the preferred zone
+    zone_match_score = 50 if container.zone_id == item.preferred_zone_id else 0
+    
+    # Calculate a placement score (lower y is better - closer to the front)
+    # Higher priority items should have lower y values
+    placement_score = 100 - (y / container.depth * 100)
+    
+    # Combine scores
+    return zone_match_score + placement_score + item.priority / 10
+
+def search_placement(item, containers=None, mode=GRID_SEARCH, octrees=None, resolution=FINE_RESOLUTION,
+                     time_budget=None, workers=None, capacities=None, deadline=None):
+    """Search the containers for an item's best placement; see find_optimal_placement.
+    
+    Stops starting new container searches after ``deadline`` seconds, but
+    always searches the most promising container. Returns (placement, explored):
+    the best placement found or None, and the fraction of the containers
+    that were searched or ruled out.
+    """
+    start = time.perf_counter()
     if containers is None:
         containers = Container.query.all()
+    if workers is None:
+        workers = app.config.get('PLACEMENT_WORKERS', 1)
+    # Containers without a caller's octree are checked against one read of their versions
+    shared = [container for container in containers if octrees is None or container.id not in octrees]
+    versions = get_container_versions([container.id for container in shared])
+    summaries = dict(get_capacities(shared, versions))
+    summaries.update(capacities or {})
     
-    best_placement = None
-    best_score = float('-inf')
-    
+    dimensions = (item.width, item.depth, item.height)
+    candidates = []
+    bounds = []
     for container in containers:
         # Check if the item can fit in this container at all
         if (item.width > container.width and item.depth > container.width) or \
@@ -19,24 +57,67 @@ def find_optimal_placement(item, containers=None):
            item.height > container.height:
             continue
         
-        # Prioritize containers in the preferred zone
-        zone_match_score = 50 if container.zone_id == item.preferred_zone_id else 0
-        
-        # Create an octree for the container
-        octree = Octree(container)
-        
-        # Find empty space in this container
-        position = octree.find_empty_space(item.width, item.depth, item.height)
+        summary = summaries.get(container.id)
+        front = summary.min_front(*dimensions, mode=mode) if summary is not None else 0
+        if front is None:
+            continue
         
+        candidates.append(container)
+        bounds.append(score_placement(item, container, front))
+    
+    # Use the caller's octree for each container, or the cached one
+    cached = get_octrees([container for container in candidates if container.id in versions], versions)
+    candidates = [
+        (container, cached[container.id] if container.id in cached else octrees[container.id])
+        for container in candidates
+    ]
+    
+    # Find empty space in each container
+    end = start + deadline if deadline is not None else None
+    unexplored = 0
+    if workers > 1 and len(candidates) > 1:
+        tasks = [container_task(container, octree.items.values()) for container, octree in candidates]
+        remaining = max(0, end - time.perf_counter()) if end is not None else None
+        results = search_containers(tasks, dimensions, mode, resolution, time_budget, workers, deadline=remaining)
+        unexplored = results.count(None)
+        results = [result or (None, None) for result in results]
+    else:
+        results = [(None, None)] * len(candidates)
+        best_found = float('-inf')
+        budget_end = time.perf_counter() + time_budget if time_budget is not None else None
+        order = sorted(range(len(candidates)), key=lambda index: -bounds[index])
+        for searched, index in enumerate(order):
+            if bounds[index] < best_found:
+                break
+            if searched and end is not None and time.perf_counter() >= end:
+                unexplored = len(candidates) - searched
+                break
+            container, octree = candidates[index]
+            if mode == COARSE_TO_FINE_SEARCH:
+                budget = None
+                ends = [t for t in (budget_end, end) if t is not None]
+                if ends:
+                    # Share what is left of the budget among the remaining containers
+                    budget = max(0, min(ends) - time.perf_counter()) / (len(candidates) - searched)
+                results[index] = octree.find_space_coarse_to_fine(
+                    *dimensions, min_resolution=resolution, time_budget=budget
+                )
+            else:
+                results[index] = (octree.find_empty_space(*dimensions, mode=mode), None)
+            
+            position = results[index][0]
+            if position:
+                best_found = max(best_found, score_placement(item, container, position[1]))
+            elif mode in EXHAUSTIVE_SEARCHES and container.id in summaries:
+                summaries[container.id].record_misfit(mode, *dimensions)
+    
+    best_placement = None
+    best_score = float('-inf')
+    
+    for (container, octree), (position, achieved) in zip(candidates, results):
         if position:
             x, y, z, rotated = position
-            
-            # Calculate a placement score (lower y is better - closer to the front)
-            # Higher priority items should have lower y values
-            placement_score = 100 - (y / container.depth * 100)
-            
-            # Combine scores
-            total_score = zone_match_score + placement_score + item.priority / 10
+            total_score = score_placement(item, container, y)
             
             if total_score > best_score:
                 best_score = total_score
@@ -48,50 +129,286 @@ def find_optimal_placement(item, containers=None):
                     'rotated': rotated,
                     'score': total_score
                 }
+                if achieved is not None:
+                    best_placement['resolution'] = achieved
     
-    return best_placement
+    explored = 1 - unexplored / len(containers) if containers else 1.0
+    return best_placement, explored
 
-def find_optimal_placements_for_batch(items):
-    """Find optimal placements for a batch of items."""
-    # Sort items by priority (highest first)
-    sorted_items = sorted(items, key=lambda x: x.priority, reverse=True)
+def find_optimal_placement(item, containers=None, mode=GRID_SEARCH, octrees=None,
+                           resolution=FINE_RESOLUTION, time_budget=None, workers=None, capacities=None,
+                           deadline=None):
+    """Find the optimal placement for an item across all containers.
     
-    # Get all containers
-    containers = Container.query.all()
-    container_octrees = {container.id: Octree(container) for container in containers}
+    ``mode`` selects the empty-space search (see octree.PLACEMENT_MODES).
+    ``octrees`` optionally maps container ids to already built octrees, so
+    callers placing several items can reuse and update them; they pass the
+    matching ``capacities`` too, or those containers are not pruned.
     
-    placements = []
+    Each container's capacity summary is checked before its octree is
+    touched: containers without room for the item are skipped, and the rest
+    are searched from the highest possible score down until no remaining
+    container can beat the best placement found.
     
-    for item in sorted_items:
-        best_placement = find_optimal_placement(item, containers)
+    The coarse-to-fine search refines down to ``resolution`` cm and may
+    spend ``time_budget`` seconds over all containers; its placements
+    report the resolution they were found at.
+    
+    With a ``deadline`` in seconds the search is anytime: it returns the
+    best placement found by then, with its 'quality' ('optimal' if every
+    container was searched or ruled out, else 'best_effort') and the
+    fraction of containers 'explored'.
+    
+    With more than one of ``workers`` (default: the PLACEMENT_WORKERS
+    setting) the containers are searched in parallel on a process pool.
+    Results are scored in container order either way, so ties go to the
+    first container listed.
+    """
+    placement, explored = search_placement(
+        item, containers, mode=mode, octrees=octrees, resolution=resolution, time_budget=time_budget,
+        workers=workers, capacities=capacities, deadline=deadline
+    )
+    if placement is not None and deadline is not None:
+        placement['quality'] = placement_quality(explored)
+        placement['explored'] = explored
+    return placement
+
+def placement_quality(explored):
+    """Name the quality of a search that covered the ``explored`` fraction of the containers."""
+    return 'optimal' if explored >= 1 else 'best_effort'
+
+class BatchPlacementEngine:
+    """Places a batch of items against private copies of the container indexes.
+    
+    Each container's cached index and capacity summary are copied once per
+    batch. Every decided placement goes into the copies as an ItemSnapshot,
+    so later items in the batch see it, while the item records themselves
+    stay untouched. Nothing is written to the database until commit.
+    
+    With a ``deadline`` in seconds, counted from the engine's creation, the
+    whole batch is anytime: each search gets what is left of it, and
+    placements report their 'quality' and the fraction 'explored' as in
+    find_optimal_placement.
+    """
+    
+    def __init__(self, containers=None, mode=GRID_SEARCH, resolution=FINE_RESOLUTION, time_budget=None,
+                 workers=None, deadline=None):
+        self.end = time.perf_counter() + deadline if deadline is not None else None
+        self.containers = containers if containers is not None else Container.query.all()
+        self.mode = mode
+        self.resolution = resolution
+        self.time_budget = time_budget
+        self.workers = workers
+        # Tentative placements go into private copies, never into the shared cache
+        versions = get_container_versions([container.id for container in self.containers])
+        self.indexes = {
+            container_id: octree.copy() for container_id, octree in get_octrees(self.containers, versions).items()
+        }
+        self.capacities = {
+            container_id: summary.copy() for container_id, summary in get_capacities(self.containers, versions).items()
+        }
+        self.placements = []
+    
+    def place(self, item):
+        """Decide where one item goes and record it in the batch's indexes.
         
-        if best_placement:
-            placements.append({
-                'item_id': item.id,
-                'item_name': item.name,
-                'container_id': best_placement['container_id'],
-                'x': best_placement['x'],
-                'y': best_placement['y'],
-                'z': best_placement['z'],
-                'rotated': best_placement['rotated'],
-                'score': best_placement['score']
-            })
-            
-            # Update the octree for this container to reflect the new item placement
-            container = next(c for c in containers if c.id == best_placement['container_id'])
-            octree = container_octrees[container.id]
-            
-            # Temporarily set the item's position to use in the octree
-            item.container_id = container.id
-            item.x_pos = best_placement['x']
-            item.y_pos = best_placement['y']
-            item.z_pos = best_placement['z']
-            item.rotated = best_placement['rotated']
+        An item already in a container is taken out of its index first, so
+        its current spot is free for the search; it stays there if nothing
+        better is found. Returns the placement dict, or None.
+        """
+        return self._place(item)[0]
+    
+    def _place(self, item):
+        """Place one item; returns (placement or None, fraction of containers explored)."""
+        deadline = None
+        if self.end is not None:
+            deadline = self.end - time.perf_counter()
+            if deadline <= 0:
+                return None, 0.0
+        
+        current = None
+        for container_id, index in self.indexes.items():
+            if item.id in index.items:
+                current = index.items[item.id]
+                index.remove(item.id)
+                self.capacities[container_id].remove(item.id)
+        
+        best_placement, explored = search_placement(
+            item, self.containers, mode=self.mode, octrees=self.indexes,
+            resolution=self.resolution, time_budget=self.time_budget, workers=self.workers,
+            capacities=self.capacities, deadline=deadline
+        )
+        if not best_placement:
+            if current is not None:
+                self.indexes[current.container_id].insert(current)
+                self.capacities[current.container_id].add(current)
+            return None, explored
+        
+        placement = {
+            'item_id': item.id,
+            'item_name': item.name,
+            'container_id': best_placement['container_id'],
+            'x': best_placement['x'],
+            'y': best_placement['y'],
+            'z': best_placement['z'],
+            'rotated': best_placement['rotated'],
+            'score': best_placement['score']
+        }
+        if 'resolution' in best_placement:
+            placement['resolution'] = best_placement['resolution']
+        if self.end is not None:
+            placement['quality'] = placement_quality(explored)
+            placement['explored'] = explored
+        
+        snapshot = ItemSnapshot(
+            item.id, item.width, item.depth, item.height,
+            placement['x'], placement['y'], placement['z'], placement['rotated'], placement['container_id']
+        )
+        self.indexes[placement['container_id']].insert(snapshot)
+        self.capacities[placement['container_id']].add(snapshot)
+        self.placements.append(placement)
+        return placement, explored
+    
+    def place_all(self, items):
+        """Place items highest priority first; returns the placements found.
+        
+        Under a deadline every item gets an entry, with a container_id of
+        None if no placement was found in time or at all.
+        """
+        placements = []
+        for item in sorted(items, key=lambda x: x.priority, reverse=True):
+            placement, explored = self._place(item)
+            if placement:
+                placements.append(placement)
+            elif self.end is not None:
+                placements.append({
+                    'item_id': item.id,
+                    'item_name': item.name,
+                    'container_id': None,
+                    'quality': placement_quality(explored),
+                    'explored': explored
+                })
+        return placements
+    
+    def commit(self, astronaut_name=None):
+        """Write the batch's placements to the database in one transaction (see database.place_items).
+        
+        Returns (placed items, errors), errors mapping item ids to messages.
+        """
+        outcomes, error = place_items(self.placements, astronaut_name)
+        if error:
+            return [], {placement['item_id']: error for placement in self.placements}
+        self.placements = []
+        placed_ids = [outcome['item_id'] for outcome in outcomes if outcome['success']]
+        placed = Item.query.filter(Item.id.in_(placed_ids)).all() if placed_ids else []
+        return placed, {outcome['item_id']: outcome['error'] for outcome in outcomes if not outcome['success']}
+
+def find_optimal_placements_for_batch(items, mode=GRID_SEARCH, resolution=FINE_RESOLUTION, time_budget=None,
+                                      workers=None, deadline=None):
+    """Find optimal placements for a batch of items.
+    
+    ``resolution``, ``time_budget`` and ``workers`` apply to each item's
+    search, as in find_optimal_placement; ``deadline`` covers the whole
+    batch (see BatchPlacementEngine). Nothing is written; see
+    BatchPlacementEngine.commit to apply the placements.
+    """
+    engine = BatchPlacementEngine(mode=mode, resolution=resolution, time_budget=time_budget, workers=workers,
+                                  deadline=deadline)
+    return engine.place_all(items)
+
+# Sort keys of the bulk packing mode, largest first
+BULK_SORT_KEYS = {
+    'volume': lambda width, depth, height: width * depth * height,
+    'footprint': lambda width, depth, height: width * depth,
+}
+
+def _grow_block(grid, width, depth, height, remaining):
+    """Find the front-most spot for an item and grow a block of identical items from it.
+    
+    The block is one item deep (see OccupancyGrid.grow_block). Returns
+    (x, y, z, rotated, columns, count) or None.
+    """
+    spot = grid.find_front_space(width, depth, height)
+    if spot is None:
+        return None
+    x, y, z, rotated = spot
+    if rotated:
+        width, depth = depth, width
+    columns, layers = grid.grow_block((x, y, z), (width, depth, height), limit=remaining)
+    return x, y, z, rotated, columns, min(columns * layers, remaining)
+
+def pack_manifest(items, containers=None, sort_by='volume'):
+    """Plan placements for a large manifest with first-fit-decreasing block building.
+    
+    Items are grouped by dimensions and preferred zone, and the groups are
+    packed largest first by ``sort_by`` (see BULK_SORT_KEYS). Each group
+    fills blocks of identical items at the front-most free spot of a
+    container, trying containers in its preferred zone first. Higher
+    priority breaks ties between groups and gets the first slots within
+    one. Zones and priorities are preferences only: a group spills into
+    any container with room.
+    
+    Free space is tracked in one occupancy grid per container, and nothing
+    is written. Placement dicts are yielded as soon as they are decided;
+    items that fit nowhere follow at the end with a container_id of None.
+    """
+    if containers is None:
+        containers = Container.query.all()
+    size = BULK_SORT_KEYS[sort_by]
+    
+    groups = {}
+    for item in items:
+        groups.setdefault((item.width, item.depth, item.height, item.preferred_zone_id), []).append(item)
+    order = sorted(groups, key=lambda key: (-size(*key[:3]), -max(item.priority for item in groups[key])))
+    
+    grids = {}
+    full = set()  # (container id, dimensions) that no longer fit anywhere in the container
+    unplaced = []
+    for key in order:
+        width, depth, height, zone_id = key
+        queue = sorted(groups[key], key=lambda x: x.priority, reverse=True)
+        placed = 0
+        ranked = [c for c in containers if c.zone_id == zone_id] + [c for c in containers if c.zone_id != zone_id]
+        for container in ranked:
+            if placed == len(queue):
+                break
+            if (container.id, key[:3]) in full:
+                continue
+            if container.id not in grids:
+                grids[container.id] = OccupancyGrid.from_items(container, get_octree(container).items.values())
+            grid = grids[container.id]
             
-            # Update the octree
-            octree.insert(item)
+            while placed < len(queue):
+                block = _grow_block(grid, width, depth, height, len(queue) - placed)
+                if block is None:
+                    full.add((container.id, key[:3]))
+                    break
+                x, y, z, rotated, columns, count = block
+                item_width, item_depth = (depth, width) if rotated else (width, depth)
+                for slot in range(count):
+                    item = queue[placed + slot]
+                    yield {
+                        'item_id': item.id,
+                        'item_name': item.name,
+                        'container_id': container.id,
+                        'x': x + (slot % columns) * item_width,
+                        'y': y,
+                        'z': z + (slot // columns) * height,
+                        'rotated': rotated
+                    }
+                placed += count
+                
+                # Mark the full layers and the partial last row as taken
+                layers, rest = divmod(count, columns)
+                grid.add_box((x, y, z), (x + columns * item_width, y + item_depth, z + layers * height))
+                grid.add_box(
+                    (x, y, z + layers * height),
+                    (x + rest * item_width, y + item_depth, z + (layers + 1) * height)
+                )
+        unplaced.extend(queue[placed:])
     
-    return placements
+    for item in unplaced:
+        yield {'item_id': item.id, 'item_name': item.name, 'container_id': None}
 
 def find_item_to_retrieve(item_name):
     """Find the best item to retrieve based on name, expiry, and accessibility."""
@@ -109,17 +426,16 @@ def find_item_to_retrieve(item_name):
     best_score = float('-inf')
     retrieval_info = None
     
+    # Look up the mirrored blockers of all candidates at once
+    blockers = get_blocker_ids([item.id for item in items if item.x_pos is not None])
+    
     for item in items:
-        # Get container
-        container = Container.query.get(item.container_id)
-        if not container:
+        if item.id not in blockers:
             continue
         
-        # Create octree for container
-        octree = Octree(container)
-        
         # Calculate retrieval steps
-        steps, blocking_items = octree.calculate_retrieval_steps(item)
+        blocking_ids = blockers[item.id]
+        steps = len(blocking_ids)
         
         # Calculate expiry score (items closer to expiry get higher scores)
         expiry_score = 0
@@ -152,14 +468,40 @@ def find_item_to_retrieve(item_name):
             best_item = item
             retrieval_info = {
                 'steps': steps,
-                'blocking_items': [item.to_dict() for item in blocking_items]
+                'blocking_items': blocking_ids
             }
     
     if best_item:
+        # The mirror holds ids; load full records only for the chosen item's blockers
+        blocking_ids = retrieval_info['blocking_items']
+        blocking_records = {i.id: i for i in Item.query.filter(Item.id.in_(blocking_ids)).all()} if blocking_ids else {}
+        retrieval_info['blocking_items'] = [blocking_records[i].to_dict() for i in blocking_ids if i in blocking_records]
         return best_item, retrieval_info
     else:
         return None, "No suitable item found for retrieval"
 
+def plan_multi_retrieval(item_ids, time_budget=PLAN_TIME_BUDGET):
+    """Plan the retrieval of several items from one container as a single move sequence."""
+    items = Item.query.filter(Item.id.in_(item_ids)).all() if item_ids else []
+    missing = sorted(set(item_ids) - {item.id for item in items})
+    if missing:
+        return None, f"Items not found: {', '.join(missing)}"
+    
+    container_ids = {item.container_id for item in items}
+    if None in container_ids or any(item.x_pos is None for item in items):
+        return None, "All items must be placed in a container"
+    if len(container_ids) != 1:
+        return None, "All items must be in the same container"
+    
+    container = Container.query.get(container_ids.pop())
+    if not container:
+        return None, "Container not found"
+    
+    # Plan over the container's cached blocking graph
+    plan = get_blocking_graph(container).plan_retrieval(item_ids, time_budget=time_budget)
+    plan['container_id'] = container.id
+    return plan, None
+
 def suggest_rearrangement(container_id, new_items):
     """Suggest rearrangement of items to accommodate new items."""
     container = Container.query.get(container_id)
@@ -169,9 +511,6 @@ def suggest_rearrangement(container_id, new_items):
     # Get current items in the container
     current_items = Item.query.filter_by(container_id=container_id, is_waste=False).all()
     
-    # Create an octree for the container's current state
-    octree = Octree(container)
-    
     # Calculate total volume of current items and new items
     current_volume = sum(item.width * item.depth * item.height for item in current_items)
     new_volume = sum(item.width * item.depth * item.height for item in new_items)
@@ -1,10 +1,15 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from models import Item, Container, Zone, UsageLog
-from app import db, logger
-from database import add_item, place_item, retrieve_item, get_retrieval_steps, advance_time, get_waste_items, mark_item_as_waste
-from algorithms import find_optimal_placement, find_optimal_placements_for_batch, find_item_to_retrieve, suggest_rearrangement, optimize_waste_return
+from app import app, db, logger
+from database import add_item, add_items, place_item, place_items, retrieve_item, retrieve_items, get_retrieval_steps, advance_time, get_waste_items, mark_item_as_waste
+from algorithms import BULK_SORT_KEYS, search_placement, placement_quality, find_optimal_placements_for_batch, pack_manifest, find_item_to_retrieve, plan_multi_retrieval, suggest_rearrangement, optimize_waste_return
+from octree import GRID_SEARCH, PLACEMENT_MODES
+from occupancy import FINE_RESOLUTION
+from manifest_import import import_manifest, manifest_format
+from spatial_cache import cache_stats, container_version, get_blocking_graph
 from waste_management import check_for_waste_items, prepare_waste_for_return, move_waste_to_container, process_undock_event
 from time_simulation import simulate_next_day, advance_time, forecast_expirations, forecast_usage_depletion
+import io
 import json
 from datetime import datetime
 
@@ -26,6 +31,34 @@ def api_response(data=None, error=None, status=200):
         
     return jsonify(response), status
 
+def parse_search_options(data):
+    """Read the search options of a request.
+    
+    'resolution' is in cm, no finer than FINE_RESOLUTION, and 'time_budget'
+    in seconds. 'goal' picks 'optimality' (search everything) or 'latency'
+    (answer within 'deadline' seconds, by default the PLACEMENT_DEADLINE
+    setting); a deadline alone implies the latency goal.
+    """
+    options = {}
+    for key in ('resolution', 'time_budget', 'deadline'):
+        value = data.get(key)
+        if value is None:
+            continue
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0 or (key == 'resolution' and value == 0):
+            return None, f"'{key}' must be a positive number"
+        if key == 'resolution' and value < FINE_RESOLUTION:
+            return None, f"'resolution' must be at least {FINE_RESOLUTION} cm"
+        options[key] = value
+    
+    goal = data.get('goal', 'latency' if 'deadline' in options else 'optimality')
+    if goal not in ('optimality', 'latency'):
+        return None, f"Unknown goal '{goal}'"
+    if goal == 'optimality' and 'deadline' in options:
+        return None, "'deadline' only applies to the 'latency' goal"
+    if goal == 'latency':
+        options.setdefault('deadline', app.config.get('PLACEMENT_DEADLINE'))
+    return options, None
+
 # Items API
 @api_bp.route('/items', methods=['GET'])
 def get_items():
@@ -83,20 +116,49 @@ def create_items_batch():
         if not isinstance(data, list):
             return api_response(error="Expected a list of items", status=400)
             
-        results = []
-        for item_data in data:
-            item, error = add_item(item_data)
-            results.append({
-                'id': item_data.get('id'),
-                'success': error is None,
-                'error': error
-            })
+        results, error = add_items(data)
+        if error:
+            return api_response(error=error, status=500)
             
         return api_response(results, status=201)
     except Exception as e:
         logger.error(f"Error creating items batch: {str(e)}")
         return api_response(error=str(e), status=500)
 
+@api_bp.route('/items/import', methods=['POST'])
+def import_items_manifest():
+    """Import a CSV or NDJSON manifest from the request body, streaming progress as NDJSON.
+    
+    Query parameters: 'format' (default: from the content type),
+    'import_id' to resume an interrupted import, 'chunk_size' and
+    'place' ('true' to place each chunk's items).
+    """
+    try:
+        fmt = request.args.get('format') or manifest_format(content_type=request.content_type)
+        if fmt not in ('csv', 'ndjson'):
+            return api_response(error="Manifest format must be 'csv' or 'ndjson'", status=400)
+        
+        chunk_size = request.args.get('chunk_size', type=int)
+        if chunk_size is not None and chunk_size <= 0:
+            return api_response(error="'chunk_size' must be a positive integer", status=400)
+        place = request.args.get('place', 'false').lower() == 'true'
+        import_id = request.args.get('import_id')
+        
+        def generate():
+            # The 200 header is already sent, so failures end the stream with an error line
+            try:
+                stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+                for update in import_manifest(stream, fmt, import_id, chunk_size, place):
+                    yield json.dumps(update) + '\n'
+            except Exception as e:
+                logger.error(f"Error streaming manifest import: {str(e)}")
+                yield json.dumps({'import_id': import_id, 'error': str(e)}) + '\n'
+        
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    except Exception as e:
+        logger.error(f"Error importing manifest: {str(e)}")
+        return api_response(error=str(e), status=500)
+
 # Containers API
 @api_bp.route('/containers', methods=['GET'])
 def get_containers():
@@ -139,6 +201,24 @@ def get_container_contents(container_id):
         logger.error(f"Error getting container contents: {str(e)}")
         return api_response(error=str(e), status=500)
 
+@api_bp.route('/containers/<string:container_id>/blocking-graph', methods=['GET'])
+def get_container_blocking_graph(container_id):
+    """Get which items block which others in a container, with their removal orders."""
+    try:
+        container = Container.query.get(container_id)
+        if not container:
+            return api_response(error=f"Container with ID {container_id} not found", status=404)
+            
+        graph = get_blocking_graph(container)
+        return api_response({
+            'container_id': container_id,
+            'version': container_version(container_id),
+            'items': graph.to_dict()
+        })
+    except Exception as e:
+        logger.error(f"Error getting blocking graph of container {container_id}: {str(e)}")
+        return api_response(error=str(e), status=500)
+
 # Zones API
 @api_bp.route('/zones', methods=['GET'])
 def get_zones():
@@ -150,6 +230,15 @@ def get_zones():
         logger.error(f"Error getting zones: {str(e)}")
         return api_response(error=str(e), status=500)
 
+@api_bp.route('/spatial-index/stats', methods=['GET'])
+def get_spatial_index_stats():
+    """Get hit, rebuild and memory statistics of the spatial index cache."""
+    try:
+        return api_response(cache_stats())
+    except Exception as e:
+        logger.error(f"Error getting spatial index stats: {str(e)}")
+        return api_response(error=str(e), status=500)
+
 # Placement API
 @api_bp.route('/placement/suggest', methods=['POST'])
 def suggest_placement():
@@ -157,15 +246,28 @@ def suggest_placement():
     try:
         data = request.json
         item_id = data.get('item_id')
+        mode = data.get('mode', GRID_SEARCH)
+        
+        if mode not in PLACEMENT_MODES:
+            return api_response(error=f"Unknown placement mode '{mode}'", status=400)
+        
+        options, error = parse_search_options(data)
+        if error:
+            return api_response(error=error, status=400)
         
         item = Item.query.get(item_id)
         if not item:
             return api_response(error=f"Item with ID {item_id} not found", status=404)
             
-        placement = find_optimal_placement(item)
+        placement, explored = search_placement(item, mode=mode, **options)
         if not placement:
+            if explored < 1:
+                return api_response(error="No suitable placement found within the deadline", status=404)
             return api_response(error="No suitable placement found", status=404)
-            
+        
+        if 'deadline' in options:
+            placement['quality'] = placement_quality(explored)
+            placement['explored'] = explored
         return api_response(placement)
     except Exception as e:
         logger.error(f"Error suggesting placement: {str(e)}")
@@ -177,20 +279,58 @@ def suggest_batch_placement():
     try:
         data = request.json
         item_ids = data.get('item_ids', [])
+        mode = data.get('mode', GRID_SEARCH)
         
         if not item_ids:
             return api_response(error="No item IDs provided", status=400)
+        
+        if mode not in PLACEMENT_MODES:
+            return api_response(error=f"Unknown placement mode '{mode}'", status=400)
+        
+        options, error = parse_search_options(data)
+        if error:
+            return api_response(error=error, status=400)
             
         items = Item.query.filter(Item.id.in_(item_ids)).all()
         if not items:
             return api_response(error="No valid items found", status=404)
             
-        placements = find_optimal_placements_for_batch(items)
+        placements = find_optimal_placements_for_batch(items, mode=mode, **options)
         return api_response(placements)
     except Exception as e:
         logger.error(f"Error suggesting batch placement: {str(e)}")
         return api_response(error=str(e), status=500)
 
+@api_bp.route('/placement/manifest', methods=['POST'])
+def plan_manifest_placement():
+    """Plan placements for a large manifest, streamed as one JSON object per line.
+    
+    Takes 'item_ids' (default: every unplaced item that is not waste) and
+    'sort_by' ('volume' or 'footprint'). Nothing is written.
+    """
+    try:
+        data = request.json or {}
+        item_ids = data.get('item_ids')
+        sort_by = data.get('sort_by', 'volume')
+        
+        if sort_by not in BULK_SORT_KEYS:
+            return api_response(error=f"Unknown sort key '{sort_by}'", status=400)
+        
+        query = Item.query.filter(Item.id.in_(item_ids)) if item_ids else \
+            Item.query.filter(Item.container_id.is_(None), Item.is_waste == False)
+        items = query.all()
+        if not items:
+            return api_response(error="No valid items found", status=404)
+        
+        def generate():
+            for placement in pack_manifest(items, sort_by=sort_by):
+                yield json.dumps(placement) + '\n'
+        
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    except Exception as e:
+        logger.error(f"Error planning manifest placement: {str(e)}")
+        return api_response(error=str(e), status=500)
+
 @api_bp.route('/placement/execute', methods=['POST'])
 def execute_placement():
     """Execute a placement of an item in a container."""
@@ -218,6 +358,38 @@ def execute_placement():
         logger.error(f"Error executing placement: {str(e)}")
         return api_response(error=str(e), status=500)
 
+@api_bp.route('/placement/execute/batch', methods=['POST'])
+def execute_batch_placement():
+    """Apply a whole placement plan, e.g. from /placement/batch, in one transaction.
+    
+    Takes 'placements' (dicts with item_id, container_id, x, y, z and
+    rotated), 'astronaut_name' and 'all_or_nothing'. Returns one outcome
+    per placement.
+    """
+    try:
+        data = request.json or {}
+        placements = data.get('placements')
+        all_or_nothing = bool(data.get('all_or_nothing', False))
+        
+        if not isinstance(placements, list) or not placements:
+            return api_response(error="Expected a list of placements", status=400)
+        if not all(isinstance(placement, dict) for placement in placements):
+            return api_response(error="Each placement must be an object", status=400)
+        if not all(isinstance(placement.get(key), (str, type(None)))
+                   for placement in placements for key in ('item_id', 'container_id')):
+            return api_response(error="'item_id' and 'container_id' must be strings", status=400)
+        
+        outcomes, error = place_items(placements, data.get('astronaut_name'), all_or_nothing=all_or_nothing)
+        if error:
+            return api_response(error=error, status=500)
+        if all_or_nothing and not all(outcome['success'] for outcome in outcomes):
+            return api_response(outcomes, error="Plan rejected: some placements are invalid", status=409)
+        
+        return api_response(outcomes)
+    except Exception as e:
+        logger.error(f"Error executing batch placement: {str(e)}")
+        return api_response(error=str(e), status=500)
+
 # Retrieval API
 @api_bp.route('/retrieval/suggest', methods=['POST'])
 def suggest_retrieval():
@@ -244,6 +416,31 @@ def suggest_retrieval():
         logger.error(f"Error suggesting retrieval: {str(e)}")
         return api_response(error=str(e), status=500)
 
+@api_bp.route('/retrieval/plan', methods=['POST'])
+def plan_retrieval():
+    """Plan the moves that take several items out of one container."""
+    try:
+        data = request.json or {}
+        item_ids = data.get('item_ids', [])
+        
+        if not item_ids:
+            return api_response(error="No item IDs provided", status=400)
+        if not isinstance(item_ids, list) or not all(isinstance(item_id, str) for item_id in item_ids):
+            return api_response(error="'item_ids' must be a list of item IDs", status=400)
+        
+        options, error = parse_search_options({'time_budget': data.get('time_budget')})
+        if error:
+            return api_response(error=error, status=400)
+            
+        plan, error = plan_multi_retrieval(item_ids, **options)
+        if error:
+            return api_response(error=error, status=400)
+            
+        return api_response(plan)
+    except Exception as e:
+        logger.error(f"Error planning retrieval: {str(e)}")
+        return api_response(error=str(e), status=500)
+
 @api_bp.route('/retrieval/steps', methods=['GET'])
 def get_item_retrieval_steps():
     """Get steps needed to retrieve a specific item."""
@@ -289,6 +486,35 @@ def execute_retrieval():
         logger.error(f"Error executing retrieval: {str(e)}")
         return api_response(error=str(e), status=500)
 
+@api_bp.route('/retrieval/execute/batch', methods=['POST'])
+def execute_batch_retrieval():
+    """Retrieve several items in one transaction, moving each blocker only once.
+    
+    Takes 'item_ids', 'astronaut_name', 'use_items' and the planner's
+    'time_budget'. Returns the executed sequence of steps.
+    """
+    try:
+        data = request.json or {}
+        item_ids = data.get('item_ids', [])
+        
+        if not item_ids:
+            return api_response(error="No item IDs provided", status=400)
+        if not isinstance(item_ids, list) or not all(isinstance(item_id, str) for item_id in item_ids):
+            return api_response(error="'item_ids' must be a list of item IDs", status=400)
+        
+        options, error = parse_search_options({'time_budget': data.get('time_budget')})
+        if error:
+            return api_response(error=error, status=400)
+        
+        result, error = retrieve_items(item_ids, data.get('astronaut_name'), bool(data.get('use_items', False)), **options)
+        if error:
+            return api_response(error=error, status=500)
+        
+        return api_response(result)
+    except Exception as e:
+        logger.error(f"Error executing batch retrieval: {str(e)}")
+        return api_response(error=str(e), status=500)
+
 # Rearrangement API
 @api_bp.route('/rearrangement/suggest', methods=['POST'])
 def suggest_container_rearrangement():
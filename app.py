@@ -27,6 +27,18 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
 }
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
+# Spatial index backend per container: "auto", "octree", "array_octree", "grid" or "rtree"
+app.config["SPATIAL_INDEX_BACKEND"] = os.environ.get("SPATIAL_INDEX_BACKEND", "auto")
+
+# Processes that search containers in parallel when suggesting placements; 1 searches in-process
+app.config["PLACEMENT_WORKERS"] = int(os.environ.get("PLACEMENT_WORKERS", "1"))
+
+# Seconds a placement request with the "latency" goal may search; keep below the worker timeout
+app.config["PLACEMENT_DEADLINE"] = float(os.environ.get("PLACEMENT_DEADLINE", "10"))
+
+# Manifest rows written per transaction by streamed imports
+app.config["MANIFEST_CHUNK_SIZE"] = int(os.environ.get("MANIFEST_CHUNK_SIZE", "1000"))
+
 # Initialize db with app
 db.init_app(app)
 
@@ -0,0 +1,74 @@
+import numpy as np
+from packed_index import PackedIndex
+
+
+class ArrayOctree(PackedIndex):
+    """Compact octree whose nodes and item boxes live in contiguous arrays.
+
+    Every split node has eight contiguous children, and each item is stored
+    once, in the deepest node that fully contains it. See PackedIndex for
+    the array layout and how updates are buffered.
+    """
+
+    def __init__(self, container, items=None, max_depth=8, max_items=4):
+        self.max_depth = max_depth
+        self.max_items = max_items
+        super().__init__(container, items)
+
+    def options(self):
+        return {'max_depth': self.max_depth, 'max_items': self.max_items}
+
+    def _build_nodes(self, mins, maxs):
+        """Build the octree top-down, one level per pass over the rows."""
+        size = max(self.container.width, self.container.depth, self.container.height)
+        center = np.array([self.container.width, self.container.depth, self.container.height]) / 2
+        node_min = [center - size / 2]
+        node_size = [size]
+        node_depth = [0]
+        node_child = [-1]
+
+        # Every row starts at the root and sinks one level per pass while it
+        # fits entirely inside one octant of a node that has to split.
+        item_node = np.zeros(len(mins), dtype=np.int64)
+        active = np.arange(len(mins))
+        level_nodes = [0]
+        while len(active) and level_nodes:
+            counts = np.bincount(item_node[active], minlength=len(node_min))
+            splitting = [
+                n for n in level_nodes
+                if counts[n] > self.max_items and node_depth[n] < self.max_depth
+            ]
+            if not splitting:
+                break
+
+            for n in splitting:
+                node_child[n] = len(node_min)
+                half = node_size[n] / 2
+                for octant in range(8):
+                    offset = np.array([(octant >> 2) & 1, (octant >> 1) & 1, octant & 1]) * half
+                    node_min.append(node_min[n] + offset)
+                    node_size.append(half)
+                    node_depth.append(node_depth[n] + 1)
+                    node_child.append(-1)
+
+            split = np.zeros(len(node_min), dtype=bool)
+            split[splitting] = True
+            moving = active[split[item_node[active]]]
+            parents = item_node[moving]
+            mids = np.array(node_min)[parents] + (np.array(node_size)[parents] / 2)[:, None]
+
+            above = mins[moving] >= mids
+            below = maxs[moving] <= mids
+            descends = (above | below).all(axis=1)
+            octants = (above[:, 0] * 4 + above[:, 1] * 2 + above[:, 2]).astype(np.int64)
+
+            moving = moving[descends]
+            item_node[moving] = np.array(node_child)[parents[descends]] + octants[descends]
+            active = moving
+            level_nodes = [node_child[n] + octant for n in splitting for octant in range(8)]
+
+        node_min = np.array(node_min, dtype=float).reshape(-1, 3)
+        node_max = node_min + np.array(node_size, dtype=float)[:, None]
+        child_start = np.array(node_child)
+        child_count = np.where(child_start >= 0, 8, 0)
+        return node_min, node_max, np.maximum(child_start, 0), child_count, item_node
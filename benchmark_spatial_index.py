@@ -0,0 +1,88 @@
+"""Compare the spatial index backends on synthetic containers.
+
+Usage: python benchmark_spatial_index.py [--seed N]
+
+Each scenario fills a container with non-overlapping items and times the
+operations the placement and retrieval code issues: a cold build, single
+box queries, one batched query for every item's retrieval path, and a run
+of remove/insert pairs. Memory is the backend's own estimate.
+"""
+import argparse
+import random
+import time
+from occupancy import OccupancyGrid
+from snapshots import ContainerSnapshot, ItemSnapshot
+from spatial_backends import SPATIAL_BACKENDS, choose_backend
+
+SCENARIOS = [
+    # name, container (w, d, h), item count, item edge lengths
+    ('sparse', (200, 200, 200), 10, (20, 30, 40, 50)),
+    ('uniform-small', (200, 150, 250), 400, (10, 15)),
+    ('dense-small', (200, 150, 250), 2500, (5, 10)),
+    ('mixed-sizes', (300, 200, 250), 400, (5, 10, 20, 40, 80, 120)),
+    ('dense-mixed', (300, 200, 250), 3000, (2, 5, 10, 20, 60)),
+]
+
+
+def fill_container(container, count, sizes, rng):
+    """Place up to ``count`` random items front-first without overlaps."""
+    grid = OccupancyGrid.from_items(container, [])
+    items = []
+    for index in range(count):
+        width, depth, height = (rng.choice(sizes) for _ in range(3))
+        position = grid.find_empty_space(width, depth, height)
+        if position is None:
+            continue
+        x, y, z, rotated = position
+        item = ItemSnapshot(f"item{index}", width, depth, height, x, y, z, rotated, container.id)
+        grid.add_item(item)
+        items.append(item)
+    return items
+
+
+def time_call(function, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def run_scenario(name, dimensions, count, sizes, rng):
+    container = ContainerSnapshot(name, *dimensions)
+    items = fill_container(container, count, sizes, rng)
+    queries = []
+    for _ in range(500):
+        box_min = [rng.uniform(0, limit) for limit in dimensions]
+        box_max = [lo + rng.uniform(1, 40) for lo in box_min]
+        queries.append((box_min, box_max))
+    movers = rng.sample(items, min(50, len(items)))
+
+    chosen, _ = choose_backend(container, items)
+    print(f"\n{name}: {len(items)} items, auto picks '{chosen}'")
+    print(f"{'backend':<14}{'build ms':>10}{'500 queries ms':>16}{'batched paths ms':>18}{'updates ms':>12}{'memory KB':>11}")
+    for backend, index_class in SPATIAL_BACKENDS.items():
+        build, index = time_call(lambda: index_class(container, items=items))
+        single, _ = time_call(lambda: [index.query_box(*query) for query in queries])
+        paths, _ = time_call(lambda: index.get_items_blocking_paths(items))
+
+        def updates():
+            for item in movers:
+                index.remove(item.id)
+            for item in movers:
+                index.insert(item)
+        update, _ = time_call(updates)
+        print(f"{backend:<14}{build:>10.1f}{single:>16.1f}{paths:>18.1f}{update:>12.1f}{index.memory_usage() / 1024:>11.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    for scenario in SCENARIOS:
+        run_scenario(*scenario, rng)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+import math
+import numpy as np
+from occupancy import DEFAULT_RESOLUTION, item_bounds
+
+# Depth of the y-slabs whose free area a summary tracks
+SLAB_DEPTH = DEFAULT_RESOLUTION
+
+
+class CapacitySummary:
+    """Upper bounds on the free space of one container, kept up to date per item.
+
+    Tracks the free volume, the free x/z area of every y-slab and the item
+    dimensions a complete search already failed to fit. An item counts
+    against a slab only if it spans the whole slab, so every figure
+    over-estimates the free space and a container the summary rules out
+    really has no room. Updating it costs O(slabs) per item and needs no
+    spatial index, so hopeless containers are skipped before one is built.
+    """
+
+    def __init__(self, container, items=(), slab_depth=SLAB_DEPTH):
+        self.container_id = container.id
+        self.volume = container.width * container.depth * container.height
+        self.slab_depth = slab_depth
+        self.slab_area = container.width * container.height
+        self.depth = container.depth
+        self.used_volume = 0
+        self.slab_used = np.zeros(max(1, math.ceil(container.depth / slab_depth)))
+        self._items = {}  # id -> (volume, first slab, slab stop, footprint area)
+        self._misfits = set()  # (mode, width, depth, height, consider_rotation) that found no space
+        for item in items:
+            self.add(item)
+
+    @property
+    def free_volume(self):
+        return self.volume - self.used_volume
+
+    def copy(self):
+        """Copy the summary, e.g. for tentative placements."""
+        clone = CapacitySummary.__new__(CapacitySummary)
+        clone.__dict__.update(self.__dict__)
+        clone.slab_used = self.slab_used.copy()
+        clone._items = dict(self._items)
+        clone._misfits = set(self._misfits)
+        return clone
+
+    def add(self, item):
+        """Count a placed item against the container's free space."""
+        if item.x_pos is None or item.y_pos is None or item.z_pos is None:
+            return
+        if item.id in self._items:
+            self.remove(item.id)
+        (min_x, min_y, min_z), (max_x, max_y, max_z) = item_bounds(item)
+        entry = (
+            (max_x - min_x) * (max_y - min_y) * (max_z - min_z),
+            math.ceil(min_y / self.slab_depth),
+            math.floor(max_y / self.slab_depth),
+            (max_x - min_x) * (max_z - min_z)
+        )
+        self._items[item.id] = entry
+        self.used_volume += entry[0]
+        self.slab_used[entry[1]:entry[2]] += entry[3]
+
+    def remove(self, item_id):
+        """Give an item's space back; what did not fit before may fit now."""
+        entry = self._items.pop(item_id, None)
+        if entry is None:
+            return
+        self.used_volume -= entry[0]
+        self.slab_used[entry[1]:entry[2]] -= entry[3]
+        self._misfits.clear()
+
+    def record_misfit(self, mode, width, depth, height, consider_rotation=True):
+        """Remember that a complete search in ``mode`` found no space for these dimensions."""
+        self._misfits.add((mode, width, depth, height, consider_rotation))
+
+    def min_front(self, width, depth, height, consider_rotation=True, mode=None):
+        """Get the smallest y an item could be placed at, or None if it cannot fit.
+
+        Any placement spans at least floor(depth / slab depth) - 1 whole
+        slabs, and each of them needs the item's footprint free. A larger
+        item than one recorded as a misfit in ``mode`` cannot fit either.
+        """
+        if width * depth * height > self.free_volume + 1e-9:
+            return None
+        for misfit_mode, misfit_width, misfit_depth, misfit_height, misfit_rotation in self._misfits:
+            if (misfit_mode == mode and misfit_rotation == consider_rotation and
+                    width >= misfit_width and depth >= misfit_depth and height >= misfit_height):
+                return None
+
+        free = self.slab_area - self.slab_used
+        orientations = [(width, depth)]
+        if consider_rotation and width != depth:
+            orientations.append((depth, width))
+        best = None
+        for footprint_width, footprint_depth in orientations:
+            if footprint_depth > self.depth:
+                continue
+            spanned = max(int(footprint_depth // self.slab_depth) - 1, 0)
+            if spanned == 0:
+                return 0
+            # Slabs starting a run of ``spanned`` slabs with room for the footprint
+            fits = np.concatenate(([0], np.cumsum(free >= footprint_width * height - 1e-9)))
+            starts = np.flatnonzero(fits[spanned:] - fits[:-spanned] == spanned)
+            if len(starts):
+                front = max(0, (int(starts[0]) - 1) * self.slab_depth)
+                best = front if best is None else min(best, front)
+        return best
+
+    def to_dict(self):
+        """Describe the summary for the API."""
+        return {
+            'container_id': self.container_id,
+            'free_volume': self.free_volume,
+            'used_fraction': self.used_volume / self.volume if self.volume else 1.0,
+            'slab_depth': self.slab_depth,
+            'slab_free_area': (self.slab_area - self.slab_used).tolist()
+        }
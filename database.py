@@ -1,5 +1,10 @@
 from app import db, logger
-from models import Zone, Container, Item, UsageLog
+from models import Zone, Container, Item, UsageLog, ItemBox, ItemBlocker
+from snapshots import ItemSnapshot
+from occupancy import item_bounds
+from retrieval import PLAN_TIME_BUDGET, BlockingGraph
+from spatial_cache import build_index, notify_items_committed
+from spatial_db import find_overlapping_item_ids, get_blocker_ids, rebuild_item_boxes
 from datetime import datetime, date, timedelta
 
 def initialize_db():
@@ -34,46 +39,84 @@ def initialize_db():
         ]
         db.session.add_all(containers)
         db.session.commit()
+    
+    # Mirror the boxes and blockers of items placed before the spatial tables existed
+    placed = Item.query.filter(Item.container_id.isnot(None))
+    if (ItemBox.query.count() == 0 and placed.count() > 0) or \
+       (ItemBlocker.query.count() == 0 and placed.filter(Item.y_pos > 0).count() > 0):
+        rebuild_item_boxes()
+
+# Item fields every new item needs, with the types they are stored as
+REQUIRED_ITEM_FIELDS = (
+    ('id', str), ('name', str), ('width', float), ('depth', float),
+    ('height', float), ('mass', float), ('priority', int)
+)
+
+# Rows per IN query, below SQLite's default limit on bound parameters
+IN_QUERY_CHUNK = 500
+
+def parse_item_fields(item_data):
+    """Validate an item payload and convert it to column values.
+    
+    Numbers may come as strings, e.g. from a CSV manifest. A zone given
+    only by 'preferred_zone_name' is left for the caller to resolve.
+    Returns (fields, error).
+    """
+    fields = {}
+    for key, kind in REQUIRED_ITEM_FIELDS:
+        value = item_data.get(key)
+        if value is None or value == '':
+            return None, f"Missing required field '{key}'"
+        try:
+            fields[key] = kind(value)
+        except (TypeError, ValueError):
+            return None, f"Invalid value for '{key}': {value!r}"
+    
+    for key in ('usage_limit', 'preferred_zone_id'):
+        value = item_data.get(key)
+        try:
+            fields[key] = int(value) if value not in (None, '') else None
+        except (TypeError, ValueError):
+            return None, f"Invalid value for '{key}': {value!r}"
+    zone_name = item_data.get('preferred_zone_name')
+    if zone_name not in (None, '') and not isinstance(zone_name, str):
+        return None, f"Invalid value for 'preferred_zone_name': {zone_name!r}"
+    fields['uses_remaining'] = fields['usage_limit']  # Initialize uses_remaining to usage_limit
+    fields['is_waste'] = False
+    
+    # Parse expiry date if provided
+    fields['expiry_date'] = None
+    expiry = item_data.get('expiry_date')
+    if isinstance(expiry, date):
+        fields['expiry_date'] = expiry
+    elif expiry:
+        try:
+            fields['expiry_date'] = datetime.fromisoformat(expiry).date()
+        except (TypeError, ValueError):
+            logger.warning(f"Invalid expiry date format: {expiry}")
+    return fields, None
 
 def add_item(item_data):
     """Add a new item to the database."""
     try:
+        fields, error = parse_item_fields(item_data)
+        if error:
+            return None, error
+        
         # Check if the item already exists
-        existing_item = Item.query.get(item_data['id'])
+        existing_item = Item.query.get(fields['id'])
         if existing_item:
-            logger.warning(f"Item with ID {item_data['id']} already exists")
-            return None, f"Item with ID {item_data['id']} already exists"
+            logger.warning(f"Item with ID {fields['id']} already exists")
+            return None, f"Item with ID {fields['id']} already exists"
         
         # Lookup preferred zone ID if zone name provided
-        if 'preferred_zone_name' in item_data and not 'preferred_zone_id' in item_data:
+        if fields['preferred_zone_id'] is None and item_data.get('preferred_zone_name'):
             zone = Zone.query.filter_by(name=item_data['preferred_zone_name']).first()
             if zone:
-                item_data['preferred_zone_id'] = zone.id
-            
-        # Create new item
-        item = Item(
-            id=item_data['id'],
-            name=item_data['name'],
-            width=item_data['width'],
-            depth=item_data['depth'],
-            height=item_data['height'],
-            mass=item_data['mass'],
-            priority=item_data['priority'],
-            usage_limit=item_data.get('usage_limit'),
-            uses_remaining=item_data.get('usage_limit'),  # Initialize uses_remaining to usage_limit
-            preferred_zone_id=item_data.get('preferred_zone_id'),
-            is_waste=False
-        )
-        
-        # Parse expiry date if provided
-        if 'expiry_date' in item_data and item_data['expiry_date']:
-            try:
-                item.expiry_date = datetime.fromisoformat(item_data['expiry_date']).date()
-            except ValueError:
-                logger.warning(f"Invalid expiry date format: {item_data['expiry_date']}")
-                # Set a default expiry date far in the future
-                item.expiry_date = None
+                fields['preferred_zone_id'] = zone.id
         
+        # Create new item
+        item = Item(**fields)
         db.session.add(item)
         db.session.commit()
         
@@ -93,6 +136,79 @@ def add_item(item_data):
         logger.error(f"Error adding item: {str(e)}")
         return None, str(e)
 
+def add_items(items_data, commit=True):
+    """Add many items with set-based queries.
+    
+    The whole payload is validated first. Zone names are resolved with one
+    query, and existing ids are found with IN queries. The valid items and
+    their 'added' logs then go in as two bulk inserts in one transaction.
+    A bad row gets an error and the other rows are still added. With
+    ``commit`` False the caller commits, e.g. together with its own rows.
+    
+    Returns (results, error): one {'id', 'success', 'error'} per row, in
+    payload order, or None and the error if the transaction failed.
+    """
+    try:
+        results = []
+        rows = {}  # id -> (fields, result) of the rows that passed validation
+        zone_names = {}  # id -> preferred zone name to resolve
+        for item_data in items_data:
+            if not isinstance(item_data, dict):
+                results.append({'id': None, 'success': False, 'error': "Expected an item object"})
+                continue
+            fields, error = parse_item_fields(item_data)
+            result = {'id': item_data.get('id'), 'success': error is None, 'error': error}
+            results.append(result)
+            if error:
+                continue
+            if fields['id'] in rows:
+                result.update(success=False, error=f"Item with ID {fields['id']} already exists")
+                continue
+            rows[fields['id']] = (fields, result)
+            if fields['preferred_zone_id'] is None and item_data.get('preferred_zone_name'):
+                zone_names[fields['id']] = item_data['preferred_zone_name']
+        
+        if zone_names:
+            zone_ids = dict(db.session.query(Zone.name, Zone.id).filter(Zone.name.in_(set(zone_names.values()))))
+            for item_id, name in zone_names.items():
+                rows[item_id][0]['preferred_zone_id'] = zone_ids.get(name)
+        
+        ids = list(rows)
+        for start in range(0, len(ids), IN_QUERY_CHUNK):
+            chunk = ids[start:start + IN_QUERY_CHUNK]
+            for (item_id,) in db.session.query(Item.id).filter(Item.id.in_(chunk)):
+                fields, result = rows.pop(item_id)
+                result.update(success=False, error=f"Item with ID {item_id} already exists")
+        
+        if rows:
+            now = datetime.utcnow()
+            db.session.execute(Item.__table__.insert(), [fields for fields, _ in rows.values()])
+            db.session.execute(UsageLog.__table__.insert(), [
+                {'item_id': item_id, 'action': 'added', 'timestamp': now, 'notes': "Item added to inventory"}
+                for item_id in rows
+            ])
+        if commit:
+            db.session.commit()
+        
+        logger.info(f"Added {len(rows)} of {len(results)} items in bulk")
+        return results, None
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error adding items: {str(e)}")
+        return None, str(e)
+
+def placement_log(item_id, previous_container_id, container_id, astronaut_name=None):
+    """Build the usage log entry of an item placed in or moved to a container."""
+    return UsageLog(
+        item_id=item_id,
+        action='placed' if previous_container_id is None else 'moved',
+        timestamp=datetime.utcnow(),
+        from_container_id=previous_container_id,
+        to_container_id=container_id,
+        astronaut_name=astronaut_name,
+        notes=f"Item {'placed in' if previous_container_id is None else 'moved to'} container {container_id}"
+    )
+
 def place_item(item_id, container_id, x, y, z, rotated=False, astronaut_name=None):
     """Place an item in a container at specified coordinates."""
     try:
@@ -117,21 +233,12 @@ def place_item(item_id, container_id, x, y, z, rotated=False, astronaut_name=Non
         item.y_pos = y
         item.z_pos = z
         item.rotated = rotated
+        placed = ItemSnapshot.from_item(item)
         
+        # Log the placement in the same transaction as the move
+        db.session.add(placement_log(item.id, previous_container_id, container_id, astronaut_name))
         db.session.commit()
-        
-        # Log the placement
-        log = UsageLog(
-            item_id=item.id,
-            action='placed' if previous_container_id is None else 'moved',
-            timestamp=datetime.utcnow(),
-            from_container_id=previous_container_id,
-            to_container_id=container_id,
-            astronaut_name=astronaut_name,
-            notes=f"Item {'placed in' if previous_container_id is None else 'moved to'} container {container_id}"
-        )
-        db.session.add(log)
-        db.session.commit()
+        notify_items_committed(removed=[(previous_container_id, item_id)], placed=[placed])
         
         return item, None
     except Exception as e:
@@ -153,27 +260,150 @@ def is_position_valid(container, item, x, y, z, rotated=False):
         z + item_height > container.height):
         return False
     
-    # Check if there's a collision with other items
-    items_in_container = Item.query.filter_by(container_id=container.id).all()
-    for other_item in items_in_container:
-        if other_item.id == item.id:  # Skip the item itself if it's already in the container
-            continue
+    # Ask the database's spatial index for any other item overlapping the box
+    colliding = find_overlapping_item_ids(
+        container.id,
+        (x, y, z),
+        (x + item_width, y + item_depth, z + item_height),
+        exclude_item_id=item.id
+    )
+    return not colliding
+
+def place_items(placements, astronaut_name=None, all_or_nothing=False):
+    """Apply a whole placement plan, such as the output of find_optimal_placements_for_batch.
+    
+    Each placement is a dict with 'item_id', 'container_id', 'x', 'y', 'z'
+    and optionally 'rotated'. Poses are checked in plan order against one
+    in-memory index per affected container, built from its rows in this
+    transaction and updated with the earlier placements of the plan, so a
+    plan is accepted
+    exactly when it could be carried out step by step. Every accepted
+    move and its log are written in one transaction; with
+    ``all_or_nothing`` a single rejected placement writes nothing.
+    
+    Returns (outcomes, error): one {'item_id', 'container_id', 'success',
+    'error'} per placement, in plan order, or None and the error if the
+    transaction failed.
+    """
+    try:
+        item_ids = {placement.get('item_id') for placement in placements if isinstance(placement.get('item_id'), str)}
+        container_ids = {placement.get('container_id') for placement in placements
+                         if isinstance(placement.get('container_id'), str)}
+        items = {item.id: item for item in Item.query.filter(Item.id.in_(item_ids))}
+        containers = {c.id: c for c in Container.query.filter(Container.id.in_(container_ids))}
+        for item in items.values():
+            if item.container_id is not None and item.container_id not in containers:
+                previous = Container.query.get(item.container_id)
+                if previous is not None:
+                    containers[previous.id] = previous
+        indexes = {}  # container id -> index of its current rows, built on first use
+        
+        def index_of(container_id):
+            if container_id not in indexes:
+                indexes[container_id] = build_index(containers[container_id])
+            return indexes[container_id]
+        
+        outcomes, accepted, seen = [], [], set()
+        for placement in placements:
+            item_id, container_id = placement.get('item_id'), placement.get('container_id')
+            outcome = {'item_id': item_id, 'container_id': container_id, 'success': False, 'error': None}
+            outcomes.append(outcome)
+            if any(placement.get(key) is None for key in ('item_id', 'container_id', 'x', 'y', 'z')):
+                outcome['error'] = "Missing required fields"
+                continue
+            if not isinstance(item_id, str) or not isinstance(container_id, str):
+                outcome['error'] = "Invalid item or container ID"
+                continue
+            item, container = items.get(item_id), containers.get(container_id)
+            if any(isinstance(placement[key], bool) or not isinstance(placement[key], (int, float))
+                   for key in ('x', 'y', 'z')):
+                outcome['error'] = "Invalid position: coordinates must be numbers"
+                continue
+            if item is None:
+                outcome['error'] = f"Item with ID {item_id} not found"
+                continue
+            if container is None:
+                outcome['error'] = f"Container with ID {container_id} not found"
+                continue
+            if item_id in seen:
+                outcome['error'] = f"Item with ID {item_id} is placed more than once"
+                continue
+            
+            x, y, z = placement['x'], placement['y'], placement['z']
+            rotated = bool(placement.get('rotated', False))
+            snapshot = ItemSnapshot(item.id, item.width, item.depth, item.height, x, y, z, rotated, container_id)
+            (min_x, min_y, min_z), (max_x, max_y, max_z) = item_bounds(snapshot)
+            if min(min_x, min_y, min_z) < 0 or max_x > container.width or max_y > container.depth or \
+               max_z > container.height:
+                outcome['error'] = "Invalid position: item would not fit in container at this position"
+                continue
+            
+            # The item's current spot is free for its own new pose
+            current = None
+            if item.container_id in containers:
+                current = index_of(item.container_id).items.get(item_id)
+                index_of(item.container_id).remove(item_id)
+            index = index_of(container_id)
+            if any(other.id != item_id for other in index.query_box((min_x, min_y, min_z), (max_x, max_y, max_z))):
+                if current is not None:
+                    index_of(item.container_id).insert(current)
+                outcome['error'] = "Invalid position: item would overlap another item"
+                continue
             
-        # Get other item dimensions based on rotation
-        other_width = other_item.depth if other_item.rotated else other_item.width
-        other_depth = other_item.width if other_item.rotated else other_item.depth
-        other_height = other_item.height
-        
-        # Check for collision
-        if not (x + item_width <= other_item.x_pos or 
-                other_item.x_pos + other_width <= x or 
-                y + item_depth <= other_item.y_pos or 
-                other_item.y_pos + other_depth <= y or 
-                z + item_height <= other_item.z_pos or 
-                other_item.z_pos + other_height <= z):
-            return False
+            index.insert(snapshot)
+            seen.add(item_id)
+            accepted.append((item, snapshot, outcome))
+        
+        if all_or_nothing and len(accepted) < len(placements):
+            for _, _, outcome in accepted:
+                outcome['error'] = "Not applied: another placement in the plan was rejected"
+            return outcomes, None
+        
+        moves = []
+        for item, snapshot, outcome in accepted:
+            moves.append((item.id, item.container_id, snapshot))
+            db.session.add(placement_log(item.id, item.container_id, snapshot.container_id, astronaut_name))
+            item.container_id = snapshot.container_id
+            item.x_pos, item.y_pos, item.z_pos = snapshot.x_pos, snapshot.y_pos, snapshot.z_pos
+            item.rotated = snapshot.rotated
+            outcome['success'] = True
+        db.session.commit()
+        
+        notify_items_committed(
+            removed=[(previous_container_id, item_id) for item_id, previous_container_id, _ in moves],
+            placed=[snapshot for _, _, snapshot in moves]
+        )
+        logger.info(f"Applied {len(moves)} of {len(placements)} placements in one transaction")
+        return outcomes, None
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error placing items: {str(e)}")
+        return None, str(e)
+
+def retrieval_log(item_id, container_id, astronaut_name=None, use_item=False):
+    """Build the usage log entry of an item taken out of a container."""
+    action = 'used' if use_item else 'retrieved'
+    return UsageLog(
+        item_id=item_id,
+        action=action,
+        timestamp=datetime.utcnow(),
+        from_container_id=container_id,
+        astronaut_name=astronaut_name,
+        notes=f"Item {action} from container {container_id}"
+    )
+
+def take_out(item, use_item=False):
+    """Clear an item's position, using it once if requested; returns the container it was in."""
+    container_id = item.container_id
+    item.container_id = None
+    item.x_pos = None
+    item.y_pos = None
+    item.z_pos = None
     
-    return True
+    # Use the item if requested
+    if use_item:
+        item.use_item()  # This will decrement uses_remaining and potentially mark as waste
+    return container_id
 
 def retrieve_item(item_id, astronaut_name=None, use_item=False):
     """Retrieve an item from its container."""
@@ -185,38 +415,83 @@ def retrieve_item(item_id, astronaut_name=None, use_item=False):
         if not item.container_id:
             return None, f"Item with ID {item_id} is not in any container"
         
-        # Record the container before removing
-        container_id = item.container_id
+        # Remove item from container and log it in the same transaction
+        container_id = take_out(item, use_item)
+        db.session.add(retrieval_log(item.id, container_id, astronaut_name, use_item))
+        db.session.commit()
+        notify_items_committed(removed=[(container_id, item_id)])
         
-        # Remove item from container
-        item.container_id = None
-        item.x_pos = None
-        item.y_pos = None
-        item.z_pos = None
+        return item, None
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error retrieving item: {str(e)}")
+        return None, str(e)
+
+def retrieve_items(item_ids, astronaut_name=None, use_items=False, time_budget=PLAN_TIME_BUDGET):
+    """Retrieve many items at once, e.g. everything needed for the next shift.
+    
+    The items of each container are taken out with one combined plan
+    (see BlockingGraph.plan_retrieval), so a blocker cleared for one item
+    is not moved again for the next. Blockers go back to their own spots,
+    so only the retrieved items change in the database: their updates,
+    uses and logs are written in one transaction.
+    
+    Returns (result, error). The result holds the executed 'sequence' of
+    steps (each with its container_id), the 'retrieved' ids, the 'skipped'
+    items with the reason, and the moves per container.
+    """
+    try:
+        items = {item.id: item for item in Item.query.filter(Item.id.in_(set(item_ids)))} if item_ids else {}
+        skipped = []
+        by_container = {}
+        for item_id in dict.fromkeys(item_ids):
+            item = items.get(item_id)
+            if item is None:
+                skipped.append({'item_id': item_id, 'error': f"Item with ID {item_id} not found"})
+            elif not item.container_id or item.x_pos is None:
+                skipped.append({'item_id': item_id, 'error': f"Item with ID {item_id} is not in any container"})
+            else:
+                by_container.setdefault(item.container_id, []).append(item_id)
         
-        # Use the item if requested
-        if use_item:
-            item.use_item()  # This will decrement uses_remaining and potentially mark as waste
+        sequence, retrieved, containers = [], [], {}
+        found = {c.id: c for c in Container.query.filter(Container.id.in_(list(by_container)))}
+        for container_id in set(by_container) - set(found):
+            skipped += [{'item_id': item_id, 'error': f"Container with ID {container_id} not found"}
+                        for item_id in by_container.pop(container_id)]
         
-        db.session.commit()
+        # Plan from the rows this transaction sees, not from a cache that may lag behind
+        contents = {container_id: [] for container_id in by_container}
+        if contents:
+            for row in Item.query.filter(Item.container_id.in_(list(contents))):
+                contents[row.container_id].append(ItemSnapshot.from_item(row))
         
-        # Log the retrieval
-        action = 'used' if use_item else 'retrieved'
-        log = UsageLog(
-            item_id=item.id,
-            action=action,
-            timestamp=datetime.utcnow(),
-            from_container_id=container_id,
-            astronaut_name=astronaut_name,
-            notes=f"Item {action} from container {container_id}"
-        )
-        db.session.add(log)
+        for container_id, target_ids in by_container.items():
+            container = found[container_id]
+            plan = BlockingGraph(contents[container_id]).plan_retrieval(target_ids, time_budget=time_budget)
+            containers[container.id] = {key: plan[key] for key in ('moves', 'max_held', 'optimal')}
+            planned = set()
+            for step in plan['steps']:
+                sequence.append(dict(step, container_id=container.id))
+                if step['action'] == 'retrieve':
+                    take_out(items[step['item_id']], use_items)
+                    db.session.add(retrieval_log(step['item_id'], container.id, astronaut_name, use_items))
+                    retrieved.append((step['item_id'], container.id))
+                    planned.add(step['item_id'])
+            skipped += [{'item_id': item_id, 'error': f"No retrieval plan for item with ID {item_id}"}
+                        for item_id in target_ids if item_id not in planned]
         db.session.commit()
         
-        return item, None
+        notify_items_committed(removed=[(container_id, item_id) for item_id, container_id in retrieved])
+        logger.info(f"Retrieved {len(retrieved)} items from {len(containers)} containers in one transaction")
+        return {
+            'sequence': sequence,
+            'retrieved': [item_id for item_id, _ in retrieved],
+            'skipped': skipped,
+            'containers': containers
+        }, None
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Error retrieving item: {str(e)}")
+        logger.error(f"Error retrieving items: {str(e)}")
         return None, str(e)
 
 def get_retrieval_steps(item_id):
@@ -233,21 +508,12 @@ def get_retrieval_steps(item_id):
     if item.y_pos == 0:  # Item is at the front of container
         return 0, []
     
-    # Find items that need to be moved to access this item
-    blocking_items = Item.query.filter_by(container_id=container.id).all()
-    items_to_move = []
-    
-    for other_item in blocking_items:
-        if other_item.id == item.id:
-            continue
-        
-        # Check if this item is blocking the path
-        if (other_item.y_pos < item.y_pos and  # It's in front of our target item
-            not (other_item.x_pos >= item.x_pos + item.width or  # Not to the right
-                 other_item.x_pos + other_item.width <= item.x_pos or  # Not to the left
-                 other_item.z_pos >= item.z_pos + item.height or  # Not above
-                 other_item.z_pos + other_item.height <= item.z_pos)):  # Not below
-            items_to_move.append(other_item.to_dict())
+    # Look up the items that need to be moved to access this item
+    blocking_ids = get_blocker_ids([item.id])[item.id]
+    items_to_move = [
+        other_item.to_dict()
+        for other_item in Item.query.filter(Item.id.in_(blocking_ids)).all()
+    ] if blocking_ids else []
     
     return len(items_to_move), items_to_move
 
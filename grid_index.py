@@ -0,0 +1,73 @@
+import itertools
+import math
+import sys
+from spatial_index import SpatialIndex, boxes_overlap
+
+
+class UniformGridIndex(SpatialIndex):
+    """Spatial hash over a uniform grid of cubic cells.
+
+    Each item is listed in every cell its box touches, so a query only
+    visits the cells under the query box. Works best when the cell size is
+    close to the typical item size; very large items end up in many cells.
+    """
+
+    def __init__(self, container, items=None, cell_size=20):
+        self.cell_size = cell_size
+        super().__init__(container, items)
+
+    def options(self):
+        return {'cell_size': self.cell_size}
+
+    def _reset_index(self):
+        """Clear the cell map."""
+        self.cells = {}        # (i, j, k) -> ids of the items touching the cell, in insertion order
+        self._item_cells = {}  # item id -> cells holding it
+
+    def _cell_ranges(self, box_min, box_max):
+        """Get the ranges of cell coordinates a box touches, including cells it only borders."""
+        return [
+            range(int(math.floor(lo / self.cell_size)), int(math.floor(hi / self.cell_size)) + 1)
+            for lo, hi in zip(box_min, box_max)
+        ]
+
+    def _index_insert(self, item):
+        if item.id not in self.bounds:
+            return False
+        keys = list(itertools.product(*self._cell_ranges(*self.bounds[item.id])))
+        for key in keys:
+            self.cells.setdefault(key, {})[item.id] = None
+        self._item_cells[item.id] = keys
+        return True
+
+    def _index_remove(self, item_id):
+        for key in self._item_cells.pop(item_id, []):
+            cell = self.cells[key]
+            del cell[item_id]
+            if not cell:
+                del self.cells[key]
+
+    def query_box(self, min_point, max_point):
+        """Query all items that intersect with the given box."""
+        ranges = self._cell_ranges(min_point, max_point)
+        candidates = {}
+        if math.prod(len(r) for r in ranges) <= len(self.cells):
+            for key in itertools.product(*ranges):
+                candidates.update(self.cells.get(key, {}))
+        else:
+            # The box covers more cells than are occupied; scan the occupied ones
+            for key, cell in self.cells.items():
+                if all(index in r for index, r in zip(key, ranges)):
+                    candidates.update(cell)
+        return [
+            self.items[item_id] for item_id in candidates
+            if boxes_overlap(min_point, max_point, *self.bounds[item_id])
+        ]
+
+    def _index_memory(self):
+        """Estimate the memory held by the cell map, in bytes."""
+        return (
+            sys.getsizeof(self.cells) + sys.getsizeof(self._item_cells) +
+            sum(sys.getsizeof(cell) for cell in self.cells.values()) +
+            sum(sys.getsizeof(keys) for keys in self._item_cells.values())
+        )
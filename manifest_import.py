@@ -0,0 +1,174 @@
+import csv
+import io
+import itertools
+import json
+import uuid
+from datetime import datetime
+import click
+from app import app, db, logger
+from models import Item, ManifestImport
+from database import add_items
+from algorithms import BatchPlacementEngine
+
+# Manifest formats and the content types they may be sent with
+MANIFEST_FORMATS = {
+    'csv': ('text/csv',),
+    'ndjson': ('application/x-ndjson', 'application/jsonl'),
+}
+
+
+def iter_manifest_rows(stream, fmt):
+    """Parse a text stream of CSV or NDJSON item rows one row at a time.
+
+    Yields (row, error): the item payload as a dict, or None and why the
+    line could not be read. Every record yields exactly once, so row
+    counts line up when an import resumes.
+    """
+    if fmt == 'csv':
+        for row in csv.DictReader(stream):
+            yield {key.strip(): value.strip() if isinstance(value, str) else value
+                   for key, value in row.items() if key}, None
+        return
+
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield None, f"Invalid JSON: {str(e)}"
+            continue
+        if isinstance(row, dict):
+            yield row, None
+        else:
+            yield None, "Expected an item object"
+
+
+def import_manifest(stream, fmt, import_id=None, chunk_size=None, place=False):
+    """Import a manifest stream in chunks, yielding a progress dict per chunk.
+
+    Each chunk goes through database.add_items and is committed together
+    with the import's progress record, so memory stays bounded by the
+    chunk size. Importing the same ``import_id`` again skips the rows
+    already committed. With ``place`` the items of every chunk are then
+    placed and committed with a BatchPlacementEngine, which is created
+    once per import, and the record's 'rows_placed' catches up; a resumed
+    import first places the items of committed rows that never got there.
+
+    Progress dicts hold the totals so far and the chunk's row 'errors';
+    the last one has 'completed' set, or an 'error' if the stream could
+    not be read or a chunk could not be written. Committed chunks stay, so
+    the import can be resumed.
+    """
+    import_id = import_id or uuid.uuid4().hex
+    chunk_size = chunk_size or app.config.get('MANIFEST_CHUNK_SIZE', 1000)
+    try:
+        progress = ManifestImport.query.get(import_id)
+        if progress is None:
+            progress = ManifestImport(id=import_id, rows_done=0, rows_placed=0, added=0, failed=0, completed=False)
+            db.session.add(progress)
+            db.session.commit()
+        resumed_from = progress.rows_done
+        if resumed_from:
+            logger.info(f"Resuming manifest import {import_id} after row {resumed_from}")
+
+        # Committed rows whose items were never placed, e.g. after a crash between the two commits
+        rows = iter_manifest_rows(stream, fmt)
+        unplaced = []
+        for row_number, (row, _) in enumerate(itertools.islice(rows, resumed_from), 1):
+            if place and row_number > progress.rows_placed and row and row.get('id') not in (None, ''):
+                unplaced.append(str(row['id']))
+
+        if progress.completed and not unplaced:
+            yield dict(progress.to_dict(), resumed_from=resumed_from, errors=[])
+            return
+
+        engine = None
+        row_number = resumed_from
+        while True:
+            chunk = [] if progress.completed else list(itertools.islice(rows, chunk_size))
+            errors = []
+            payload, numbers = [], []
+            for row, error in chunk:
+                row_number += 1
+                if error:
+                    errors.append({'row': row_number, 'id': None, 'error': error})
+                else:
+                    payload.append(row)
+                    numbers.append(row_number)
+
+            results, error = add_items(payload, commit=False)
+            if error:
+                yield dict(progress.to_dict(), resumed_from=resumed_from, errors=errors, error=error)
+                return
+            added = [result['id'] for result in results if result['success']]
+            errors += [
+                {'row': number, 'id': result['id'], 'error': result['error']}
+                for number, result in zip(numbers, results) if not result['success']
+            ]
+
+            if not progress.completed:
+                progress.rows_done += len(chunk)
+                progress.added += len(added)
+                progress.failed += len(errors)
+                progress.completed = len(chunk) < chunk_size
+                progress.updated_at = datetime.utcnow()
+                db.session.commit()
+
+            placement = {}
+            if place:
+                to_place, unplaced = unplaced + added, []
+                if to_place:
+                    if engine is None:
+                        engine = BatchPlacementEngine()
+                    engine.place_all(Item.query.filter(Item.id.in_(to_place), Item.container_id.is_(None)).all())
+                    placed, _ = engine.commit()
+                    placement = {'placed': len(placed), 'unplaced': len(to_place) - len(placed)}
+                progress.rows_placed = progress.rows_done
+                db.session.commit()
+
+            yield dict(progress.to_dict(), resumed_from=resumed_from, errors=errors, **placement)
+            if progress.completed:
+                return
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error importing manifest {import_id}: {str(e)}")
+        yield {'import_id': import_id, 'errors': [], 'error': str(e)}
+
+
+def manifest_format(filename=None, content_type=None):
+    """Guess a manifest's format from its file name or content type; returns None if unknown."""
+    if filename:
+        extension = filename.rsplit('.', 1)[-1].lower()
+        if extension in ('csv', 'ndjson', 'jsonl'):
+            return 'csv' if extension == 'csv' else 'ndjson'
+    if content_type:
+        content_type = content_type.split(';')[0].strip()
+        for fmt, types in MANIFEST_FORMATS.items():
+            if content_type in types:
+                return fmt
+    return None
+
+
+@app.cli.command('import-manifest')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(list(MANIFEST_FORMATS)), help="Defaults to the file extension.")
+@click.option('--import-id', help="Resume the import with this id; defaults to the file path.")
+@click.option('--chunk-size', type=int, help="Rows per transaction (default: MANIFEST_CHUNK_SIZE).")
+@click.option('--place', is_flag=True, help="Place each chunk's items after importing them.")
+def import_manifest_command(path, fmt, import_id, chunk_size, place):
+    """Import a CSV or NDJSON cargo manifest."""
+    fmt = fmt or manifest_format(filename=path)
+    if fmt is None:
+        raise click.UsageError("Cannot tell the manifest format; pass --format")
+    with io.open(path, newline='', encoding='utf-8') as stream:
+        for update in import_manifest(stream, fmt, import_id or path, chunk_size, place):
+            if 'error' in update:
+                raise click.ClickException(f"{update['error']} (committed chunks are kept; run again to resume)")
+            line = f"{update['rows_done']} rows: {update['added']} added, {update['failed']} failed"
+            if 'placed' in update:
+                line += f", {update['placed']} placed this chunk"
+            click.echo(line)
+            for error in update['errors']:
+                click.echo(f"  row {error['row']} ({error['id']}): {error['error']}", err=True)
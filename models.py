@@ -1,6 +1,6 @@
 from app import db
 from datetime import datetime, date
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Date
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Date, Index
 from sqlalchemy.orm import relationship
 
 class Zone(db.Model):
@@ -168,3 +168,93 @@ class UsageLog(db.Model):
             'astronaut_name': self.astronaut_name,
             'notes': self.notes
         }
+
+class ItemBox(db.Model):
+    """Bounding box of a placed item, mirrored for indexed range queries.
+    
+    Rows are maintained by spatial_db whenever an item is written. On SQLite
+    the same boxes are also kept in an R*Tree virtual table keyed by id.
+    """
+    __tablename__ = 'item_boxes'
+    
+    id = Column(Integer, primary_key=True)
+    item_id = Column(String(50), ForeignKey('items.id'), nullable=False, unique=True)
+    container_id = Column(String(50), nullable=False)
+    min_x = Column(Float, nullable=False)
+    max_x = Column(Float, nullable=False)
+    min_y = Column(Float, nullable=False)
+    max_y = Column(Float, nullable=False)
+    min_z = Column(Float, nullable=False)
+    max_z = Column(Float, nullable=False)
+    
+    # B-tree range index used when no R*Tree is available (e.g. on Postgres)
+    __table_args__ = (
+        Index('ix_item_boxes_container_y', 'container_id', 'min_y', 'max_y'),
+    )
+    
+    def __repr__(self):
+        return f"<ItemBox {self.item_id} in {self.container_id}>"
+
+class ItemBlocker(db.Model):
+    """A placed item standing between another item and its container's open face.
+    
+    Rows are maintained by spatial_db together with the item boxes: a write
+    only touches the edges of the items whose front-face projections overlap
+    the written item, so blocking counts are lookups.
+    """
+    __tablename__ = 'item_blockers'
+    
+    item_id = Column(String(50), ForeignKey('items.id'), primary_key=True)
+    blocker_id = Column(String(50), ForeignKey('items.id'), primary_key=True)
+    
+    __table_args__ = (
+        Index('ix_item_blockers_blocker', 'blocker_id'),
+    )
+    
+    def __repr__(self):
+        return f"<ItemBlocker {self.blocker_id} blocks {self.item_id}>"
+
+class ContainerVersion(db.Model):
+    """Version of a container's contents, shared by every process using the database.
+    
+    spatial_db bumps it once in every transaction that changes the
+    container's items; spatial_cache serves a cached index only while its
+    version matches. A missing row means version 0.
+    """
+    __tablename__ = 'container_versions'
+    
+    container_id = Column(String(50), ForeignKey('containers.id'), primary_key=True)
+    version = Column(Integer, default=0, nullable=False)
+    
+    def __repr__(self):
+        return f"<ContainerVersion {self.container_id}: {self.version}>"
+
+class ManifestImport(db.Model):
+    """Progress of a streamed manifest import, so an interrupted one can resume.
+    
+    The row counts advance in the same transaction as each chunk's items,
+    and 'rows_placed' in the one placing them.
+    """
+    __tablename__ = 'manifest_imports'
+    
+    id = Column(String(100), primary_key=True)
+    rows_done = Column(Integer, default=0, nullable=False)  # Manifest rows committed, from the start
+    rows_placed = Column(Integer, default=0, nullable=False)  # Rows whose items went through placement
+    added = Column(Integer, default=0, nullable=False)
+    failed = Column(Integer, default=0, nullable=False)
+    completed = Column(Boolean, default=False, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<ManifestImport {self.id}: {self.rows_done} rows>"
+    
+    def to_dict(self):
+        return {
+            'import_id': self.id,
+            'rows_done': self.rows_done,
+            'rows_placed': self.rows_placed,
+            'added': self.added,
+            'failed': self.failed,
+            'completed': self.completed,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
@@ -0,0 +1,303 @@
+import math
+import numpy as np
+
+# Edge length in cm of one occupancy cell; matches the old grid-search step.
+DEFAULT_RESOLUTION = 5
+
+# Finest cell size in cm the coarse-to-fine search refines down to by default
+FINE_RESOLUTION = 1
+
+# Cells along the longest container side at the coarsest coarse-to-fine level
+COARSE_CELLS = 64
+
+# Most cells a refinement pass may rasterize (about 80 MB); a 1 cm pass over
+# the largest default container stays below it
+MAX_PASS_CELLS = 8_000_000
+
+
+def resolution_levels(dimensions, min_resolution, coarse_cells=COARSE_CELLS):
+    """Get the cell sizes of a coarse-to-fine search, coarsest first.
+
+    Each level halves the cell size of the one before and ends at
+    ``min_resolution``, so every level's origin lattice contains the
+    lattices of the coarser ones.
+    """
+    levels = [min_resolution]
+    while max(dimensions) / levels[-1] > coarse_cells:
+        levels.append(levels[-1] * 2)
+    return levels[::-1]
+
+
+def item_bounds(item):
+    """Get the (min, max) corners of a placed item, taking rotation into account."""
+    item_width = item.depth if item.rotated else item.width
+    item_depth = item.width if item.rotated else item.depth
+    return (
+        (item.x_pos, item.y_pos, item.z_pos),
+        (item.x_pos + item_width, item.y_pos + item_depth, item.z_pos + item.height)
+    )
+
+
+class OccupancyGrid:
+    """Voxelized occupancy of a container for vectorized free-space searches.
+
+    The container is divided into cubic cells of ``resolution`` cm. Items are
+    rasterized conservatively: every cell an item touches is marked, so a box
+    whose cells are all free is guaranteed not to overlap any item.
+
+    Emptiness queries go through a 3D summed-area table over the cell counts,
+    so any box is checked with eight lookups regardless of how many items the
+    container holds. The table is built lazily on the first query and updated
+    in place when single items are added or removed.
+    """
+
+    def __init__(self, width, depth, height, resolution=DEFAULT_RESOLUTION):
+        self.width = width
+        self.depth = depth
+        self.height = height
+        self.resolution = resolution
+
+        # Number of items touching each cell
+        self.shape = tuple(max(1, math.ceil(size / resolution)) for size in (width, depth, height))
+        self.counts = np.zeros(self.shape, dtype=np.int32)
+        self._table = None
+        self._layer_occupied = None
+
+    @classmethod
+    def from_items(cls, container, items, resolution=DEFAULT_RESOLUTION):
+        """Rasterize all placed items of a container into a new grid."""
+        grid = cls(container.width, container.depth, container.height, resolution)
+        for item in items:
+            grid.add_item(item)
+        return grid
+
+    def cell_range(self, box_min, box_max):
+        """Get the slices of cells touched by the box [box_min, box_max)."""
+        return tuple(
+            slice(
+                min(max(int(math.floor(lo / self.resolution)), 0), n),
+                min(max(int(math.ceil(hi / self.resolution)), 0), n)
+            )
+            for lo, hi, n in zip(box_min, box_max, self.shape)
+        )
+
+    def add_box(self, box_min, box_max, count=1):
+        """Mark the cells touched by a box as occupied (or free them with a negative count)."""
+        cells = self.cell_range(box_min, box_max)
+        if any(c.start >= c.stop for c in cells):
+            return
+        if self._layer_occupied is not None:
+            self._layer_occupied[cells[1]] -= (self.counts[cells] > 0).sum(axis=(0, 2))
+        self.counts[cells] += count
+        if self._layer_occupied is not None:
+            self._layer_occupied[cells[1]] += (self.counts[cells] > 0).sum(axis=(0, 2))
+
+        if self._table is not None:
+            # Each prefix entry grows by the number of box cells it covers
+            xs, ys, zs = (
+                np.clip(np.arange(c.start + 1, n + 1) - c.start, 0, c.stop - c.start)
+                for c, n in zip(cells, self.shape)
+            )
+            self._table[cells[0].start + 1:, cells[1].start + 1:, cells[2].start + 1:] += (
+                count * xs[:, None, None] * ys[None, :, None] * zs[None, None, :]
+            )
+
+    def remove_box(self, box_min, box_max):
+        """Release the cells touched by a previously added box."""
+        self.add_box(box_min, box_max, count=-1)
+
+    def add_item(self, item):
+        """Rasterize a placed item into the grid."""
+        if item.x_pos is None or item.y_pos is None or item.z_pos is None:
+            return
+        self.add_box(*item_bounds(item))
+
+    def remove_item(self, item):
+        """Remove a placed item from the grid, using its currently recorded position."""
+        if item.x_pos is None or item.y_pos is None or item.z_pos is None:
+            return
+        self.remove_box(*item_bounds(item))
+
+    @property
+    def table(self):
+        """Summed-area table: table[i, j, k] is the sum of counts[:i, :j, :k]."""
+        if self._table is None:
+            table = np.zeros(tuple(n + 1 for n in self.shape), dtype=np.int64)
+            table[1:, 1:, 1:] = self.counts.cumsum(0).cumsum(1).cumsum(2)
+            self._table = table
+        return self._table
+
+    @property
+    def layer_occupied(self):
+        """Number of occupied cells in each y layer, kept in sync by add_box."""
+        if self._layer_occupied is None:
+            self._layer_occupied = (self.counts > 0).sum(axis=(0, 2))
+        return self._layer_occupied
+
+    @property
+    def nbytes(self):
+        """Memory held by the cell counts and the summed-area table, in bytes."""
+        return self.counts.nbytes + (self._table.nbytes if self._table is not None else 0)
+
+    def count_in_cells(self, cells):
+        """Sum the cell counts inside a block of cells with eight table lookups."""
+        (x0, x1), (y0, y1), (z0, z1) = ((c.start, c.stop) for c in cells)
+        if x0 >= x1 or y0 >= y1 or z0 >= z1:
+            return 0
+        t = self.table
+        return int(
+            t[x1, y1, z1] - t[x0, y1, z1] - t[x1, y0, z1] - t[x1, y1, z0]
+            + t[x0, y0, z1] + t[x0, y1, z0] + t[x1, y0, z0] - t[x0, y0, z0]
+        )
+
+    def is_box_empty(self, box_min, box_max, ignore_item=None):
+        """Check in O(1) whether a box is guaranteed not to overlap any item.
+
+        A False result may be a false alarm when items do not line up with the
+        cell grid; callers needing an exact answer should fall back to checking
+        the actual item geometry. ``ignore_item`` discounts the cells of an item
+        that is already rasterized in this grid (e.g. an item being moved).
+        """
+        cells = self.cell_range(box_min, box_max)
+        occupied = self.count_in_cells(cells)
+
+        if ignore_item is not None and ignore_item.x_pos is not None:
+            own_cells = self.cell_range(*item_bounds(ignore_item))
+            overlap = 1
+            for box_cells, item_cells in zip(cells, own_cells):
+                overlap *= max(0, min(box_cells.stop, item_cells.stop) - max(box_cells.start, item_cells.start))
+            occupied -= overlap
+
+        return occupied == 0
+
+    def grow_block(self, origin, size, limit=None):
+        """Count how many copies of a free box fit in a block grown from it.
+
+        Copies go side by side along x, then rows of them stack along z,
+        until the walls, an occupied cell or ``limit`` copies. Returns
+        (columns, layers); only the last layer may be partly used when
+        ``limit`` is reached.
+        """
+        (x, y, z), (width, depth, height) = origin, size
+        columns = 1
+        while (limit is None or columns < limit) and x + (columns + 1) * width <= self.width and self.is_box_empty(
+                (x + columns * width, y, z), (x + (columns + 1) * width, y + depth, z + height)):
+            columns += 1
+        layers = 1
+        while (limit is None or layers * columns < limit) and z + (layers + 1) * height <= self.height and self.is_box_empty(
+                (x, y, z + layers * height), (x + columns * width, y + depth, z + (layers + 1) * height)):
+            layers += 1
+        return columns, layers
+
+    def _origin_extent(self, dimensions):
+        """Get the number of grid origins per axis for a box, and its size in cells.
+
+        Returns None if the box is larger than the container.
+        """
+        free_shape = []
+        box_cells = []
+        for size, limit in zip(dimensions, (self.width, self.depth, self.height)):
+            if size > limit:
+                return None
+            free_shape.append(int(math.floor((limit - size) / self.resolution)) + 1)
+            box_cells.append(max(1, int(math.ceil(size / self.resolution))))
+        return free_shape, box_cells
+
+    def _free_origins(self, dimensions):
+        """Get a boolean volume of grid origins where a box of the given size fits.
+
+        Entry (i, j, k) is True when the box with its minimum corner at
+        (i, j, k) * resolution lies inside the container and touches no
+        occupied cell. All origins are evaluated at once from the summed-area
+        table.
+        """
+        extent = self._origin_extent(dimensions)
+        if extent is None:
+            return None
+        (fx, fy, fz), (cx, cy, cz) = extent
+        t = self.table
+        lo_x, hi_x = slice(0, fx), slice(cx, cx + fx)
+        lo_y, hi_y = slice(0, fy), slice(cy, cy + fy)
+        lo_z, hi_z = slice(0, fz), slice(cz, cz + fz)
+        occupied = (
+            t[hi_x, hi_y, hi_z] - t[lo_x, hi_y, hi_z] - t[hi_x, lo_y, hi_z] - t[hi_x, hi_y, lo_z]
+            + t[lo_x, lo_y, hi_z] + t[lo_x, hi_y, lo_z] + t[hi_x, lo_y, lo_z] - t[lo_x, lo_y, lo_z]
+        )
+        return occupied == 0
+
+    def find_empty_space(self, item_width, item_depth, item_height, consider_rotation=True):
+        """Find empty space that can fit an item of the given dimensions.
+
+        Candidate origins lie on the cell grid. The position closest to the
+        open face (smallest y) wins; ties are broken by the first orientation,
+        then by smallest x, then by smallest z.
+
+        Returns (x, y, z, rotated) or None if the item does not fit anywhere.
+        """
+        dimensions_to_try = [(item_width, item_depth, False)]
+        if consider_rotation and item_width != item_depth:
+            dimensions_to_try.append((item_depth, item_width, True))
+
+        best_position = None
+        for width, depth, rotated in dimensions_to_try:
+            free = self._free_origins((width, depth, item_height))
+            if free is None or not free.any():
+                continue
+
+            # Order candidates by y first so argmax picks the front-most origin
+            by_depth = free.transpose(1, 0, 2)
+            j, i, k = np.unravel_index(np.argmax(by_depth), by_depth.shape)
+
+            position = (
+                int(i) * self.resolution,
+                int(j) * self.resolution,
+                int(k) * self.resolution,
+                rotated
+            )
+            if best_position is None or position[1] < best_position[1]:
+                best_position = position
+
+        return best_position
+
+    def find_front_space(self, item_width, item_depth, item_height, consider_rotation=True):
+        """Find the same position as find_empty_space, scanning from the open face.
+
+        Origins are visited one y layer at a time, front to back, and the
+        search stops at the first layer with a fit. A layer is skipped
+        without looking at it when some y layer the box would span has fewer
+        free cells than the box's footprint. Otherwise all x, z origins of
+        the layer are tested at once from the summed-area table.
+
+        Returns (x, y, z, rotated) or None if the item does not fit anywhere.
+        """
+        dimensions_to_try = [(item_width, item_depth, False)]
+        if consider_rotation and item_width != item_depth:
+            dimensions_to_try.append((item_depth, item_width, True))
+
+        candidates = []
+        for width, depth, rotated in dimensions_to_try:
+            extent = self._origin_extent((width, depth, item_height))
+            if extent is not None:
+                candidates.append((rotated,) + tuple(extent))
+        if not candidates:
+            return None
+
+        t = self.table
+        layer_free = self.shape[0] * self.shape[2] - self.layer_occupied
+        for j in range(max(free_shape[1] for _, free_shape, _ in candidates)):
+            for rotated, (fx, fy, fz), (cx, cy, cz) in candidates:
+                if j >= fy or layer_free[j:j + cy].min() < cx * cz:
+                    continue
+
+                # 2D summed-area table of the slab's cell counts over x and z
+                slab = t[:, j + cy, :] - t[:, j, :]
+                occupied = (
+                    slab[cx:cx + fx, cz:cz + fz] - slab[:fx, cz:cz + fz]
+                    - slab[cx:cx + fx, :fz] + slab[:fx, :fz]
+                )
+                free = occupied == 0
+                if free.any():
+                    i, k = np.unravel_index(np.argmax(free), free.shape)
+                    return (int(i) * self.resolution, j * self.resolution, int(k) * self.resolution, rotated)
+
+        return None
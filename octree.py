@@ -1,10 +1,24 @@
+import sys
 import numpy as np
-from models import Item, Container
+from occupancy import item_bounds
+from spatial_index import (
+    SpatialIndex, GRID_SEARCH, EXTREME_POINT_SEARCH, FRONT_FIRST_SEARCH, COARSE_TO_FINE_SEARCH, PATTERN_SEARCH,
+    PLACEMENT_MODES,
+    boxes_overlap, boxes_overlap_many, pairs_to_csr
+)
+
+# Rebuilds with more items than this go through the bulk loader
+BULK_LOAD_THRESHOLD = 16
+
 
 class OctreeNode:
     """Octree node for spatial partitioning."""
+    __slots__ = (
+        'center', 'size', 'depth', 'max_depth', 'max_items',
+        'items', 'children', 'parent', 'locator', 'bounds'
+    )
     
-    def __init__(self, center, size, depth=0, max_depth=8, max_items=4):
+    def __init__(self, center, size, depth=0, max_depth=8, max_items=4, parent=None, locator=None):
         self.center = center  # (x, y, z) center of this node
         self.size = size      # size of this node's bounding box
         self.depth = depth    # current depth in the tree
@@ -13,6 +27,8 @@ class OctreeNode:
         
         self.items = []       # items contained in this node
         self.children = None  # child nodes (will be initialized if needed)
+        self.parent = parent  # parent node (None for the root)
+        self.locator = locator if locator is not None else {}  # item id -> nodes holding it, shared by the tree
         
         # Calculate bounds
         half_size = size / 2
@@ -26,11 +42,22 @@ class OctreeNode:
         if self.children is not None:
             return  # Already subdivided
         
+        self.children = self.make_children()
+        
+        # Redistribute items to children
+        items_to_redistribute = self.items
+        self.items = []
+        
+        for item in items_to_redistribute:
+            self.locator[item.id].remove(self)
+            self.insert(item)
+    
+    def make_children(self):
+        """Create the 8 child nodes of this node, ordered x, then y, then z."""
         half_size = self.size / 2
         quarter_size = half_size / 2
         
-        # Create 8 children
-        self.children = []
+        children = []
         for x in [-1, 1]:
             for y in [-1, 1]:
                 for z in [-1, 1]:
@@ -45,16 +72,46 @@ class OctreeNode:
                         size=half_size,
                         depth=self.depth + 1,
                         max_depth=self.max_depth,
-                        max_items=self.max_items
+                        max_items=self.max_items,
+                        parent=self,
+                        locator=self.locator
                     )
-                    self.children.append(child)
+                    children.append(child)
+        return children
+    
+    def store(self, item):
+        """Keep an item in this node and record the location in the locator map."""
+        self.items.append(item)
+        self.locator.setdefault(item.id, []).append(self)
+    
+    def discard(self, item_id):
+        """Drop an item from this node's own item list."""
+        self.items = [item for item in self.items if item.id != item_id]
+    
+    def merge_children(self):
+        """Collapse leaf children back into this node if together they are sparse.
         
-        # Redistribute items to children
-        items_to_redistribute = self.items
-        self.items = []
+        Returns True if the children were merged.
+        """
+        if self.children is None or any(child.children is not None for child in self.children):
+            return False
         
-        for item in items_to_redistribute:
-            self.insert(item)
+        merged = {item.id: item for item in self.items}
+        for child in self.children:
+            for item in child.items:
+                merged[item.id] = item
+        if len(merged) > self.max_items:
+            return False
+        
+        for child in self.children:
+            for item in child.items:
+                self.locator[item.id].remove(child)
+        for item_id in list(merged):
+            if self not in self.locator.setdefault(item_id, []):
+                self.locator[item_id].append(self)
+        self.items = list(merged.values())
+        self.children = None
+        return True
     
     def contains_point(self, point):
         """Check if a point is within this node's boundaries."""
@@ -100,7 +157,7 @@ class OctreeNode:
             
             # If item doesn't fit completely in any child, keep it in this node
             if not inserted:
-                self.items.append(item)
+                self.store(item)
             
             return True
         
@@ -110,7 +167,7 @@ class OctreeNode:
             return self.insert(item)  # Try again with new children
         
         # Otherwise, keep the item in this node
-        self.items.append(item)
+        self.store(item)
         return True
     
     def query_box(self, box_min, box_max):
@@ -123,20 +180,7 @@ class OctreeNode:
         
         # Check items in this node
         for item in self.items:
-            item_min = np.array([item.x_pos, item.y_pos, item.z_pos])
-            item_width = item.depth if item.rotated else item.width
-            item_depth = item.width if item.rotated else item.depth
-            item_max = np.array([
-                item.x_pos + item_width,
-                item.y_pos + item_depth,
-                item.z_pos + item.height
-            ])
-            
-            if (
-                box_min[0] <= item_max[0] and box_max[0] >= item_min[0] and
-                box_min[1] <= item_max[1] and box_max[1] >= item_min[1] and
-                box_min[2] <= item_max[2] and box_max[2] >= item_min[2]
-            ):
+            if boxes_overlap(box_min, box_max, *item_bounds(item)):
                 result.append(item)
         
         # Query children if they exist
@@ -146,116 +190,138 @@ class OctreeNode:
         
         return result
 
-class Octree:
+class Octree(SpatialIndex):
     """Octree implementation for efficient spatial queries on items in a container."""
     
-    def __init__(self, container):
-        """Initialize an octree for a container."""
-        self.container = container
+    def __init__(self, container, items=None, max_depth=8, max_items=4):
+        self.max_depth = max_depth
+        self.max_items = max_items
+        super().__init__(container, items)
+    
+    def options(self):
+        return {'max_depth': self.max_depth, 'max_items': self.max_items}
+    
+    def _bulk_load(self, items):
+        """Load items into the empty tree, top-down when there are more than a handful.
         
-        # Create the root node centered in the container
-        center = np.array([
-            container.width / 2,
-            container.depth / 2,
-            container.height / 2
-        ])
+        Every node takes the rows of its parent's item arrays whose boxes
+        touch it, found with one vectorized test per node, and splits when
+        it keeps more than max_items. Each item is tested only against the
+        nodes along its paths, and no node is subdivided twice. The result
+        is the same tree one-by-one inserts would produce.
+        """
+        if len(items) <= BULK_LOAD_THRESHOLD:
+            super()._bulk_load(items)
+            return
         
-        # Size should be the maximum dimension to ensure the tree covers the entire container
-        size = max(container.width, container.depth, container.height)
-        
-        self.root = OctreeNode(center, size)
+        for item in items:
+            self.items[item.id] = item
+            if item.x_pos is not None and item.y_pos is not None and item.z_pos is not None:
+                self.bounds[item.id] = item_bounds(item)
+        if not self.bounds:
+            return
         
-        # Insert all items in the container
-        self.rebuild()
+        placed = [self.items[item_id] for item_id in self.bounds]
+        mins = np.array([self.bounds[item.id][0] for item in placed], dtype=float)
+        maxs = np.array([self.bounds[item.id][1] for item in placed], dtype=float)
+        self._bulk_build(self.root, placed, mins, maxs, np.arange(len(placed)))
     
-    def rebuild(self):
-        """Rebuild the octree with all items in the container."""
-        # Clear the root and create a new one
+    def _bulk_build(self, node, items, mins, maxs, rows):
+        """Store the rows of the item arrays that touch a node under it, splitting it as needed."""
+        rows = rows[
+            (mins[rows] <= node.bounds['max']).all(axis=1) &
+            (maxs[rows] >= node.bounds['min']).all(axis=1)
+        ]
+        if len(rows) > node.max_items and node.depth < node.max_depth:
+            node.children = node.make_children()
+            for child in node.children:
+                self._bulk_build(child, items, mins, maxs, rows)
+        else:
+            for row in rows:
+                node.store(items[row])
+    
+    def _reset_index(self):
+        """Create an empty root node covering the container."""
+        # Create the root node centered in the container
         center = np.array([
             self.container.width / 2,
             self.container.depth / 2,
             self.container.height / 2
         ])
+        
+        # Size should be the maximum dimension to ensure the tree covers the entire container
         size = max(self.container.width, self.container.depth, self.container.height)
-        self.root = OctreeNode(center, size)
         
-        # Insert all items
-        items = Item.query.filter_by(container_id=self.container.id).all()
-        for item in items:
-            self.insert(item)
+        self.root = OctreeNode(center, size, max_depth=self.max_depth, max_items=self.max_items)
     
-    def insert(self, item):
-        """Insert an item into the octree."""
+    def _index_memory(self):
+        """Estimate the memory held by the nodes, in bytes."""
+        total = 0
+        nodes = [self.root]
+        while nodes:
+            node = nodes.pop()
+            total += sys.getsizeof(node) + sys.getsizeof(node.items)
+            total += node.bounds['min'].nbytes + node.bounds['max'].nbytes
+            if node.children is not None:
+                nodes.extend(node.children)
+        return total
+    
+    def _index_insert(self, item):
+        """Add an item to the node structure."""
         return self.root.insert(item)
     
+    def _index_remove(self, item_id):
+        """Drop an item from the node structure, merging sparse nodes into their parents."""
+        # Only the nodes holding the item are touched, found through the locator map
+        for node in self.root.locator.pop(item_id, []):
+            node.discard(item_id)
+            parent = node.parent
+            while parent is not None and parent.merge_children():
+                parent = parent.parent
+    
     def query_box(self, min_point, max_point):
         """Query all items that intersect with the given box."""
-        return self.root.query_box(min_point, max_point)
-    
-    def find_empty_space(self, item_width, item_depth, item_height, consider_rotation=True):
-        """Find empty space in the container that can fit an item of the given dimensions."""
-        
-        # We'll search in a grid pattern to find suitable spaces
-        step_size = 5  # Step size in cm for the grid search
-        
-        best_position = None
-        best_distance = float('inf')  # Distance from the open face (smaller is better)
-        
-        dimensions_to_try = [(item_width, item_depth, item_height)]
-        if consider_rotation:
-            dimensions_to_try.append((item_depth, item_width, item_height))
-        
-        for width, depth, height in dimensions_to_try:
-            # Check grid positions
-            for x in range(0, int(self.container.width - width) + 1, step_size):
-                for y in range(0, int(self.container.depth - depth) + 1, step_size):
-                    for z in range(0, int(self.container.height - height) + 1, step_size):
-                        # Define the box for this position
-                        box_min = np.array([x, y, z])
-                        box_max = np.array([x + width, y + depth, z + height])
-                        
-                        # Query items that intersect with this box
-                        intersecting_items = self.query_box(box_min, box_max)
-                        
-                        if not intersecting_items:
-                            # This is an empty space
-                            distance = y  # Distance from the open face of the container
-                            
-                            if distance < best_distance:
-                                is_rotated = (width != item_width)  # Check if dimensions were rotated
-                                best_position = (x, y, z, is_rotated)
-                                best_distance = distance
-        
-        return best_position
+        # Items spanning several nodes are reported once
+        return list({item.id: item for item in self.root.query_box(min_point, max_point)}.values())
     
-    def get_items_blocking_path(self, item):
-        """Get all items blocking the path to the open face for a given item."""
-        if not item.container_id or item.container_id != self.container.id:
-            return []
+    def query_boxes(self, mins, maxs):
+        """Query many boxes in a single traversal.
         
-        # Calculate item bounds
-        item_min = np.array([item.x_pos, item.y_pos, item.z_pos])
-        item_width = item.depth if item.rotated else item.width
-        item_depth = item.width if item.rotated else item.depth
-        item_max = np.array([
-            item.x_pos + item_width,
-            item.y_pos + item_depth,
-            item.z_pos + item.height
-        ])
+        ``mins`` and ``maxs`` are N x 3 arrays. Each node is tested against
+        all query boxes that reached it at once; the (box, item) candidates
+        collected on the way are checked in one vectorized pass. Returns (indptr, items) in CSR layout: the items
+        overlapping box i are items[indptr[i]:indptr[i + 1]].
+        """
+        mins = np.asarray(mins, dtype=float).reshape(-1, 3)
+        maxs = np.asarray(maxs, dtype=float).reshape(-1, 3)
+        ids = list(self.bounds)
+        index = {item_id: row for row, item_id in enumerate(ids)}
+        item_mins = np.array([self.bounds[item_id][0] for item_id in ids], dtype=float).reshape(-1, 3)
+        item_maxs = np.array([self.bounds[item_id][1] for item_id in ids], dtype=float).reshape(-1, 3)
         
-        # Define the path to the open face
-        path_min = np.array([item_min[0], 0, item_min[2]])
-        path_max = np.array([item_max[0], item_min[1], item_max[2]])
-        
-        # Query items intersecting with the path
-        blocking_items = self.query_box(path_min, path_max)
+        hit_queries, hit_rows = [], []
+        stack = [(self.root, np.arange(len(mins)))]
+        while stack:
+            node, queries = stack.pop()
+            queries = queries[
+                (node.bounds['min'] <= maxs[queries]).all(axis=1) &
+                (node.bounds['max'] >= mins[queries]).all(axis=1)
+            ]
+            if not len(queries):
+                continue
+            
+            if node.items:
+                rows = np.array([index[item.id] for item in node.items])
+                hit_queries.append(np.repeat(queries, len(rows)))
+                hit_rows.append(np.tile(rows, len(queries)))
+            if node.children is not None:
+                stack.extend((child, queries) for child in node.children)
         
-        # Filter out the item itself
-        blocking_items = [i for i in blocking_items if i.id != item.id]
+        if not hit_queries:
+            return np.zeros(len(mins) + 1, dtype=np.int64), []
         
-        return blocking_items
-    
-    def calculate_retrieval_steps(self, item):
-        """Calculate the number of steps needed to retrieve an item."""
-        blocking_items = self.get_items_blocking_path(item)
-        return len(blocking_items), blocking_items
+        # Test all candidate pairs the traversal produced at once
+        queries, rows = np.concatenate(hit_queries), np.concatenate(hit_rows)
+        hit = boxes_overlap_many(mins[queries], maxs[queries], item_mins[rows], item_maxs[rows])
+        indptr, rows = pairs_to_csr(len(mins), queries[hit], rows[hit], len(ids))
+        return indptr, [self.items[ids[row]] for row in rows]
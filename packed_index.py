@@ -0,0 +1,221 @@
+import sys
+import numpy as np
+from snapshots import ItemSnapshot
+from spatial_index import SpatialIndex, boxes_overlap_many, pairs_to_csr
+
+
+def gather_ranges(starts, counts):
+    """Concatenate the index ranges [start, start + count) into one array."""
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + offsets
+
+
+class PackedIndex(SpatialIndex):
+    """Base for backends whose nodes and item boxes live in contiguous arrays.
+
+    Item boxes are float32 rows. Nodes are rows of float32 bounds with a
+    CSR-style range of child nodes (children are contiguous, node 0 is the
+    root) and a range into a shared array of item rows. There is no Python
+    object per node, and the index holds ItemSnapshot records only.
+
+    The node arrays are packed in one bulk pass by _build_nodes. Later inserts
+    go to a small pending list and removals leave tombstones; both are scanned
+    with array operations and folded into a fresh pack once they grow large.
+    """
+
+    # Below this many rows one vectorized scan of the box arrays beats walking
+    # the node arrays level by level
+    linear_scan_rows = 1024
+
+    def rebuild(self, items=None):
+        """Rebuild the index with all items in the container, packing it in one pass."""
+        self._bulk_loading = True
+        try:
+            super().rebuild(items)
+        finally:
+            self._bulk_loading = False
+        self._pack()
+
+    def _reset_index(self):
+        """Clear the item rows and node arrays."""
+        self._rows = {}  # item id -> row in the box arrays
+        self._row_ids = []
+        self._mins = np.zeros((0, 3), dtype=np.float32)
+        self._maxs = np.zeros((0, 3), dtype=np.float32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._pending = []  # rows inserted since the last pack
+        self._dead = 0
+
+        self.node_min = np.zeros((0, 3), dtype=np.float32)
+        self.node_max = np.zeros((0, 3), dtype=np.float32)
+        self.node_child_start = np.zeros(0, dtype=np.int32)
+        self.node_child_count = np.zeros(0, dtype=np.int32)
+        self.node_item_start = np.zeros(0, dtype=np.int32)
+        self.node_item_count = np.zeros(0, dtype=np.int32)
+        self.node_items = np.zeros(0, dtype=np.int32)
+
+    def insert(self, item):
+        """Insert a snapshot of an item, replacing any earlier entry with the same id."""
+        return super().insert(ItemSnapshot.from_item(item))
+
+    def _index_insert(self, item):
+        if item.id not in self.bounds:
+            return False
+        box_min, box_max = self.bounds[item.id]
+
+        row = len(self._row_ids)
+        if row == len(self._mins):
+            # Grow the box arrays geometrically
+            capacity = max(16, 2 * row)
+            mins = np.zeros((capacity, 3), dtype=np.float32)
+            maxs = np.zeros((capacity, 3), dtype=np.float32)
+            alive = np.zeros(capacity, dtype=bool)
+            mins[:row], maxs[:row], alive[:row] = self._mins[:row], self._maxs[:row], self._alive[:row]
+            self._mins, self._maxs, self._alive = mins, maxs, alive
+        self._mins[row] = box_min
+        self._maxs[row] = box_max
+        self._alive[row] = True
+        self._rows[item.id] = row
+        self._row_ids.append(item.id)
+
+        if not self._bulk_loading:
+            self._pending.append(row)
+            if len(self._pending) > max(32, len(self._rows) // 4):
+                self._pack()
+        return True
+
+    def _index_remove(self, item_id):
+        row = self._rows.pop(item_id, None)
+        if row is None:
+            return
+        self._alive[row] = False
+        if row in self._pending:
+            self._pending.remove(row)
+        else:
+            self._dead += 1
+        if self._dead > max(32, len(self._rows)):
+            self._pack()
+
+    def _pack(self):
+        """Compact the live rows and rebuild the node arrays over them."""
+        ids = [item_id for item_id in self._row_ids if item_id in self._rows]
+        rows = np.array([self._rows[item_id] for item_id in ids], dtype=np.int64)
+        mins = self._mins[rows] if len(rows) else np.zeros((0, 3), dtype=np.float32)
+        maxs = self._maxs[rows] if len(rows) else np.zeros((0, 3), dtype=np.float32)
+
+        self._row_ids = ids
+        self._rows = {item_id: row for row, item_id in enumerate(ids)}
+        self._mins, self._maxs = mins.copy(), maxs.copy()
+        self._alive = np.ones(len(ids), dtype=bool)
+        self._pending = []
+        self._dead = 0
+
+        node_min, node_max, child_start, child_count, item_node = self._build_nodes(mins, maxs)
+        self.node_min = np.asarray(node_min, dtype=np.float32).reshape(-1, 3)
+        self.node_max = np.asarray(node_max, dtype=np.float32).reshape(-1, 3)
+        self.node_child_start = np.asarray(child_start, dtype=np.int32)
+        self.node_child_count = np.asarray(child_count, dtype=np.int32)
+
+        # Group the rows by node: node_items[start:start + count] are the node's rows
+        item_node = np.asarray(item_node, dtype=np.int64)
+        self.node_items = np.argsort(item_node, kind='stable').astype(np.int32)
+        self.node_item_count = np.bincount(item_node, minlength=len(self.node_min)).astype(np.int32)
+        self.node_item_start = (np.cumsum(self.node_item_count) - self.node_item_count).astype(np.int32)
+
+    def _build_nodes(self, mins, maxs):
+        """Build the nodes over the given boxes.
+
+        Returns (node_min, node_max, child_start, child_count, item_node),
+        where item_node gives the node holding each box.
+        """
+        raise NotImplementedError
+
+    def _walk(self, mins, maxs):
+        """Walk the node arrays with a frontier of (node, query box) pairs.
+
+        Returns the candidate (query, row) pairs from every node a query box
+        reached, plus the pending rows for every query.
+        """
+        hit_queries, hit_rows = [], []
+        queries = np.arange(len(mins)) if len(self.node_min) else np.zeros(0, dtype=np.int64)
+        nodes = np.zeros(len(queries), dtype=np.int64)
+        while len(nodes):
+            hit = (
+                (self.node_min[nodes] <= maxs[queries]).all(axis=1) &
+                (self.node_max[nodes] >= mins[queries]).all(axis=1)
+            )
+            nodes, queries = nodes[hit], queries[hit]
+            counts = self.node_item_count[nodes]
+            if counts.sum():
+                hit_rows.append(self.node_items[gather_ranges(self.node_item_start[nodes], counts)])
+                hit_queries.append(np.repeat(queries, counts))
+            counts = self.node_child_count[nodes]
+            queries = np.repeat(queries, counts)
+            nodes = gather_ranges(self.node_child_start[nodes], counts)
+
+        if self._pending:
+            pending = np.array(self._pending, dtype=np.int64)
+            hit_rows.append(np.tile(pending, len(mins)))
+            hit_queries.append(np.repeat(np.arange(len(mins)), len(pending)))
+        return hit_queries, hit_rows
+
+    def _query_pairs(self, mins, maxs, block_size=1024):
+        """Get the (query, row) pairs of live rows overlapping each query box."""
+        row_count = len(self._row_ids)
+        if row_count <= self.linear_scan_rows:
+            # Test blocks of query boxes against every live row
+            live = np.flatnonzero(self._alive[:row_count])
+            hit_queries, hit_rows = [], []
+            for start in range(0, len(mins), block_size):
+                hit = boxes_overlap_many(
+                    mins[start:start + block_size, None], maxs[start:start + block_size, None],
+                    self._mins[None, live], self._maxs[None, live]
+                )
+                query_hits, row_hits = np.nonzero(hit)
+                hit_queries.append(query_hits + start)
+                hit_rows.append(live[row_hits])
+        else:
+            hit_queries, hit_rows = self._walk(mins, maxs)
+            if hit_rows:
+                queries, rows = np.concatenate(hit_queries), np.concatenate(hit_rows)
+                keep = self._alive[rows] & boxes_overlap_many(
+                    mins[queries], maxs[queries], self._mins[rows], self._maxs[rows]
+                )
+                hit_queries, hit_rows = [queries[keep]], [rows[keep]]
+
+        if not hit_rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.concatenate(hit_queries), np.concatenate(hit_rows)
+
+    def query_box(self, min_point, max_point):
+        """Query all items that intersect with the given box."""
+        mins = np.asarray(min_point, dtype=np.float32).reshape(1, 3)
+        maxs = np.asarray(max_point, dtype=np.float32).reshape(1, 3)
+        _, rows = self._query_pairs(mins, maxs)
+        return [self.items[self._row_ids[row]] for row in rows]
+
+    def query_boxes(self, mins, maxs):
+        """Query many boxes at once; returns (indptr, items) like SpatialIndex.query_boxes.
+
+        Small indexes test blocks of query boxes against every row. Larger
+        ones walk the node arrays once with a frontier of (node, query)
+        pairs, so every level is a single vectorized test.
+        """
+        mins = np.asarray(mins, dtype=np.float32).reshape(-1, 3)
+        maxs = np.asarray(maxs, dtype=np.float32).reshape(-1, 3)
+        queries, rows = self._query_pairs(mins, maxs)
+        indptr, rows = pairs_to_csr(len(mins), queries, rows, len(self._row_ids))
+        return indptr, [self.items[self._row_ids[row]] for row in rows]
+
+    def _index_memory(self):
+        """Memory held by the box and node arrays, in bytes."""
+        arrays = (
+            self._mins, self._maxs, self._alive, self.node_min, self.node_max,
+            self.node_child_start, self.node_child_count,
+            self.node_item_start, self.node_item_count, self.node_items
+        )
+        snapshots = sum(sys.getsizeof(item) for item in self.items.values())
+        return (
+            sum(array.nbytes for array in arrays) + snapshots +
+            sys.getsizeof(self._rows) + sys.getsizeof(self._row_ids)
+        )
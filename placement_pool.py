@@ -0,0 +1,108 @@
+import hashlib
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+import numpy as np
+from grid_index import UniformGridIndex
+from snapshots import ContainerSnapshot, ItemSnapshot
+from spatial_index import COARSE_TO_FINE_SEARCH
+
+# Worker side: indexes of recently searched containers, by container id
+_worker_indexes = {}
+
+# Parent side: the shared pool and its size
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def pack_items(items):
+    """Pack the geometry of placed items into an (n, 7) array for a worker.
+
+    Columns are width, depth, height, x, y, z and rotated; ids and every
+    other field stay behind, since the free-space search only needs boxes.
+    """
+    rows = [
+        (item.width, item.depth, item.height, item.x_pos, item.y_pos, item.z_pos, float(bool(item.rotated)))
+        for item in items
+        if item.x_pos is not None and item.y_pos is not None and item.z_pos is not None
+    ]
+    return np.array(rows, dtype=float).reshape(-1, 7)
+
+
+def container_task(container, items):
+    """Build the picklable snapshot of a container that a worker searches."""
+    return ContainerSnapshot(container.id, container.width, container.depth, container.height), pack_items(items)
+
+
+def _worker_index(container, boxes):
+    """Get the worker's index of a container, rebuilding it only when the boxes changed."""
+    key = hashlib.blake2b(boxes.tobytes(), digest_size=16).digest()
+    cached = _worker_indexes.get(container.id)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    items = [ItemSnapshot(row, *boxes[row, :6], bool(boxes[row, 6]), container.id) for row in range(len(boxes))]
+    cell_size = float(np.median(boxes[:, :3].max(axis=1))) if len(boxes) else 20
+    index = UniformGridIndex(container, items=items, cell_size=max(cell_size, 1.0))
+    _worker_indexes[container.id] = (key, index)
+    return index
+
+
+def search_container(task, dimensions, mode, resolution, time_budget, expires=None):
+    """Worker entry point: find empty space in one container snapshot.
+
+    Returns (position, resolution) like SpatialIndex.find_space_coarse_to_fine;
+    the resolution is None for the other search modes. ``expires`` is the
+    wall-clock time (time.time()) the parent stops waiting at: a search
+    still queued then returns None without running, and a coarse-to-fine
+    search gets no more budget than the time left.
+    """
+    if expires is not None:
+        remaining = expires - time.time()
+        if remaining <= 0:
+            return None
+        time_budget = remaining if time_budget is None else min(time_budget, remaining)
+    container, boxes = task
+    index = _worker_index(container, boxes)
+    if mode == COARSE_TO_FINE_SEARCH:
+        return index.find_space_coarse_to_fine(*dimensions, min_resolution=resolution, time_budget=time_budget)
+    return index.find_empty_space(*dimensions, mode=mode), None
+
+
+def get_pool(workers):
+    """Get the process pool for placement searches, resized when the worker count changes."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers)
+            _pool_workers = workers
+        return _pool
+
+
+def search_containers(tasks, dimensions, mode, resolution, time_budget, workers, deadline=None):
+    """Search many container snapshots on the process pool.
+
+    Results come back in the order of ``tasks``, whichever worker finishes
+    first, so merging them gives the same answer as a sequential search.
+    With more containers than workers, each search gets the share of
+    ``time_budget`` that lets all of them finish within it. Searches not
+    finished after ``deadline`` seconds give None; the workers get the same
+    deadline and give up on them themselves, since a running future cannot
+    be cancelled.
+    """
+    budget = None
+    if time_budget is not None and tasks:
+        budget = time_budget * min(workers, len(tasks)) / len(tasks)
+    expires = time.time() + deadline if deadline is not None else None
+    pool = get_pool(workers)
+    futures = [
+        pool.submit(search_container, task, dimensions, mode, resolution, budget, expires)
+        for task in tasks
+    ]
+    if deadline is not None:
+        done, _ = wait(futures, timeout=deadline)
+        return [future.result() if future in done else None for future in futures]
+    return [future.result() for future in futures]
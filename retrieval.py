@@ -0,0 +1,196 @@
+import heapq
+import itertools
+import math
+import time
+import numpy as np
+from occupancy import item_bounds
+
+# Seconds the multi-item retrieval planner may search before settling for its best plan
+PLAN_TIME_BUDGET = 0.5
+
+
+class BlockingGraph:
+    """Which items block which others on their way out of one container.
+
+    Item A blocks item B when A overlaps the path B slides along to the open
+    face (y = 0): the column in front of B with B's x/z footprint. Every
+    blocker starts closer to the open face than the item it blocks, so the
+    graph is acyclic and front-to-back order is always a valid removal order.
+
+    The whole graph is built in one sweep from the open face backwards. The
+    footprints of the items swept so far are bucketed on a grid over the
+    x/z plane, so each item only tests the items in front of it whose
+    footprints share a bucket with its own.
+    """
+
+    def __init__(self, items):
+        placed = [
+            item for item in items
+            if item.x_pos is not None and item.y_pos is not None and item.z_pos is not None
+        ]
+        self.bounds = {item.id: item_bounds(item) for item in placed}
+        self.blockers = {item.id: [] for item in placed}  # id -> ids of its direct blockers
+        self.blocking = {item.id: [] for item in placed}  # id -> ids of the items it directly blocks
+        self._rank = {}  # id -> position in front-to-back order
+        self._sweep()
+
+    def _sweep(self):
+        """Find every direct blocker, visiting items in order of their front face."""
+        order = sorted(self.bounds, key=lambda item_id: self.bounds[item_id][0][1])
+        self._rank = {item_id: rank for rank, item_id in enumerate(order)}
+        edges = [max(hi[0] - lo[0], hi[2] - lo[2]) for lo, hi in self.bounds.values()]
+        cell_size = max(float(np.median(edges)), 1.0) if edges else 1.0
+
+        def face_cells(lo, hi):
+            return [
+                (i, k)
+                for i in range(math.floor(lo[0] / cell_size), math.ceil(hi[0] / cell_size))
+                for k in range(math.floor(lo[2] / cell_size), math.ceil(hi[2] / cell_size))
+            ]
+
+        face = {}  # (i, k) -> ids of the swept items whose footprints touch the bucket
+        start = 0
+        while start < len(order):
+            # Items sharing a front face cannot block each other, so query the
+            # whole group before adding any of it
+            front = self.bounds[order[start]][0][1]
+            stop = start
+            while stop < len(order) and self.bounds[order[stop]][0][1] == front:
+                stop += 1
+            group = order[start:stop]
+
+            if front > 0:
+                for item_id in group:
+                    lo, hi = self.bounds[item_id]
+                    candidates = {}
+                    for key in face_cells(lo, hi):
+                        candidates.update(face.get(key, {}))
+                    for other_id in sorted(candidates, key=self._rank.get):
+                        other_lo, other_hi = self.bounds[other_id]
+                        if (other_lo[0] < hi[0] and lo[0] < other_hi[0] and
+                                other_lo[2] < hi[2] and lo[2] < other_hi[2]):
+                            self.blockers[item_id].append(other_id)
+                            self.blocking[other_id].append(item_id)
+
+            for item_id in group:
+                for key in face_cells(*self.bounds[item_id]):
+                    face.setdefault(key, {})[item_id] = None
+            start = stop
+
+    def direct_blockers(self, item_id):
+        """Get the ids of the items directly in front of an item, front-most first."""
+        return list(self.blockers.get(item_id, []))
+
+    def transitive_blockers(self, item_id):
+        """Get the ids of every item that has to move before an item can come out."""
+        found = set()
+        stack = list(self.blockers.get(item_id, []))
+        while stack:
+            other_id = stack.pop()
+            if other_id not in found:
+                found.add(other_id)
+                stack.extend(self.blockers[other_id])
+        return found
+
+    def removal_order(self, item_id):
+        """Get the transitive blockers of an item in an order they can be taken out in."""
+        return sorted(self.transitive_blockers(item_id), key=self._rank.get)
+
+    def _plan_phase(self, targets, closures, done, target_id):
+        """Take out one target and everything still in front of it, then put back what is no longer needed.
+
+        ``done`` holds the targets already taken out. Returns the steps, the
+        targets done afterwards (other targets may stand in front of this
+        one) and how many non-target items were held out at once.
+        """
+        def needed_by(remaining):
+            return set().union(*(closures[t] for t in remaining)) - targets
+
+        # Items taken out for earlier targets stay out while a later one needs them
+        done = set(done)
+        held = needed_by(done) & needed_by(targets - done)
+        steps = []
+
+        # Front to back, so every item's blockers are already out when it is taken
+        for item_id in sorted(closures[target_id] - held - done, key=self._rank.get):
+            if item_id in targets:
+                steps.append({'action': 'retrieve', 'item_id': item_id})
+                done.add(item_id)
+            else:
+                steps.append({'action': 'remove', 'item_id': item_id})
+                held.add(item_id)
+        peak = len(held)
+
+        # Back to front, so nothing put back traps an item still out behind it
+        for item_id in sorted(held - needed_by(targets - done), key=self._rank.get, reverse=True):
+            steps.append({'action': 'place_back', 'item_id': item_id, 'position': list(self.bounds[item_id][0])})
+        return steps, frozenset(done), peak
+
+    def plan_retrieval(self, target_ids, time_budget=PLAN_TIME_BUDGET):
+        """Plan how to take several items out with the fewest moves.
+
+        Every item in front of a target comes out once and, unless it is a
+        target itself, goes back once as soon as no remaining target needs
+        it out. No item moves twice, so every plan built this way has the
+        minimum number of moves. Plans differ in how many items are held out
+        at once, which a best-first search over the order of the targets
+        minimizes. After ``time_budget`` seconds the search settles for the
+        front-to-back order. Targets that are not placed items of the
+        graph get no steps, so callers must check which were retrieved.
+
+        Returns a dict with the ordered 'steps', the number of 'moves', the
+        most items held out at once ('max_held'), and whether the plan is
+        known to be 'optimal'.
+        """
+        start = time.perf_counter()
+        targets = frozenset(target_id for target_id in target_ids if target_id in self.bounds)
+        closures = {target_id: self.transitive_blockers(target_id) | {target_id} for target_id in targets}
+
+        def plan(steps, peak, optimal):
+            return {'steps': steps, 'moves': len(steps), 'max_held': peak, 'optimal': optimal}
+
+        def bound(done, peak):
+            # Everything in front of a remaining target is out when it is taken
+            return max([peak] + [len(closures[t] - targets) for t in targets - done])
+
+        # Best-first over the sets of targets done, by the least possible peak
+        tie = itertools.count()
+        queue = [(bound(frozenset(), 0), 0, next(tie), frozenset(), 0, [])]
+        best_peak = {frozenset(): 0}
+        while queue:
+            _, _, _, done, peak, steps = heapq.heappop(queue)
+            if done == targets:
+                return plan(steps, peak, True)
+            if time.perf_counter() - start > time_budget:
+                break
+            for target_id in sorted(targets - done, key=self._rank.get):
+                phase_steps, next_done, phase_peak = self._plan_phase(targets, closures, done, target_id)
+                next_peak = max(peak, phase_peak)
+                if best_peak.get(next_done, math.inf) <= next_peak:
+                    continue
+                best_peak[next_done] = next_peak
+                heapq.heappush(queue, (
+                    bound(next_done, next_peak), -len(next_done), next(tie),
+                    next_done, next_peak, steps + phase_steps
+                ))
+
+        # Out of time: take the targets front to back
+        done, peak, steps = frozenset(), 0, []
+        for target_id in sorted(targets, key=self._rank.get):
+            if target_id not in done:
+                phase_steps, done, phase_peak = self._plan_phase(targets, closures, done, target_id)
+                steps += phase_steps
+                peak = max(peak, phase_peak)
+        return plan(steps, peak, False)
+
+    def to_dict(self):
+        """Describe the graph per item for the API."""
+        return {
+            item_id: {
+                'blocked_by': self.direct_blockers(item_id),
+                'blocks': list(self.blocking[item_id]),
+                'removal_order': self.removal_order(item_id)
+            }
+            for item_id in sorted(self.bounds, key=self._rank.get)
+        }
+
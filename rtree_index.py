@@ -0,0 +1,101 @@
+import math
+import numpy as np
+from packed_index import PackedIndex
+
+
+def str_order(centers, capacity):
+    """Sort-Tile-Recursive order of boxes for packing groups of ``capacity``.
+
+    Boxes are cut into slabs along x, each slab into runs along y, and each
+    run is sorted along z, so consecutive groups of ``capacity`` boxes are
+    spatially compact.
+    """
+    count = len(centers)
+    groups = max(1, math.ceil(count / capacity))
+    slabs = max(1, math.ceil(groups ** (1 / 3)))
+    slab_size = capacity * slabs * slabs
+    run_size = capacity * slabs
+
+    order = []
+    by_x = np.argsort(centers[:, 0], kind='stable')
+    for start in range(0, count, slab_size):
+        slab = by_x[start:start + slab_size]
+        slab = slab[np.argsort(centers[slab, 1], kind='stable')]
+        for run_start in range(0, len(slab), run_size):
+            run = slab[run_start:run_start + run_size]
+            order.append(run[np.argsort(centers[run, 2], kind='stable')])
+    return np.concatenate(order) if order else np.zeros(0, dtype=np.int64)
+
+
+class RTreeIndex(PackedIndex):
+    """Bounding volume hierarchy packed bottom-up with Sort-Tile-Recursive.
+
+    Leaves hold up to ``node_capacity`` item boxes and every inner node up to
+    ``node_capacity`` children, with bounds that fit their contents tightly.
+    Unlike the octrees the node bounds adapt to the items, which suits
+    containers with very uneven item sizes. See PackedIndex for the array
+    layout and how updates are buffered.
+    """
+
+    # The tight node bounds prune well enough to beat a flat scan early
+    linear_scan_rows = 64
+
+    def __init__(self, container, items=None, node_capacity=8):
+        self.node_capacity = node_capacity
+        super().__init__(container, items)
+
+    def options(self):
+        return {'node_capacity': self.node_capacity}
+
+    def _build_nodes(self, mins, maxs):
+        """Pack the leaves, then each level above, and number the nodes from the root down."""
+        capacity = self.node_capacity
+        if not len(mins):
+            limits = (self.container.width, self.container.depth, self.container.height)
+            return np.zeros((1, 3)), np.array([limits], dtype=float), [0], [0], np.zeros(0, dtype=np.int64)
+
+        # Leaf level: consecutive groups of boxes in STR order
+        order = str_order((mins + maxs) / 2, capacity)
+        starts = np.arange(0, len(order), capacity)
+        item_leaf = np.empty(len(order), dtype=np.int64)
+        item_leaf[order] = np.arange(len(order)) // capacity
+        levels = [{
+            'min': np.minimum.reduceat(mins[order], starts),
+            'max': np.maximum.reduceat(maxs[order], starts),
+            'child_start': np.zeros(len(starts), dtype=np.int64),
+            'child_count': np.zeros(len(starts), dtype=np.int64)
+        }]
+
+        # Upper levels: reorder the level below so each parent's children are contiguous
+        while len(levels[-1]['min']) > 1:
+            below = levels[-1]
+            order = str_order((below['min'] + below['max']) / 2, capacity)
+            for key in below:
+                below[key] = below[key][order]
+            if len(levels) == 1:
+                position = np.empty(len(order), dtype=np.int64)
+                position[order] = np.arange(len(order))
+                item_leaf = position[item_leaf]
+
+            starts = np.arange(0, len(order), capacity)
+            levels.append({
+                'min': np.minimum.reduceat(below['min'], starts),
+                'max': np.maximum.reduceat(below['max'], starts),
+                'child_start': starts,
+                'child_count': np.diff(np.append(starts, len(order)))
+            })
+
+        # Number the nodes level by level from the root
+        levels.reverse()
+        offsets = np.cumsum([0] + [len(level['min']) for level in levels])
+        child_start = np.concatenate([
+            level['child_start'] + (offsets[depth + 1] if depth + 1 < len(levels) else 0)
+            for depth, level in enumerate(levels)
+        ])
+        return (
+            np.concatenate([level['min'] for level in levels]),
+            np.concatenate([level['max'] for level in levels]),
+            child_start,
+            np.concatenate([level['child_count'] for level in levels]),
+            item_leaf + offsets[-2]
+        )
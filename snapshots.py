@@ -0,0 +1,46 @@
+class ContainerSnapshot:
+    """Detached copy of the container fields the spatial code reads."""
+    __slots__ = ('id', 'width', 'depth', 'height', 'zone_id')
+
+    def __init__(self, id, width, depth, height, zone_id=None):
+        self.id = id
+        self.width = width
+        self.depth = depth
+        self.height = height
+        self.zone_id = zone_id
+
+    @classmethod
+    def from_container(cls, container):
+        return cls(container.id, container.width, container.depth, container.height, container.zone_id)
+
+    def __repr__(self):
+        return f"<ContainerSnapshot {self.id}>"
+
+
+class ItemSnapshot:
+    """Detached copy of the item fields the spatial code reads.
+
+    Spatial indexes outlive the database session, so they hold these instead
+    of ORM objects, which would expire or detach after a commit.
+    """
+    __slots__ = ('id', 'width', 'depth', 'height', 'x_pos', 'y_pos', 'z_pos', 'rotated', 'container_id')
+
+    def __init__(self, id, width, depth, height, x_pos=None, y_pos=None, z_pos=None,
+                 rotated=False, container_id=None):
+        self.id = id
+        self.width = width
+        self.depth = depth
+        self.height = height
+        self.x_pos = x_pos
+        self.y_pos = y_pos
+        self.z_pos = z_pos
+        self.rotated = bool(rotated)
+        self.container_id = container_id
+
+    @classmethod
+    def from_item(cls, item):
+        return cls(item.id, item.width, item.depth, item.height,
+                   item.x_pos, item.y_pos, item.z_pos, item.rotated, item.container_id)
+
+    def __repr__(self):
+        return f"<ItemSnapshot {self.id}>"
@@ -0,0 +1,41 @@
+import numpy as np
+from octree import Octree
+from array_octree import ArrayOctree
+from grid_index import UniformGridIndex
+from rtree_index import RTreeIndex
+
+# Spatial index backends by configuration name; kept out of spatial_cache so
+# benchmarks can build indexes without the app and its database
+SPATIAL_BACKENDS = {
+    'octree': Octree,
+    'array_octree': ArrayOctree,
+    'grid': UniformGridIndex,
+    'rtree': RTreeIndex,
+}
+
+# Mean cells an item may be listed in before the grid's memory and updates outgrow its faster queries
+GRID_MAX_CELLS_PER_ITEM = 64
+
+
+def choose_backend(container, items):
+    """Pick a spatial index backend for a container from its items.
+    
+    The app issues single query_box calls and per-item updates, and
+    benchmark_spatial_index.py shows the hash grid answering those fastest
+    in every scenario, mixed sizes included. Only when big items would each
+    be listed in many cells, bloating the cell map and every insert and
+    removal, does the container get the packed octree instead. Returns the
+    backend name and its constructor options.
+    """
+    dimensions = np.array([
+        (item.width, item.depth, item.height) for item in items
+        if item.x_pos is not None
+    ], dtype=float).reshape(-1, 3)
+    if not len(dimensions):
+        return 'grid', {}
+    
+    cell_size = max(float(np.median(dimensions.max(axis=1))), 1.0)
+    cells_per_item = float(np.prod(np.ceil(dimensions / cell_size) + 1, axis=1).mean())
+    if cells_per_item <= GRID_MAX_CELLS_PER_ITEM:
+        return 'grid', {'cell_size': cell_size}
+    return 'array_octree', {}
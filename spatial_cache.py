@@ -0,0 +1,243 @@
+import threading
+from app import app, logger
+from models import Item
+from retrieval import BlockingGraph
+from capacity import CapacitySummary
+from snapshots import ContainerSnapshot, ItemSnapshot
+from spatial_db import get_container_versions
+from spatial_backends import SPATIAL_BACKENDS, choose_backend
+
+
+def create_index(container, items, backend=None):
+    """Build the spatial index of a container with the configured or chosen backend.
+    
+    ``backend`` defaults to the SPATIAL_INDEX_BACKEND setting; 'auto' picks
+    one per container with choose_backend.
+    """
+    backend = backend or app.config.get('SPATIAL_INDEX_BACKEND', 'auto')
+    options = {}
+    if backend == 'auto':
+        backend, options = choose_backend(container, items)
+    if backend not in SPATIAL_BACKENDS:
+        raise ValueError(f"Unknown spatial index backend: {backend}")
+    return SPATIAL_BACKENDS[backend](container, items=items, **options)
+
+
+def build_index(container):
+    """Build a container's index from its item rows as this transaction sees them, bypassing the cache."""
+    return create_index(
+        ContainerSnapshot.from_container(container),
+        [ItemSnapshot.from_item(item) for item in Item.query.filter_by(container_id=container.id)]
+    )
+
+
+class CacheEntry:
+    """A built octree, its blocking graph once needed, and the container version they reflect."""
+    __slots__ = ('octree', 'graph', 'version')
+
+    def __init__(self, octree, version):
+        self.octree = octree
+        self.graph = None
+        self.version = version
+
+
+class SpatialIndexCache:
+    """Process-level cache of built octrees, keyed by container id.
+
+    Every transaction that changes a container's contents bumps that
+    container's version in the database (see spatial_db). A cached tree is
+    served only while its version matches the database's, so writes made by
+    other processes are noticed on the next lookup. Writes made through this
+    process are applied to the cached tree in place when it was current
+    just before them. Trees hold ItemSnapshot objects, never ORM instances.
+
+    Cached trees may lag behind a concurrent write, so they serve searches
+    and read-only views; write paths validate against build_index instead.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._entries = {}
+        self._capacities = {}  # container id -> (version, CapacitySummary)
+        self.hits = 0
+        self.rebuilds = 0
+        self.incremental_updates = 0
+
+    def version(self, container_id):
+        """Get the current version of a container's contents."""
+        return get_container_versions([container_id])[container_id]
+
+    def get_octree(self, container):
+        """Get the octree of a container, building it only if it is missing or stale."""
+        return self.get_octrees([container])[container.id]
+
+    def get_octrees(self, containers, versions=None):
+        """Get the octrees of several containers by id, reading their versions in one query.
+        
+        ``versions`` may pass in container versions the caller has just
+        read, so a search checks its capacities and trees against one read.
+        """
+        with self._lock:
+            if versions is None:
+                versions = get_container_versions([container.id for container in containers])
+            octrees = {}
+            for container in containers:
+                version = versions[container.id]
+                entry = self._entries.get(container.id)
+                if entry is not None and entry.version == version:
+                    self.hits += 1
+                    octrees[container.id] = entry.octree
+                    continue
+                
+                octrees[container.id] = build_index(container)
+                self._entries[container.id] = CacheEntry(octrees[container.id], version)
+                self.rebuilds += 1
+                logger.debug(f"Built spatial index for container {container.id} (version {version})")
+            return octrees
+
+    def get_capacities(self, containers, versions=None):
+        """Get the capacity summaries of containers, by container id.
+        
+        Stale summaries are rebuilt from the cached octree when it is
+        current, and otherwise from one query over all their items, so no
+        octree gets built just to summarize a container. ``versions`` works
+        as in get_octrees.
+        """
+        with self._lock:
+            if versions is None:
+                versions = get_container_versions([container.id for container in containers])
+            summaries, stale = {}, {}
+            for container in containers:
+                version = versions[container.id]
+                cached = self._capacities.get(container.id)
+                entry = self._entries.get(container.id)
+                if cached is not None and cached[0] == version:
+                    summaries[container.id] = cached[1]
+                elif entry is not None and entry.version == version:
+                    summaries[container.id] = CapacitySummary(container, entry.octree.items.values())
+                else:
+                    stale[container.id] = container
+            
+            if stale:
+                contents = {container_id: [] for container_id in stale}
+                for item in Item.query.filter(Item.container_id.in_(list(stale))).all():
+                    contents[item.container_id].append(ItemSnapshot.from_item(item))
+                for container_id, container in stale.items():
+                    summaries[container_id] = CapacitySummary(container, contents[container_id])
+            
+            for container in containers:
+                self._capacities[container.id] = (versions[container.id], summaries[container.id])
+            return summaries
+
+    def get_blocking_graph(self, container):
+        """Get the blocking graph of a container, built from its current octree's items."""
+        with self._lock:
+            octree = self.get_octree(container)
+            entry = self._entries[container.id]
+            if entry.graph is None:
+                entry.graph = BlockingGraph(octree.items.values())
+            return entry.graph
+
+    def items_committed(self, removed=(), placed=()):
+        """Record the item changes of one committed transaction.
+        
+        ``removed`` holds (container id, item id) pairs and ``placed`` item
+        snapshots. That transaction bumped each changed container's version
+        once, so a cached tree or summary exactly one version behind missed
+        only these changes and is updated in place; anything older was also
+        changed elsewhere and is rebuilt on its next lookup.
+        """
+        changes = {}
+        for container_id, item_id in removed:
+            if container_id is not None:
+                changes.setdefault(container_id, ([], []))[0].append(item_id)
+        for snapshot in placed:
+            changes.setdefault(snapshot.container_id, ([], []))[1].append(snapshot)
+        if not changes:
+            return
+        
+        with self._lock:
+            versions = get_container_versions(list(changes))
+            for container_id, (removed_ids, snapshots) in changes.items():
+                version = versions[container_id]
+                entry = self._entries.get(container_id)
+                if entry is not None and entry.version == version - 1:
+                    for item_id in removed_ids:
+                        entry.octree.remove(item_id)
+                    for snapshot in snapshots:
+                        entry.octree.insert(snapshot)
+                    entry.graph = None
+                    entry.version = version
+                    self.incremental_updates += 1
+                capacity = self._capacities.get(container_id)
+                if capacity is not None and capacity[0] == version - 1:
+                    for item_id in removed_ids:
+                        capacity[1].remove(item_id)
+                    for snapshot in snapshots:
+                        capacity[1].add(snapshot)
+                    self._capacities[container_id] = (version, capacity[1])
+
+    def clear(self):
+        """Drop every cached tree and reset the statistics."""
+        with self._lock:
+            self._entries.clear()
+            self._capacities.clear()
+            self.hits = self.rebuilds = self.incremental_updates = 0
+
+    def stats(self):
+        """Summarize cache usage and memory."""
+        with self._lock:
+            versions = get_container_versions(list(self._entries))
+            containers = {
+                container_id: {
+                    'version': entry.version,
+                    'current': entry.version == versions[container_id],
+                    'backend': type(entry.octree).__name__,
+                    'items': len(entry.octree.items),
+                    'memory_bytes': entry.octree.memory_usage()
+                }
+                for container_id, entry in self._entries.items()
+            }
+            return {
+                'hits': self.hits,
+                'rebuilds': self.rebuilds,
+                'incremental_updates': self.incremental_updates,
+                'cached_containers': len(containers),
+                'memory_bytes': sum(c['memory_bytes'] for c in containers.values()),
+                'containers': containers
+            }
+
+
+_cache = SpatialIndexCache()
+
+def get_octree(container):
+    """Get the cached octree of a container (see SpatialIndexCache.get_octree)."""
+    return _cache.get_octree(container)
+
+def get_octrees(containers, versions=None):
+    """Get the cached octrees of several containers by id (see SpatialIndexCache.get_octrees)."""
+    return _cache.get_octrees(containers, versions)
+
+def get_blocking_graph(container):
+    """Get the cached blocking graph of a container (see retrieval.BlockingGraph)."""
+    return _cache.get_blocking_graph(container)
+
+def get_capacities(containers, versions=None):
+    """Get the cached capacity summaries of containers (see capacity.CapacitySummary)."""
+    return _cache.get_capacities(containers, versions)
+
+def container_version(container_id):
+    """Get the current version of a container's contents."""
+    return _cache.version(container_id)
+
+def notify_items_committed(removed=(), placed=()):
+    """Tell the cache which items one commit took out of and put into containers."""
+    _cache.items_committed(removed, placed)
+
+def cache_stats():
+    """Get hit, rebuild and memory statistics for the cache."""
+    return _cache.stats()
+
+def clear_cache():
+    """Drop all cached trees, e.g. after the database was reset."""
+    _cache.clear()
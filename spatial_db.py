@@ -0,0 +1,253 @@
+import math
+from sqlalchemy import event, inspect, or_, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from app import db, logger
+from models import ContainerVersion, Item, ItemBox, ItemBlocker
+from occupancy import item_bounds
+
+RTREE_TABLE = 'item_rtree'
+
+# Item columns that change the mirrored box
+GEOMETRY_FIELDS = ('container_id', 'x_pos', 'y_pos', 'z_pos', 'width', 'depth', 'height', 'rotated')
+
+# Database URL -> whether the R*Tree table exists there
+_rtree_enabled = {}
+
+
+def rtree_enabled(connection):
+    """Check whether the database behind a connection has the R*Tree mirror."""
+    key = str(connection.engine.url)
+    if key not in _rtree_enabled:
+        _rtree_enabled[key] = connection.dialect.name == 'sqlite' and connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': RTREE_TABLE}
+        ).first() is not None
+    return _rtree_enabled[key]
+
+
+@event.listens_for(ItemBox.__table__, 'after_create')
+def create_rtree(target, connection, **kw):
+    """Create the R*Tree table next to item_boxes when SQLite supports it."""
+    if connection.dialect.name != 'sqlite':
+        return
+    try:
+        connection.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {RTREE_TABLE} "
+            "USING rtree(id, min_x, max_x, min_y, max_y, min_z, max_z)"
+        ))
+        _rtree_enabled[str(connection.engine.url)] = True
+    except OperationalError as e:
+        logger.warning(f"SQLite R*Tree module unavailable, using B-tree range queries: {str(e)}")
+        _rtree_enabled[str(connection.engine.url)] = False
+
+
+@event.listens_for(ItemBox.__table__, 'after_drop')
+def drop_rtree(target, connection, **kw):
+    """Drop the R*Tree table together with item_boxes."""
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text(f"DROP TABLE IF EXISTS {RTREE_TABLE}"))
+    _rtree_enabled.pop(str(connection.engine.url), None)
+
+
+def delete_item_box(connection, item_id):
+    """Remove an item's mirrored box and its blocking edges."""
+    connection.execute(ItemBlocker.__table__.delete().where(
+        or_(ItemBlocker.item_id == item_id, ItemBlocker.blocker_id == item_id)
+    ))
+    if rtree_enabled(connection):
+        connection.execute(
+            text(f"DELETE FROM {RTREE_TABLE} WHERE id IN (SELECT id FROM item_boxes WHERE item_id = :item_id)"),
+            {'item_id': item_id}
+        )
+    connection.execute(ItemBox.__table__.delete().where(ItemBox.item_id == item_id))
+
+
+def write_item_box(connection, item):
+    """Replace an item's mirrored box and blocking edges with its current ones, if it is placed.
+
+    Only the items whose front-face projections overlap the item's get
+    new edges: those in front of it block it, and it blocks those behind.
+    """
+    delete_item_box(connection, item.id)
+    if item.container_id is None or item.x_pos is None or item.y_pos is None or item.z_pos is None:
+        return
+
+    (min_x, min_y, min_z), (max_x, max_y, max_z) = item_bounds(item)
+    box = {
+        'min_x': min_x, 'max_x': max_x,
+        'min_y': min_y, 'max_y': max_y,
+        'min_z': min_z, 'max_z': max_z
+    }
+    result = connection.execute(
+        ItemBox.__table__.insert().values(item_id=item.id, container_id=item.container_id, **box)
+    )
+    if rtree_enabled(connection):
+        connection.execute(
+            text(f"INSERT INTO {RTREE_TABLE} VALUES (:id, :min_x, :max_x, :min_y, :max_y, :min_z, :max_z)"),
+            {'id': result.inserted_primary_key[0], **box}
+        )
+
+    blocked_ids = find_overlapping_item_ids(
+        item.container_id, (min_x, min_y, min_z), (max_x, math.inf, max_z),
+        exclude_item_id=item.id, behind_y=min_y, connection=connection
+    )
+    edges = [{'item_id': item.id, 'blocker_id': blocker_id}
+             for blocker_id in find_blocking_item_ids(item, connection=connection)]
+    edges += [{'item_id': blocked_id, 'blocker_id': item.id} for blocked_id in blocked_ids]
+    if edges:
+        connection.execute(ItemBlocker.__table__.insert(), edges)
+
+
+@event.listens_for(Item, 'after_insert')
+def item_inserted(mapper, connection, item):
+    write_item_box(connection, item)
+
+
+@event.listens_for(Item, 'after_update')
+def item_updated(mapper, connection, item):
+    state = inspect(item)
+    if any(state.attrs[field].history.has_changes() for field in GEOMETRY_FIELDS):
+        write_item_box(connection, item)
+
+
+@event.listens_for(Item, 'before_delete')
+def item_deleted(mapper, connection, item):
+    delete_item_box(connection, item.id)
+
+
+def changed_container_ids(item, deleted=False):
+    """Get the containers whose contents a pending insert, update or delete of an item changes."""
+    state = inspect(item)
+    if not deleted and state.persistent and \
+       not any(state.attrs[field].history.has_changes() for field in GEOMETRY_FIELDS):
+        return set()
+    history = state.attrs.container_id.history
+    return {container_id for container_id in (*history.added, *history.unchanged, *history.deleted)
+            if container_id is not None}
+
+
+@event.listens_for(Session, 'before_flush')
+def bump_container_versions(session, flush_context, instances):
+    """Bump the version of every container whose items a flush changes, once per transaction.
+
+    The bump is written in the same transaction as the items, so once it
+    commits every process sees that its cached indexes of the container
+    are stale.
+    """
+    changed = set()
+    for item in session.new:
+        if isinstance(item, Item) and item.container_id is not None:
+            changed.add(item.container_id)
+    for item in session.dirty:
+        if isinstance(item, Item):
+            changed |= changed_container_ids(item)
+    for item in session.deleted:
+        if isinstance(item, Item):
+            changed |= changed_container_ids(item, deleted=True)
+
+    bumped = session.info.setdefault('bumped_containers', set())
+    changed -= bumped
+    if not changed:
+        return
+    connection = session.connection()
+    table = ContainerVersion.__table__
+    for container_id in sorted(changed):
+        result = connection.execute(
+            table.update().where(table.c.container_id == container_id).values(version=table.c.version + 1)
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(container_id=container_id, version=1))
+    bumped |= changed
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def forget_bumped_containers(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('bumped_containers', None)
+
+
+def get_container_versions(container_ids):
+    """Look up the versions of containers; returns a dict of container id -> version."""
+    versions = {container_id: 0 for container_id in container_ids}
+    if versions:
+        for row in ContainerVersion.query.filter(ContainerVersion.container_id.in_(list(versions))):
+            versions[row.container_id] = row.version
+    return versions
+
+
+def rebuild_item_boxes():
+    """Rebuild the whole mirror from the items table, e.g. for a database created before it existed."""
+    connection = db.session.connection()
+    if rtree_enabled(connection):
+        connection.execute(text(f"DELETE FROM {RTREE_TABLE}"))
+    connection.execute(ItemBlocker.__table__.delete())
+    connection.execute(ItemBox.__table__.delete())
+    placed = Item.query.filter(Item.container_id.isnot(None)).all()
+    for item in placed:
+        write_item_box(connection, item)
+    db.session.commit()
+    logger.info(f"Rebuilt {len(placed)} mirrored item boxes")
+
+
+def find_overlapping_item_ids(container_id, box_min, box_max, exclude_item_id=None, behind_y=None,
+                              connection=None):
+    """Get the ids of the items in a container whose boxes overlap a box.
+
+    Boxes are half-open, so touching faces do not overlap. The R*Tree stores
+    coordinates rounded outwards to 32-bit floats, so its candidates are
+    checked again against the exact bounds in item_boxes. ``behind_y`` keeps
+    only items whose front face lies behind it. Mapper events pass their
+    own ``connection``; everyone else uses the session's.
+    """
+    params = {
+        'container_id': container_id,
+        'min_x': box_min[0], 'min_y': box_min[1], 'min_z': box_min[2],
+        'max_x': box_max[0], 'max_y': box_max[1], 'max_z': box_max[2]
+    }
+    exact = (
+        "b.container_id = :container_id "
+        "AND b.min_x < :max_x AND b.max_x > :min_x "
+        "AND b.min_y < :max_y AND b.max_y > :min_y "
+        "AND b.min_z < :max_z AND b.max_z > :min_z"
+    )
+    if exclude_item_id is not None:
+        exact += " AND b.item_id != :exclude_item_id"
+        params['exclude_item_id'] = exclude_item_id
+    if behind_y is not None:
+        exact += " AND b.min_y > :behind_y"
+        params['behind_y'] = behind_y
+
+    if connection is None:
+        connection = db.session.connection()
+    if rtree_enabled(connection):
+        query = (
+            f"SELECT b.item_id FROM {RTREE_TABLE} r JOIN item_boxes b ON b.id = r.id "
+            "WHERE r.min_x < :max_x AND r.max_x > :min_x "
+            "AND r.min_y < :max_y AND r.max_y > :min_y "
+            "AND r.min_z < :max_z AND r.max_z > :min_z "
+            f"AND {exact}"
+        )
+    else:
+        query = f"SELECT b.item_id FROM item_boxes b WHERE {exact}"
+    return [row[0] for row in connection.execute(text(query), params)]
+
+
+def find_blocking_item_ids(item, connection=None):
+    """Get the ids of the items between a placed item and the container's open face."""
+    (min_x, min_y, min_z), (max_x, _, max_z) = item_bounds(item)
+    if min_y <= 0:
+        return []
+    return find_overlapping_item_ids(
+        item.container_id, (min_x, 0, min_z), (max_x, min_y, max_z),
+        exclude_item_id=item.id, connection=connection
+    )
+
+
+def get_blocker_ids(item_ids):
+    """Look up the mirrored blockers of many items; returns a dict of item id -> blocker ids."""
+    blockers = {item_id: [] for item_id in item_ids}
+    if blockers:
+        for edge in ItemBlocker.query.filter(ItemBlocker.item_id.in_(list(blockers))).order_by(ItemBlocker.blocker_id):
+            blockers[edge.item_id].append(edge.blocker_id)
+    return blockers
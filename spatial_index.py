@@ -0,0 +1,565 @@
+import math
+import sys
+import time
+import numpy as np
+from occupancy import OccupancyGrid, DEFAULT_RESOLUTION, FINE_RESOLUTION, MAX_PASS_CELLS, item_bounds, resolution_levels
+from snapshots import ItemSnapshot
+
+# Placement search modes for SpatialIndex.find_empty_space
+GRID_SEARCH = 'grid'                      # every origin on the occupancy grid
+EXTREME_POINT_SEARCH = 'extreme_points'   # only corners created by placed items
+FRONT_FIRST_SEARCH = 'front_first'        # grid origins layer by layer from the open face
+COARSE_TO_FINE_SEARCH = 'coarse_to_fine'  # successively finer grids down to a minimum resolution
+PATTERN_SEARCH = 'pattern'                # next slot of a cached block for identical items
+PLACEMENT_MODES = (GRID_SEARCH, EXTREME_POINT_SEARCH, FRONT_FIRST_SEARCH, COARSE_TO_FINE_SEARCH, PATTERN_SEARCH)
+
+
+def boxes_overlap(a_min, a_max, b_min, b_max):
+    """Check if box a overlaps the half-open box b (touching faces do not count).
+    
+    Box a may be flat along an axis (e.g. a ray or a point); it then overlaps
+    when its coordinate lies inside b's half-open extent on that axis.
+    """
+    for axis in range(3):
+        if a_min[axis] == a_max[axis]:
+            if not b_min[axis] <= a_min[axis] < b_max[axis]:
+                return False
+        elif not (a_min[axis] < b_max[axis] and b_min[axis] < a_max[axis]):
+            return False
+    return True
+
+
+def boxes_overlap_many(a_mins, a_maxs, b_mins, b_maxs):
+    """Vectorized boxes_overlap over broadcastable arrays of boxes.
+    
+    The last axis holds the x, y and z coordinates; the result has the
+    broadcast shape without it.
+    """
+    a_mins, a_maxs = np.asarray(a_mins), np.asarray(a_maxs)
+    b_mins, b_maxs = np.asarray(b_mins), np.asarray(b_maxs)
+    hit = np.where(
+        a_mins == a_maxs,
+        (b_mins <= a_mins) & (a_mins < b_maxs),
+        (a_mins < b_maxs) & (b_mins < a_maxs)
+    )
+    return hit.all(axis=-1)
+
+
+def pairs_to_csr(query_count, queries, rows, row_count):
+    """Turn (query, row) hit pairs into CSR form, dropping duplicates.
+    
+    Returns (indptr, rows): the rows hit by query i are
+    rows[indptr[i]:indptr[i + 1]], in ascending order.
+    """
+    width = max(row_count, 1)
+    keys = np.unique(np.asarray(queries, dtype=np.int64) * width + np.asarray(rows, dtype=np.int64))
+    indptr = np.searchsorted(keys // width, np.arange(query_count + 1))
+    return indptr, keys % width
+
+
+def segment_ranges(starts, counts):
+    """Concatenate the index ranges starts[i]:starts[i] + counts[i] into one array."""
+    return np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+
+
+def column_pairs(mins, maxs, points, axis, cell_size):
+    """Pair points with the boxes whose cross-section across ``axis`` may hold them.
+    
+    Boxes are bucketed on a grid of ``cell_size`` over the other two axes
+    and every point is paired with the boxes of its own bucket, so a point
+    only meets the boxes of its column. Callers still test the pairs
+    exactly. Returns (point rows, box rows).
+    """
+    cross = [other for other in range(3) if other != axis]
+    low = np.floor(mins[:, cross] / cell_size).astype(np.int64)
+    high = np.maximum(np.ceil(maxs[:, cross] / cell_size).astype(np.int64) - 1, low)
+    point_cells = np.floor(points[:, cross] / cell_size).astype(np.int64)
+    base = min(low.min(axis=0, initial=0).min(), point_cells.min(axis=0, initial=0).min())
+    stride = max(high[:, 1].max(initial=0), point_cells[:, 1].max(initial=0)) - base + 1
+    
+    # One (cell, box) entry per cell a box's cross-section covers, sorted by cell
+    spans = high - low + 1
+    counts = spans[:, 0] * spans[:, 1]
+    rows = np.repeat(np.arange(len(mins)), counts)
+    offsets = segment_ranges(np.zeros(len(mins), dtype=np.int64), counts)
+    keys = (low[rows, 0] + offsets // spans[rows, 1] - base) * stride + low[rows, 1] + offsets % spans[rows, 1] - base
+    order = np.argsort(keys, kind='stable')
+    keys, rows = keys[order], rows[order]
+    
+    point_keys = (point_cells[:, 0] - base) * stride + point_cells[:, 1] - base
+    starts = np.searchsorted(keys, point_keys, side='left')
+    counts = np.searchsorted(keys, point_keys, side='right') - starts
+    return np.repeat(np.arange(len(points)), counts), rows[segment_ranges(starts, counts)]
+
+
+class SlotPattern:
+    """Free slots for identical items, laid out as a block grown from one free spot.
+    
+    Slots run side by side along x, and rows of them stack along z; ``used``
+    counts the slots already taken, in that order.
+    """
+    __slots__ = ('origin', 'size', 'rotated', 'columns', 'count', 'used')
+    
+    def __init__(self, origin, size, rotated, columns, count):
+        self.origin = origin
+        self.size = size
+        self.rotated = rotated
+        self.columns = columns
+        self.count = count
+        self.used = 0
+    
+    @property
+    def exhausted(self):
+        return self.used >= self.count
+    
+    def slot_box(self, slot):
+        """Get the (min, max) corners of a slot."""
+        (x, y, z), (width, depth, height) = self.origin, self.size
+        slot_min = (x + (slot % self.columns) * width, y, z + (slot // self.columns) * height)
+        return slot_min, (slot_min[0] + width, y + depth, slot_min[2] + height)
+    
+    def next_position(self):
+        """Get the (x, y, z, rotated) of the next free slot."""
+        return self.slot_box(self.used)[0] + (self.rotated,)
+    
+    def item_inserted(self, box_min, box_max):
+        """Account for an inserted item; returns False if it spoils the remaining slots."""
+        if tuple(box_min) == self.slot_box(self.used)[0] and tuple(box_max) == self.slot_box(self.used)[1]:
+            self.used += 1
+            return True
+        (x, y, z), (width, depth, height) = self.origin, self.size
+        layers = -(-self.count // self.columns)
+        return not boxes_overlap(
+            box_min, box_max, self.origin,
+            (x + self.columns * width, y + depth, z + layers * height)
+        )
+
+
+class SpatialIndex:
+    """Spatial index over the items in one container.
+    
+    This is the interface every backend offers: insert, remove, move,
+    query_box, query_boxes and find_empty_space, plus the retrieval path
+    helpers. The base class keeps the item records, their bounds, the
+    occupancy grid and the extreme points, so the free-space searches are
+    shared by all backends. A backend only provides the structure that
+    answers box queries, through the _reset_index, _index_insert,
+    _index_remove and _index_memory hooks and query_box.
+    """
+    
+    def __init__(self, container, items=None):
+        """Initialize an index for a container.
+        
+        The container's items are loaded from the database unless ``items``
+        is given.
+        """
+        self.container = container
+        
+        # Insert all items in the container
+        self.rebuild(items)
+    
+    def rebuild(self, items=None):
+        """Rebuild the index with all items in the container."""
+        self._reset_index()
+        self.items = {}
+        self.bounds = {}  # item id -> (min, max) corners of placed items
+        self._occupancy = None
+        self._extreme_points = None
+        self._patterns = {}  # (width, depth, height, consider_rotation) -> SlotPattern
+        
+        # Insert all items
+        if items is None:
+            # Imported here so placement workers can build indexes without the app
+            from models import Item
+            items = Item.query.filter_by(container_id=self.container.id).all()
+        self._bulk_load(list(items))
+    
+    def _bulk_load(self, items):
+        """Load items into the empty index; backends may build their structure in one pass."""
+        for item in items:
+            self.insert(item)
+    
+    def copy(self):
+        """Create an independent index over the same items, e.g. for tentative placements."""
+        return type(self)(self.container, items=list(self.items.values()), **self.options())
+    
+    def options(self):
+        """Get the constructor options of this backend, used by copy."""
+        return {}
+    
+    def memory_usage(self):
+        """Estimate the memory held by the index and its occupancy grid, in bytes."""
+        total = sys.getsizeof(self.items) + sys.getsizeof(self.bounds) + self._index_memory()
+        if self._occupancy is not None:
+            total += self._occupancy.nbytes
+        return total
+    
+    def insert(self, item):
+        """Insert an item into the index, replacing any earlier entry with the same id."""
+        if item.id in self.items:
+            self.remove(item.id)
+        self.items[item.id] = item
+        if item.x_pos is not None and item.y_pos is not None and item.z_pos is not None:
+            self.bounds[item.id] = item_bounds(item)
+        if self._occupancy is not None:
+            self._occupancy.add_item(item)
+        if item.id in self.bounds:
+            for key, pattern in list(self._patterns.items()):
+                if not pattern.item_inserted(*self.bounds[item.id]):
+                    del self._patterns[key]
+        inserted = self._index_insert(item)
+        if self._extreme_points is not None:
+            self._add_extreme_points(item)
+        return inserted
+    
+    @property
+    def occupancy(self):
+        """Occupancy grid of the container, rasterized on first use and kept in sync by insert."""
+        if self._occupancy is None:
+            self._occupancy = OccupancyGrid.from_items(self.container, self.items.values(), resolution=DEFAULT_RESOLUTION)
+        return self._occupancy
+    
+    @property
+    def extreme_points(self):
+        """Candidate origins created by the corners of placed items, built on first use."""
+        if self._extreme_points is None:
+            self._extreme_points = self._build_extreme_points()
+        return self._extreme_points
+    
+    def _build_extreme_points(self):
+        """Compute the extreme points of every placed item at once.
+        
+        Same corners and projections as _add_extreme_points, worked out
+        with array operations over all items: each corner is only tested
+        against the items in its column (see column_pairs). Points inside
+        any item are dropped at the end rather than after each item.
+        """
+        if not self.bounds:
+            return {(0, 0, 0)}
+        limits = np.array([self.container.width, self.container.depth, self.container.height], dtype=float)
+        mins = np.array([box[0] for box in self.bounds.values()], dtype=float)
+        maxs = np.array([box[1] for box in self.bounds.values()], dtype=float)
+        cell_size = max(float(np.median(maxs - mins)), 1.0)
+        
+        # Each far corner of each item, projected towards the origin along both other axes
+        corners = []
+        for axis in range(3):
+            corner = mins.copy()
+            corner[:, axis] = maxs[:, axis]
+            corners.append(corner[corner[:, axis] < limits[axis]])
+        candidates = [np.zeros((1, 3)), np.concatenate(corners)]
+        for axis in range(3):
+            rays = np.concatenate([corner for other, corner in enumerate(corners) if other != axis])
+            # A ray stops at the farthest face it reaches, as in _project
+            ray_rows, item_rows = column_pairs(mins, maxs, rays, axis, cell_size)
+            cross = [other for other in range(3) if other != axis]
+            faces = maxs[item_rows, axis]
+            hit = (
+                (mins[item_rows][:, cross] <= rays[ray_rows][:, cross]).all(axis=1) &
+                (rays[ray_rows][:, cross] < maxs[item_rows][:, cross]).all(axis=1) &
+                (faces <= rays[ray_rows, axis])
+            )
+            stops = np.zeros(len(rays))
+            np.maximum.at(stops, ray_rows[hit], faces[hit])
+            projected = rays.copy()
+            projected[:, axis] = stops
+            candidates.append(projected)
+        candidates = np.unique(np.concatenate(candidates), axis=0)
+        
+        # Points inside an item can never host another one
+        point_rows, item_rows = column_pairs(mins, maxs, candidates, 1, cell_size)
+        inside = (
+            (mins[item_rows] <= candidates[point_rows]) & (candidates[point_rows] < maxs[item_rows])
+        ).all(axis=1)
+        swallowed = np.zeros(len(candidates), dtype=bool)
+        swallowed[point_rows[inside]] = True
+        return set(map(tuple, candidates[~swallowed].tolist()))
+    
+    def _project(self, point, axis):
+        """Slide a point towards the origin along one axis until it hits an item or the wall."""
+        ray_min = list(point)
+        ray_min[axis] = 0
+        stop = 0
+        for other in self.query_box(ray_min, point):
+            other_max = item_bounds(other)[1]
+            if stop < other_max[axis] <= point[axis]:
+                stop = other_max[axis]
+        return stop
+    
+    def _add_extreme_points(self, item):
+        """Update the extreme point set after an item has been placed."""
+        if item.x_pos is None or item.y_pos is None or item.z_pos is None:
+            return
+        item_min, item_max = item_bounds(item)
+        limits = (self.container.width, self.container.depth, self.container.height)
+        
+        # Each far corner of the item, plus its projections onto the items behind it
+        for axis in range(3):
+            corner = list(item_min)
+            corner[axis] = item_max[axis]
+            if corner[axis] >= limits[axis]:
+                continue
+            self._extreme_points.add(tuple(corner))
+            for other in range(3):
+                if other != axis:
+                    projected = list(corner)
+                    projected[other] = self._project(corner, other)
+                    self._extreme_points.add(tuple(projected))
+        
+        # Points swallowed by the new item can never host another one
+        self._extreme_points = {
+            point for point in self._extreme_points
+            if not all(item_min[a] <= point[a] < item_max[a] for a in range(3))
+        }
+    
+    def remove(self, item_id):
+        """Remove an item from the index.
+        
+        Returns the removed item, or None if it was not in the index.
+        """
+        item = self.items.pop(item_id, None)
+        if item is None:
+            return None
+        
+        bounds = self.bounds.pop(item_id, None)
+        if self._occupancy is not None and bounds is not None:
+            self._occupancy.remove_box(*bounds)
+        if self._extreme_points is not None and bounds is not None:
+            # The freed corner can host a new item
+            self._extreme_points.add(tuple(bounds[0]))
+        
+        self._index_remove(item_id)
+        return item
+    
+    def move(self, item_id, new_pose):
+        """Move an item to a new (x, y, z, rotated) pose within the container.
+        
+        The index stores a snapshot at the new pose; the original item object
+        is left untouched. Returns False if the item is not in the index.
+        """
+        item = self.remove(item_id)
+        if item is None:
+            return False
+        
+        x, y, z, rotated = new_pose
+        self.insert(ItemSnapshot(
+            item.id, item.width, item.depth, item.height,
+            x, y, z, rotated, getattr(item, 'container_id', self.container.id)
+        ))
+        return True
+    
+    def _reset_index(self):
+        """Create the backend's empty structure."""
+        raise NotImplementedError
+    
+    def _index_insert(self, item):
+        """Add a placed item to the backend's structure."""
+        raise NotImplementedError
+    
+    def _index_remove(self, item_id):
+        """Drop an item from the backend's structure."""
+        raise NotImplementedError
+    
+    def _index_memory(self):
+        """Estimate the memory held by the backend's structure, in bytes."""
+        raise NotImplementedError
+    
+    def query_box(self, min_point, max_point):
+        """Query all items that intersect with the given box."""
+        raise NotImplementedError
+    
+    def query_boxes(self, mins, maxs):
+        """Query many boxes at once.
+        
+        Returns (indptr, items) in CSR layout: the items overlapping box i are
+        items[indptr[i]:indptr[i + 1]]. Backends override this with a batched
+        traversal; the default runs one query_box per box.
+        """
+        mins = np.asarray(mins, dtype=float).reshape(-1, 3)
+        maxs = np.asarray(maxs, dtype=float).reshape(-1, 3)
+        indptr, hits = [0], []
+        for box_min, box_max in zip(mins, maxs):
+            hits.extend(self.query_box(box_min, box_max))
+            indptr.append(len(hits))
+        return np.array(indptr, dtype=np.int64), hits
+    
+    def is_box_empty(self, box_min, box_max):
+        """Check exactly whether a box overlaps no item (touching faces are allowed)."""
+        if self.occupancy.is_box_empty(box_min, box_max):
+            return True
+        return not any(
+            boxes_overlap(box_min, box_max, *item_bounds(other))
+            for other in self.query_box(box_min, box_max)
+        )
+    
+    def find_empty_space(self, item_width, item_depth, item_height, consider_rotation=True, mode=GRID_SEARCH):
+        """Find empty space in the container that can fit an item of the given dimensions."""
+        if mode == EXTREME_POINT_SEARCH:
+            return self._find_space_at_extreme_points(item_width, item_depth, item_height, consider_rotation)
+        if mode == FRONT_FIRST_SEARCH:
+            return self.occupancy.find_front_space(item_width, item_depth, item_height, consider_rotation)
+        if mode == COARSE_TO_FINE_SEARCH:
+            return self.find_space_coarse_to_fine(item_width, item_depth, item_height, consider_rotation)[0]
+        if mode == PATTERN_SEARCH:
+            return self._find_space_from_pattern(item_width, item_depth, item_height, consider_rotation)
+        
+        # Test every grid origin at once against the container's occupancy grid
+        return self.occupancy.find_empty_space(item_width, item_depth, item_height, consider_rotation)
+    
+    def _find_space_from_pattern(self, item_width, item_depth, item_height, consider_rotation=True):
+        """Hand out the next slot of a cached block for items of these dimensions.
+        
+        The first request per dimension class runs the front-first search
+        and grows a block of identical slots from the spot it finds, as the
+        bulk packing mode does. Later requests return the block's next slot
+        in O(1). Inserting an item into that slot advances the block;
+        inserting anything else into the block drops it. Patterns belong to
+        this index, so they never outlive the container state they were
+        computed from.
+        """
+        key = (item_width, item_depth, item_height, consider_rotation)
+        pattern = self._patterns.get(key)
+        if pattern is None or pattern.exhausted:
+            position = self.occupancy.find_front_space(item_width, item_depth, item_height, consider_rotation)
+            if position is None:
+                self._patterns.pop(key, None)
+                return None
+            x, y, z, rotated = position
+            size = (item_depth, item_width, item_height) if rotated else (item_width, item_depth, item_height)
+            columns, layers = self.occupancy.grow_block((x, y, z), size)
+            pattern = SlotPattern((x, y, z), size, rotated, columns, columns * layers)
+            self._patterns[key] = pattern
+        return pattern.next_position()
+    
+    def find_space_coarse_to_fine(self, item_width, item_depth, item_height, consider_rotation=True,
+                                  min_resolution=FINE_RESOLUTION, time_budget=None):
+        """Search for empty space on successively finer grids, down to ``min_resolution`` cm.
+        
+        The first pass rasterizes the whole container on a coarse grid. A fit
+        found there is free on every finer grid too, so each finer pass only
+        rasterizes the slab in front of the best position so far, from the
+        items query_box finds in it. Every pass returns the position the
+        front-first search would find on a full grid of its resolution.
+        
+        ``time_budget`` (seconds) stops before a pass that the previous one
+        predicts would run past the budget; the first pass always runs. A
+        finer pass over more than MAX_PASS_CELLS cells never runs, whatever
+        ``min_resolution`` asks for.
+        Returns (position, resolution): (x, y, z, rotated) or None, and the
+        cell size of the last completed pass.
+        """
+        start = time.perf_counter()
+        width, full_depth, height = self.container.width, self.container.depth, self.container.height
+        reach = max(item_width, item_depth) if consider_rotation else item_depth
+        
+        position = achieved = None
+        last_cells = last_elapsed = None
+        for resolution in resolution_levels((width, full_depth, height), min_resolution):
+            # Origins behind the best y so far cannot improve on it
+            depth = full_depth
+            if position is not None:
+                depth = min(full_depth, math.ceil((position[1] + reach) / resolution) * resolution)
+            
+            cells = math.prod(math.ceil(size / resolution) for size in (width, depth, height))
+            if last_cells is not None and cells > MAX_PASS_CELLS:
+                break
+            if time_budget is not None and last_cells is not None:
+                remaining = time_budget - (time.perf_counter() - start)
+                if last_elapsed * cells / last_cells > remaining:
+                    break
+            
+            pass_start = time.perf_counter()
+            grid = OccupancyGrid(width, depth, height, resolution)
+            for other in self.query_box((0, 0, 0), (width, depth, height)):
+                grid.add_item(other)
+            position = grid.find_front_space(item_width, item_depth, item_height, consider_rotation)
+            achieved = resolution
+            last_cells, last_elapsed = cells, time.perf_counter() - pass_start
+        
+        return position, achieved
+    
+    def _find_space_at_extreme_points(self, item_width, item_depth, item_height, consider_rotation=True):
+        """Test only the extreme points, front-most first, and return the first fit."""
+        dimensions_to_try = [(item_width, item_depth, False)]
+        if consider_rotation and item_width != item_depth:
+            dimensions_to_try.append((item_depth, item_width, True))
+        
+        # Same objective as the grid search: smallest y, then smallest x, then smallest z
+        candidates = sorted(self.extreme_points, key=lambda p: (p[1], p[0], p[2]))
+        limits = np.array([self.container.width, self.container.depth, self.container.height], dtype=float)
+        boxes = list(self.bounds.values())
+        item_mins = np.array([box[0] for box in boxes], dtype=float).reshape(-1, 3)
+        item_maxs = np.array([box[1] for box in boxes], dtype=float).reshape(-1, 3)
+        
+        # Check candidates in blocks against all items at once, stopping at the first fit
+        block_size = 64
+        for start in range(0, len(candidates), block_size):
+            block = candidates[start:start + block_size]
+            origins = np.array(block, dtype=float)
+            
+            fits = []
+            for width, depth, rotated in dimensions_to_try:
+                tops = origins + np.array([width, depth, item_height], dtype=float)
+                feasible = (tops <= limits).all(axis=1)
+                inside = np.flatnonzero(feasible)
+                if len(inside) and len(item_mins):
+                    collides = (
+                        (origins[inside, None, :] < item_maxs[None, :, :]) &
+                        (item_mins[None, :, :] < tops[inside, None, :])
+                    ).all(axis=2).any(axis=1)
+                    feasible[inside[collides]] = False
+                fits.append(feasible)
+            
+            # First candidate in objective order, first orientation on ties
+            fits = np.array(fits)
+            if fits.any():
+                index = int(np.argmax(fits.any(axis=0)))
+                x, y, z = block[index]
+                return (x, y, z, dimensions_to_try[int(np.argmax(fits[:, index]))][2])
+        
+        return None
+    
+    def get_items_blocking_path(self, item):
+        """Get all items blocking the path to the open face for a given item."""
+        if not item.container_id or item.container_id != self.container.id:
+            return []
+        
+        # Define the path to the open face
+        item_min, item_max = item_bounds(item)
+        path_min = np.array([item_min[0], 0, item_min[2]])
+        path_max = np.array([item_max[0], item_min[1], item_max[2]])
+        
+        # Query items intersecting with the path, filtering out the item itself
+        return [other for other in self.query_box(path_min, path_max) if other.id != item.id]
+    
+    def get_items_blocking_paths(self, items):
+        """Get the items blocking the path to the open face for many items at once.
+        
+        Same paths as get_items_blocking_path, resolved with one query_boxes
+        traversal. Returns a dict
+        mapping each item id in this container to its blocking items.
+        """
+        items = [item for item in items if item.container_id and item.container_id == self.container.id]
+        if not items:
+            return {}
+        
+        # The path runs from the open face (y = 0) to the item's front face
+        item_mins = np.array([item_bounds(item)[0] for item in items], dtype=float)
+        item_maxs = np.array([item_bounds(item)[1] for item in items], dtype=float)
+        path_mins = item_mins.copy()
+        path_mins[:, 1] = 0
+        path_maxs = item_maxs.copy()
+        path_maxs[:, 1] = item_mins[:, 1]
+        
+        indptr, hits = self.query_boxes(path_mins, path_maxs)
+        
+        # Filter out the item itself
+        return {
+            item.id: [other for other in hits[indptr[i]:indptr[i + 1]] if other.id != item.id]
+            for i, item in enumerate(items)
+        }
+    
+    def calculate_retrieval_steps(self, item):
+        """Calculate the number of steps needed to retrieve an item."""
+        blocking_items = self.get_items_blocking_path(item)
+        return len(blocking_items), blocking_items
@@ -62,6 +62,37 @@ class SpaceStationTestCase(unittest.TestCase):
         self.assertEqual(len(data['containers']), 1)
         self.assertEqual(data['containers'][0]['id'], "testCont1")
 
+    def test_retrieval_requests_validate_item_ids(self):
+        """Malformed item ID lists are rejected with 400"""
+        for url in ('/api/retrieval/plan', '/api/retrieval/execute/batch'):
+            for body in ({"item_ids": "a1"}, {"item_ids": [["x"]]}, {}):
+                response = self.client.post(url, json=body)
+                self.assertEqual(response.status_code, 400)
+
+    def test_batch_placement_validates_placements(self):
+        """Malformed placement plans are rejected with 400, unknown items per placement"""
+        url = '/api/placement/execute/batch'
+        for body in (
+            {}, {"placements": []}, {"placements": ["p1"]},
+            {"placements": [{"item_id": ["p1"], "container_id": "testCont1", "x": 0, "y": 0, "z": 0}]},
+            {"placements": [{"item_id": "p1", "container_id": {"id": "testCont1"}, "x": 0, "y": 0, "z": 0}]},
+        ):
+            response = self.client.post(url, json=body)
+            self.assertEqual(response.status_code, 400)
+        
+        response = self.client.post(url, json={
+            "placements": [{"item_id": "missing", "container_id": "testCont1", "x": 0, "y": 0, "z": 0}]
+        })
+        self.assertEqual(response.status_code, 200)
+        outcome = json.loads(response.data)['data'][0]
+        self.assertEqual((outcome['success'], outcome['error']), (False, "Item with ID missing not found"))
+
+    def test_placement_rejects_resolution_below_minimum(self):
+        """Resolutions finer than the minimum are rejected with 400"""
+        for resolution in (0.25, 0, "1"):
+            response = self.client.post('/api/placement/suggest', json={"item_id": "x", "resolution": resolution})
+            self.assertEqual(response.status_code, 400)
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
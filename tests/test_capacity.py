@@ -0,0 +1,64 @@
+import unittest
+import random
+from types import SimpleNamespace
+from capacity import CapacitySummary
+from occupancy import OccupancyGrid
+from snapshots import ItemSnapshot
+
+
+class CapacitySummaryTestCase(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        self.container = SimpleNamespace(id="testCont", width=100, depth=100, height=50)
+
+    def test_slab_bounds(self):
+        """Full slabs rule an item out, and partly covered ones never do"""
+        wall = ItemSnapshot("wall", 100, 40, 50, 0, 0, 0, False, self.container.id)
+        summary = CapacitySummary(self.container, [wall])
+        self.assertEqual(summary.free_volume, 100 * 60 * 50)
+        self.assertEqual(summary.min_front(100, 30, 50), 35)
+        self.assertIsNone(summary.min_front(100, 70, 50))
+
+        # A rotated item spans the slabs with its width
+        self.assertIsNone(summary.min_front(10, 100, 50, consider_rotation=False))
+        self.assertEqual(summary.min_front(10, 100, 50), 35)
+
+        summary.remove("wall")
+        self.assertEqual(summary.min_front(100, 100, 50), 0)
+
+    def test_misfits_cleared_by_removal(self):
+        """Dimensions that found no space rule out larger ones until space is freed"""
+        item = ItemSnapshot("small", 10, 10, 10, 0, 0, 0, False, self.container.id)
+        summary = CapacitySummary(self.container, [item])
+        summary.record_misfit('grid', 20, 20, 20)
+        self.assertIsNone(summary.min_front(20, 30, 20, mode='grid'))
+        self.assertEqual(summary.min_front(20, 30, 20, mode='extreme_point'), 0)
+        self.assertEqual(summary.min_front(10, 30, 20, mode='grid'), 0)
+
+        summary.remove("small")
+        self.assertEqual(summary.min_front(20, 30, 20, mode='grid'), 0)
+
+    def test_never_rules_out_a_free_spot(self):
+        """Every spot the occupancy grid finds is allowed by the summary"""
+        rng = random.Random(5)
+        grid = OccupancyGrid.from_items(self.container, [])
+        items = []
+        for index in range(60):
+            w, d, h = (rng.choice([10, 15, 25]) for _ in range(3))
+            position = grid.find_front_space(w, d, h)
+            if position is None:
+                continue
+            items.append(ItemSnapshot(f"i{index}", w, d, h, *position, self.container.id))
+            grid.add_item(items[-1])
+
+        summary = CapacitySummary(self.container, items)
+        for w, d, h in [(10, 10, 10), (25, 40, 15), (15, 20, 50), (50, 50, 25)]:
+            position = grid.find_front_space(w, d, h)
+            front = summary.min_front(w, d, h)
+            if position is not None:
+                self.assertIsNotNone(front)
+                self.assertLessEqual(front, position[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
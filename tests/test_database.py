@@ -1,11 +1,17 @@
 import unittest
 from app import app, db
-from models import Zone, Container, Item, UsageLog
+from models import Zone, Container, Item, UsageLog, ItemBox, ItemBlocker, ContainerVersion
 from database import (
-    add_item, place_item, retrieve_item, 
+    add_item, add_items, place_item, place_items, retrieve_item, retrieve_items, 
     is_position_valid, get_retrieval_steps
 )
+from algorithms import BatchPlacementEngine, find_optimal_placement, find_optimal_placements_for_batch, pack_manifest
+from spatial_index import boxes_overlap
+from types import SimpleNamespace
+from spatial_cache import get_octree, get_blocking_graph, get_capacities, cache_stats, clear_cache
+from spatial_db import find_overlapping_item_ids
 import datetime
+from sqlalchemy import event
 from sqlalchemy.sql import func
 
 
@@ -14,6 +20,7 @@ class DatabaseTestCase(unittest.TestCase):
         """Set up test environment"""
         app.config['TESTING'] = True
         app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        clear_cache()
         self.app_context = app.app_context()
         self.app_context.push()
         
@@ -155,6 +162,317 @@ class DatabaseTestCase(unittest.TestCase):
         valid = is_position_valid(container, item2, 20, 20, 20)
         self.assertFalse(valid)
 
+    def test_spatial_cache_tracks_writes(self):
+        """Placements update the cached octree without rebuilding it"""
+        container = Container.query.get(self.container_id)
+        for item_id in ("cache1", "cache2"):
+            add_item({
+                "id": item_id, "name": "Cached Item", "width": 20, "depth": 20,
+                "height": 20, "mass": 1.0, "priority": 1
+            })
+        
+        octree = get_octree(container)
+        self.assertEqual(len(octree.items), 0)
+        
+        place_item("cache1", self.container_id, 0, 0, 0)
+        place_item("cache2", self.container_id, 20, 0, 0)
+        octree = get_octree(container)
+        self.assertEqual(sorted(octree.items), ["cache1", "cache2"])
+        self.assertEqual(cache_stats()['rebuilds'], 1)
+        
+        # The blocking graph is cached until the container changes
+        graph = get_blocking_graph(container)
+        self.assertIs(get_blocking_graph(container), graph)
+        
+        # Position checks reject a colliding pose and accept a flush one
+        self.assertFalse(is_position_valid(container, Item.query.get("cache2"), 10, 0, 0))
+        self.assertTrue(is_position_valid(container, Item.query.get("cache2"), 40, 0, 0))
+        
+        # Retrievals and moves update the cached tree in place too
+        retrieve_item("cache1")
+        place_item("cache2", self.container_id, 0, 40, 0)
+        octree = get_octree(container)
+        self.assertEqual(sorted(octree.items), ["cache2"])
+        self.assertEqual(octree.items["cache2"].y_pos, 40)
+        self.assertEqual(cache_stats()['rebuilds'], 1)
+        self.assertIsNot(get_blocking_graph(container), graph)
+        self.assertEqual(sorted(get_blocking_graph(container).bounds), ["cache2"])
+
+        # Commits that never reach this process's cache, e.g. from another worker, bump the stored version
+        version = ContainerVersion.query.get(self.container_id).version
+        Item.query.get("cache1").container_id = self.container_id
+        Item.query.get("cache1").x_pos, Item.query.get("cache1").y_pos, Item.query.get("cache1").z_pos = 0, 0, 0
+        db.session.commit()
+        self.assertEqual(ContainerVersion.query.get(self.container_id).version, version + 1)
+        self.assertEqual(sorted(get_octree(container).items), ["cache1", "cache2"])
+        self.assertEqual(sorted(get_capacities([container])[self.container_id]._items), ["cache1", "cache2"])
+        self.assertEqual(cache_stats()['rebuilds'], 2)
+
+    def test_full_containers_skipped(self):
+        """Containers whose capacity summary has no room are never searched"""
+        spare = Container(id="spareCont", width=100, depth=100, height=100, zone_id=self.zone_id)
+        db.session.add(spare)
+        db.session.commit()
+        for item_id, size in (("filler", 100), ("small", 10)):
+            add_item({
+                "id": item_id, "name": "Capacity Item", "width": size, "depth": size,
+                "height": size, "mass": 1.0, "priority": 1
+            })
+        place_item("filler", self.container_id, 0, 0, 0)
+
+        summaries = get_capacities(Container.query.all())
+        self.assertEqual(summaries[self.container_id].free_volume, 0)
+        placement = find_optimal_placement(Item.query.get("small"))
+        self.assertEqual(placement['container_id'], "spareCont")
+        self.assertEqual(cache_stats()['containers'].keys(), {"spareCont"})
+
+        # The summaries follow retrievals
+        retrieve_item("filler")
+        self.assertEqual(get_capacities(Container.query.all())[self.container_id].free_volume, 100 ** 3)
+
+    def test_warm_search_reads_versions_once(self):
+        """A search over cached containers runs a single version query"""
+        for number in range(4):
+            db.session.add(Container(id=f"warm{number}", width=100, depth=100, height=100, zone_id=self.zone_id))
+        db.session.commit()
+        add_item({
+            "id": "warm", "name": "Warm Item", "width": 10, "depth": 10,
+            "height": 10, "mass": 1.0, "priority": 1
+        })
+        item, containers = Item.query.get("warm"), Container.query.all()
+        find_optimal_placement(item, containers)
+        BatchPlacementEngine(containers)
+        
+        statements = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            find_optimal_placement(item, containers)
+            BatchPlacementEngine(containers)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertEqual(len(statements), 2)
+        self.assertTrue(all('container_versions' in statement for statement in statements))
+        self.assertEqual(cache_stats()['rebuilds'], 5)
+
+    def test_anytime_placement(self):
+        """Deadlines cut the search short and say how much of it was done"""
+        spare = Container(id="spareCont", width=100, depth=100, height=100, zone_id=self.zone_id)
+        db.session.add(spare)
+        db.session.commit()
+        add_item({
+            "id": "anytime", "name": "Anytime Item", "width": 10, "depth": 10,
+            "height": 10, "mass": 1.0, "priority": 1
+        })
+        item = Item.query.get("anytime")
+
+        self.assertNotIn('quality', find_optimal_placement(item))
+        placement = find_optimal_placement(item, deadline=0)
+        self.assertEqual((placement['quality'], placement['explored']), ('best_effort', 0.5))
+        placement = find_optimal_placement(item, deadline=60)
+        self.assertEqual((placement['quality'], placement['explored']), ('optimal', 1.0))
+
+        # A batch past its deadline reports the items it never got to
+        placements = find_optimal_placements_for_batch([item], deadline=0)
+        self.assertEqual(placements, [{
+            'item_id': "anytime", 'item_name': "Anytime Item", 'container_id': None,
+            'quality': 'best_effort', 'explored': 0.0
+        }])
+
+    def test_batch_placement_engine(self):
+        """Batch placements see each other and reach the database only on commit"""
+        item_ids = ["batch1", "batch2", "batch3"]
+        for item_id in item_ids:
+            add_item({
+                "id": item_id, "name": "Batch Item", "width": 50, "depth": 50,
+                "height": 50, "mass": 1.0, "priority": 1
+            })
+        container = Container.query.get(self.container_id)
+        engine = BatchPlacementEngine(containers=[container])
+        placements = engine.place_all(Item.query.filter(Item.id.in_(item_ids)).all())
+        
+        positions = {(p['x'], p['y'], p['z']) for p in placements}
+        self.assertEqual(len(positions), 3)
+        self.assertTrue(all(item.container_id is None for item in Item.query.filter(Item.id.in_(item_ids))))
+        self.assertEqual(ItemBox.query.count(), 0)
+        
+        placed, errors = engine.commit()
+        self.assertEqual((len(placed), errors), (3, {}))
+        self.assertEqual(ItemBox.query.count(), 3)
+
+    def test_place_items(self):
+        """Placement plans are checked step by step and written in one transaction"""
+        for item_id in ("p1", "p2", "p3"):
+            add_item({
+                "id": item_id, "name": "Plan Item", "width": 20, "depth": 20,
+                "height": 20, "mass": 1.0, "priority": 1
+            })
+        place_item("p1", self.container_id, 0, 0, 0)
+        plan = [
+            {"item_id": "p1", "container_id": self.container_id, "x": 10, "y": 0, "z": 0},
+            {"item_id": "p2", "container_id": self.container_id, "x": 0, "y": 0, "z": 0},
+            {"item_id": "p3", "container_id": self.container_id, "x": 30, "y": 0, "z": 0, "rotated": True},
+            {"item_id": "p3", "container_id": "nowhere", "x": 0, "y": 0, "z": 0},
+        ]
+
+        # One bad step rejects the whole plan when asked to
+        outcomes, error = place_items(plan, all_or_nothing=True)
+        self.assertIsNone(error)
+        self.assertFalse(any(outcome['success'] for outcome in outcomes))
+        self.assertEqual(Item.query.get("p1").x_pos, 0)
+
+        outcomes, error = place_items(plan, astronaut_name="Planner")
+        self.assertEqual([outcome['success'] for outcome in outcomes], [True, False, True, False])
+        self.assertEqual(outcomes[1]['error'], "Invalid position: item would overlap another item")
+        self.assertEqual(outcomes[3]['error'], "Container with ID nowhere not found")
+        self.assertEqual((Item.query.get("p1").x_pos, Item.query.get("p2").container_id), (10, None))
+        self.assertEqual(sorted(get_octree(Container.query.get(self.container_id)).items), ["p1", "p3"])
+        self.assertEqual(UsageLog.query.filter_by(astronaut_name="Planner").count(), 2)
+
+        # Rows written behind this process's cache, e.g. by another worker, still count
+        Item.query.get("p2").container_id = self.container_id
+        Item.query.get("p2").x_pos, Item.query.get("p2").y_pos, Item.query.get("p2").z_pos = 60, 0, 0
+        db.session.commit()
+        outcomes, error = place_items([
+            {"item_id": "p1", "container_id": self.container_id, "x": 50, "y": 0, "z": 0},
+            {"item_id": "p3", "container_id": self.container_id, "x": "0", "y": 0, "z": 0},
+        ])
+        self.assertIsNone(error)
+        self.assertEqual(outcomes[0]['error'], "Invalid position: item would overlap another item")
+        self.assertEqual(outcomes[1]['error'], "Invalid position: coordinates must be numbers")
+        
+        # Unhashable IDs fail their own placement instead of the whole plan
+        outcomes, error = place_items([
+            {"item_id": ["p1"], "container_id": self.container_id, "x": 0, "y": 0, "z": 0},
+            {"item_id": "p3", "container_id": {"id": self.container_id}, "x": 0, "y": 0, "z": 0},
+        ])
+        self.assertIsNone(error)
+        self.assertEqual([outcome['error'] for outcome in outcomes], ["Invalid item or container ID"] * 2)
+
+    def test_retrieve_items(self):
+        """Batch retrievals move each blocker once and write one transaction"""
+        for item_id, y in (("front", 0), ("t1", 20), ("t2", 40)):
+            add_item({
+                "id": item_id, "name": "Shift Item", "width": 20, "depth": 20,
+                "height": 20, "mass": 1.0, "priority": 1, "usage_limit": 2
+            })
+            place_item(item_id, self.container_id, 0, y, 0)
+
+        result, error = retrieve_items(["t2", "t1", "ghost"], astronaut_name="Night Shift", use_items=True)
+        self.assertIsNone(error)
+        self.assertEqual(
+            [(step['action'], step['item_id']) for step in result['sequence']],
+            [('remove', "front"), ('retrieve', "t1"), ('retrieve', "t2"), ('place_back', "front")]
+        )
+        self.assertEqual(sorted(result['retrieved']), ["t1", "t2"])
+        self.assertEqual(result['skipped'], [{'item_id': "ghost", 'error': "Item with ID ghost not found"}])
+        self.assertEqual(result['containers'][self.container_id]['moves'], 4)
+
+        self.assertEqual((Item.query.get("t1").container_id, Item.query.get("t1").uses_remaining), (None, 1))
+        self.assertEqual(Item.query.get("front").y_pos, 0)
+        self.assertEqual(UsageLog.query.filter_by(action='used', astronaut_name="Night Shift").count(), 2)
+        self.assertEqual(sorted(get_octree(Container.query.get(self.container_id)).items), ["front"])
+
+        # A target the plan cannot reach is reported, not dropped
+        Item.query.get("t1").container_id, Item.query.get("t1").x_pos = self.container_id, 50
+        db.session.commit()
+        result, error = retrieve_items(["t1"])
+        self.assertEqual((result['retrieved'], result['sequence']), ([], []))
+        self.assertEqual(result['skipped'], [{'item_id': "t1", 'error': "No retrieval plan for item with ID t1"}])
+
+    def test_add_items(self):
+        """Bulk ingestion adds the valid rows and reports the others"""
+        add_item({
+            "id": "old", "name": "Old Item", "width": 10, "depth": 10,
+            "height": 10, "mass": 1.0, "priority": 1
+        })
+        rows = [
+            {"id": "new1", "name": "New", "width": "10", "depth": 10, "height": 10, "mass": 1.0,
+             "priority": 5, "usage_limit": 3, "preferred_zone_name": "Test Zone", "expiry_date": "2030-01-01"},
+            {"id": "new2", "name": "New", "width": 10, "depth": 10, "height": 10, "mass": 1.0, "priority": 5},
+            {"id": "old", "name": "Again", "width": 10, "depth": 10, "height": 10, "mass": 1.0, "priority": 5},
+            {"id": "new2", "name": "Twice", "width": 10, "depth": 10, "height": 10, "mass": 1.0, "priority": 5},
+            {"id": "bad", "name": "Bad", "width": "wide", "depth": 10, "height": 10, "mass": 1.0, "priority": 5},
+            {"id": "short", "name": "Short", "width": 10, "depth": 10, "height": 10, "priority": 5},
+            {"id": "zoned", "name": "Zoned", "width": 10, "depth": 10, "height": 10, "mass": 1.0, "priority": 5,
+             "preferred_zone_name": ["Test Zone"]},
+        ]
+        results, error = add_items(rows)
+        self.assertIsNone(error)
+        self.assertEqual([result['success'] for result in results], [True, True, False, False, False, False, False])
+        self.assertEqual(results[2]['error'], "Item with ID old already exists")
+        self.assertEqual(results[5]['error'], "Missing required field 'mass'")
+        self.assertEqual(results[6]['error'], "Invalid value for 'preferred_zone_name': ['Test Zone']")
+
+        item = Item.query.get("new1")
+        self.assertEqual((item.width, item.uses_remaining, item.preferred_zone_id), (10.0, 3, self.zone_id))
+        self.assertEqual(item.expiry_date, datetime.date(2030, 1, 1))
+        self.assertEqual(Item.query.get("old").name, "Old Item")
+        self.assertEqual(UsageLog.query.filter_by(action='added').count(), 3)
+
+    def test_pack_manifest(self):
+        """Bulk packing streams non-overlapping blocks around the items already placed"""
+        add_item({
+            "id": "existing", "name": "Existing Item", "width": 100, "depth": 10,
+            "height": 100, "mass": 1.0, "priority": 1
+        })
+        place_item("existing", self.container_id, 0, 0, 0)
+        items = [
+            SimpleNamespace(id=f"m{index}", name="Food Pack", width=20, depth=15, height=10,
+                            priority=index, preferred_zone_id=self.zone_id)
+            for index in range(40)
+        ] + [SimpleNamespace(id="big", name="Big Box", width=50, depth=50, height=50,
+                             priority=1, preferred_zone_id=None)]
+        container = Container.query.get(self.container_id)
+        
+        placements = list(pack_manifest(items, containers=[container]))
+        self.assertEqual(placements[0]['item_id'], "big")
+        self.assertEqual(placements[1]['item_id'], "m39")
+        self.assertEqual(len(placements), 41)
+        
+        boxes = [((0, 0, 0), (100, 10, 100))]
+        for placement in placements:
+            width, depth, height = (50, 50, 50) if placement['item_id'] == "big" else (20, 15, 10)
+            if placement['rotated']:
+                width, depth = depth, width
+            box_min = (placement['x'], placement['y'], placement['z'])
+            box_max = (box_min[0] + width, box_min[1] + depth, box_min[2] + height)
+            self.assertTrue(all(hi <= 100 for hi in box_max))
+            self.assertFalse(any(boxes_overlap(box_min, box_max, *other) for other in boxes))
+            boxes.append((box_min, box_max))
+
+    def test_spatial_mirror_tracks_writes(self):
+        """Item boxes are mirrored on every write and answer blocking queries"""
+        for item_id, width, depth in (("front", 10, 30), ("back", 20, 10)):
+            add_item({
+                "id": item_id, "name": "Mirrored Item", "width": width, "depth": depth,
+                "height": 20, "mass": 1.0, "priority": 1
+            })
+        
+        # Rotated, the front item spans x 0-30 and y 0-10
+        place_item("front", self.container_id, 0, 0, 0, rotated=True)
+        place_item("back", self.container_id, 25, 50, 0)
+        box = ItemBox.query.filter_by(item_id="front").one()
+        self.assertEqual((box.max_x, box.max_y), (30, 10))
+        self.assertEqual(find_overlapping_item_ids(self.container_id, (29, 9, 19), (40, 20, 30)), ["front"])
+        self.assertEqual(find_overlapping_item_ids(self.container_id, (30, 0, 0), (40, 10, 20)), [])
+        
+        steps, blocking = get_retrieval_steps("back")
+        self.assertEqual((steps, [item['id'] for item in blocking]), (1, ["front"]))
+        
+        # Moving the front item only rewrites the edges it takes part in
+        place_item("front", self.container_id, 60, 0, 0)
+        self.assertEqual(get_retrieval_steps("back"), (0, []))
+        place_item("front", self.container_id, 30, 0, 0)
+        edges = [(edge.item_id, edge.blocker_id) for edge in ItemBlocker.query.all()]
+        self.assertEqual(edges, [("back", "front")])
+        
+        retrieve_item("front")
+        self.assertEqual(ItemBox.query.filter_by(item_id="front").count(), 0)
+        self.assertEqual(ItemBlocker.query.count(), 0)
+        self.assertEqual(get_retrieval_steps("back"), (0, []))
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,107 @@
+import unittest
+import io
+import json
+from app import app, db
+from models import Zone, Container, Item, ManifestImport
+from manifest_import import import_manifest
+from spatial_cache import clear_cache
+
+
+CSV_MANIFEST = """id,name,width,depth,height,mass,priority,usage_limit,preferred_zone_name
+m1,Bolt,10,10,10,0.1,50,,Test Zone
+m2,Nut,10,10,10,0.1,40,5,
+m3,Washer,thin,10,10,0.1,30,,
+m4,Spring,10,10,10,0.1,20,,
+m5,Gear,20,20,20,1.0,10,,
+"""
+
+
+class ManifestImportTestCase(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        clear_cache()
+        self.client = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+
+        db.create_all()
+        zone = Zone(name="Test Zone", description="For testing")
+        db.session.add(zone)
+        db.session.commit()
+        db.session.add(Container(id="testCont1", width=100, depth=100, height=100, zone_id=zone.id))
+        db.session.commit()
+        self.zone_id = zone.id
+
+    def tearDown(self):
+        """Clean up after tests"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_chunked_import_resumes(self):
+        """An interrupted import picks up after its last committed chunk"""
+        updates = import_manifest(io.StringIO(CSV_MANIFEST), 'csv', import_id="manifest", chunk_size=2)
+        first = next(updates)
+        updates.close()
+        self.assertEqual((first['rows_done'], first['added'], first['completed']), (2, 2, False))
+        self.assertEqual(Item.query.get("m1").preferred_zone_id, self.zone_id)
+
+        updates = list(import_manifest(io.StringIO(CSV_MANIFEST), 'csv', import_id="manifest", chunk_size=2))
+        self.assertEqual([update['rows_done'] for update in updates], [4, 5])
+        self.assertEqual(updates[0]['resumed_from'], 2)
+        self.assertEqual(updates[0]['errors'], [{'row': 3, 'id': "m3", 'error': "Invalid value for 'width': 'thin'"}])
+        self.assertTrue(updates[-1]['completed'])
+        self.assertEqual((updates[-1]['added'], updates[-1]['failed']), (4, 1))
+        self.assertEqual(Item.query.count(), 4)
+
+        # A completed import does nothing more
+        again = list(import_manifest(io.StringIO(CSV_MANIFEST), 'csv', import_id="manifest"))
+        self.assertEqual(len(again), 1)
+        self.assertEqual(Item.query.count(), 4)
+
+    def test_resume_places_committed_rows(self):
+        """Rows committed without their placement are placed when the import resumes"""
+        updates = import_manifest(io.StringIO(CSV_MANIFEST), 'csv', import_id="late", chunk_size=2)
+        next(updates)
+        updates.close()
+        self.assertIsNone(Item.query.get("m1").container_id)
+
+        updates = list(import_manifest(io.StringIO(CSV_MANIFEST), 'csv', import_id="late", chunk_size=2, place=True))
+        self.assertEqual(sum(update['placed'] for update in updates), 4)
+        self.assertEqual(Item.query.filter(Item.container_id.is_(None)).count(), 0)
+        self.assertEqual(ManifestImport.query.get("late").rows_placed, 5)
+
+    def test_import_endpoint_places_items(self):
+        """NDJSON bodies stream progress back and can chain into placement"""
+        lines = [
+            json.dumps({"id": "n1", "name": "Box", "width": 50, "depth": 50, "height": 50, "mass": 1, "priority": 5}),
+            "{not json",
+            json.dumps({"id": "n2", "name": "Box", "width": 50, "depth": 50, "height": 50, "mass": 1, "priority": 5}),
+        ]
+        response = self.client.post(
+            '/api/items/import?place=true&import_id=nd', data="\n".join(lines),
+            content_type='application/x-ndjson'
+        )
+        self.assertEqual(response.status_code, 200)
+        updates = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual(updates[-1]['errors'][0]['row'], 2)
+        self.assertEqual((updates[-1]['added'], updates[-1]['placed']), (2, 2))
+        self.assertTrue(ManifestImport.query.get("nd").completed)
+        self.assertEqual(Item.query.get("n2").container_id, "testCont1")
+
+        response = self.client.post('/api/items/import', data="", content_type='text/plain')
+        self.assertEqual(response.status_code, 400)
+
+        # Unreadable input ends the stream with an error line instead of cutting it off
+        response = self.client.post(
+            '/api/items/import?import_id=bad', data=b"id,name\n\xff\xfe,Box\n", content_type='text/csv'
+        )
+        self.assertEqual(response.status_code, 200)
+        updates = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertIn("decode", updates[-1]['error'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import unittest
+import random
+from types import SimpleNamespace
+from occupancy import OccupancyGrid, item_bounds
+
+
+def make_item(item_id, width, depth, height, x, y, z, rotated=False):
+    return SimpleNamespace(
+        id=item_id, width=width, depth=depth, height=height,
+        x_pos=x, y_pos=y, z_pos=z, rotated=rotated
+    )
+
+
+def brute_force_empty_space(container, items, width, depth, height, step=5):
+    """Reference search: scan every grid origin and test each item pairwise."""
+    best = None
+    orientations = [(width, depth, False)]
+    if width != depth:
+        orientations.append((depth, width, True))
+    for w, d, rotated in orientations:
+        for x in range(0, int(container.width - w) + 1, step):
+            for y in range(0, int(container.depth - d) + 1, step):
+                for z in range(0, int(container.height - height) + 1, step):
+                    collides = False
+                    for item in items:
+                        lo, hi = item_bounds(item)
+                        if (x < hi[0] and x + w > lo[0] and
+                                y < hi[1] and y + d > lo[1] and
+                                z < hi[2] and z + height > lo[2]):
+                            collides = True
+                            break
+                    if not collides and (best is None or y < best[1]):
+                        best = (x, y, z, rotated)
+    return best
+
+
+class OccupancyGridTestCase(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        self.container = SimpleNamespace(id="testCont", width=100, depth=100, height=100)
+
+    def test_empty_container(self):
+        """An empty container places the item at the origin"""
+        grid = OccupancyGrid.from_items(self.container, [])
+        self.assertEqual(grid.find_empty_space(20, 30, 10), (0, 0, 0, False))
+
+    def test_item_too_large(self):
+        """Items larger than the container in every orientation do not fit"""
+        grid = OccupancyGrid.from_items(self.container, [])
+        self.assertIsNone(grid.find_empty_space(120, 20, 20))
+        self.assertIsNone(grid.find_empty_space(20, 20, 120))
+
+    def test_rotation_used_when_needed(self):
+        """The rotated orientation is chosen when only it fits"""
+        container = SimpleNamespace(id="narrow", width=30, depth=100, height=50)
+        grid = OccupancyGrid.from_items(container, [])
+        self.assertEqual(grid.find_empty_space(60, 20, 10), (0, 0, 0, True))
+
+    def test_flush_placement_allowed(self):
+        """Boxes may touch an existing item face without colliding"""
+        blocker = make_item("a", 100, 20, 100, 0, 0, 0)
+        grid = OccupancyGrid.from_items(self.container, [blocker])
+        self.assertEqual(grid.find_empty_space(10, 10, 10), (0, 20, 0, False))
+
+    def test_matches_brute_force(self):
+        """The vectorized search agrees with a pairwise reference search"""
+        rng = random.Random(42)
+        for _ in range(20):
+            items = []
+            for index in range(rng.randint(0, 12)):
+                w, d, h = (rng.choice([10, 15, 20, 25, 40]) for _ in range(3))
+                x = rng.randrange(0, 100 - w + 1, 5)
+                y = rng.randrange(0, 100 - d + 1, 5)
+                z = rng.randrange(0, 100 - h + 1, 5)
+                items.append(make_item(f"i{index}", w, d, h, x, y, z))
+            grid = OccupancyGrid.from_items(self.container, items)
+            dims = (rng.choice([10, 20, 35]), rng.choice([10, 25, 50]), rng.choice([10, 30]))
+            expected = brute_force_empty_space(self.container, items, *dims)
+            self.assertEqual(grid.find_empty_space(*dims), expected)
+            self.assertEqual(grid.find_front_space(*dims), expected)
+
+    def test_incremental_table_matches_rebuild(self):
+        """Adding and removing boxes keeps the summed-area table exact"""
+        item1 = make_item("a", 20, 20, 20, 10, 10, 10)
+        item2 = make_item("b", 30, 10, 15, 42.5, 0, 60)
+        grid = OccupancyGrid.from_items(self.container, [item1])
+        grid.table  # build the table before the incremental updates
+        grid.add_item(item2)
+        grid.remove_item(item1)
+        
+        rebuilt = OccupancyGrid.from_items(self.container, [item2])
+        self.assertTrue((grid.table == rebuilt.table).all())
+
+    def test_layer_summary_tracks_updates(self):
+        """The per-layer occupied cell counts follow added and removed items"""
+        item1 = make_item("a", 20, 20, 20, 10, 10, 10)
+        item2 = make_item("b", 10, 10, 10, 10, 10, 10)
+        grid = OccupancyGrid.from_items(self.container, [item1])
+        grid.layer_occupied  # build the summary before the incremental updates
+        grid.add_item(item2)
+        grid.remove_item(item1)
+        
+        rebuilt = OccupancyGrid.from_items(self.container, [item2])
+        self.assertEqual(list(grid.layer_occupied), list(rebuilt.layer_occupied))
+        self.assertEqual(grid.layer_occupied[2], 4)
+
+    def test_box_emptiness(self):
+        """Box queries detect overlaps and can ignore an item being moved"""
+        item = make_item("a", 20, 20, 20, 10, 10, 10)
+        grid = OccupancyGrid.from_items(self.container, [item])
+        
+        self.assertTrue(grid.is_box_empty((30, 10, 10), (50, 30, 30)))
+        self.assertFalse(grid.is_box_empty((20, 20, 20), (40, 40, 40)))
+        self.assertTrue(grid.is_box_empty((20, 20, 20), (40, 40, 40), ignore_item=item))
+
+
+if __name__ == '__main__':
+    unittest.main()
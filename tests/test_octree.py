@@ -1,5 +1,8 @@
 import unittest
-from octree import Octree, OctreeNode
+from unittest.mock import patch
+from octree import Octree, OctreeNode, EXTREME_POINT_SEARCH, boxes_overlap
+from occupancy import item_bounds
+from array_octree import ArrayOctree
 from models import Container, Item
 
 
@@ -13,7 +16,7 @@ class OctreeTestCase(unittest.TestCase):
             height=100,
             zone_id=1
         )
-        self.octree = Octree(self.container)
+        self.octree = Octree(self.container, items=[])
         
         # Create test items
         self.item1 = Item(
@@ -103,6 +106,129 @@ class OctreeTestCase(unittest.TestCase):
         result = self.octree.find_empty_space(30, 30, 30)
         self.assertIsNone(result)
 
+    def test_extreme_point_search(self):
+        """Extreme point search packs items flush against each other"""
+        octree = Octree(self.container, items=[])
+        placed = []
+        for index in range(12):
+            position = octree.find_empty_space(30, 30, 30, mode=EXTREME_POINT_SEARCH)
+            self.assertIsNotNone(position)
+            x, y, z, rotated = position
+            item = Item(
+                id=f"ep{index}", name="Packed", width=30, depth=30, height=30,
+                mass=1.0, priority=1, container_id=self.container.id,
+                x_pos=x, y_pos=y, z_pos=z, rotated=rotated
+            )
+            for other in placed:
+                self.assertFalse(boxes_overlap(*item_bounds(item), *item_bounds(other)))
+            octree.insert(item)
+            placed.append(item)
+        
+        # The first layer fills the open face before going deeper
+        self.assertTrue(all(item.y_pos == 0 for item in placed[:9]))
+        self.assertEqual((placed[1].x_pos, placed[1].z_pos), (0, 30))
+
+    def test_remove_and_move(self):
+        """Items can be removed and moved without rebuilding the tree"""
+        items = [
+            Item(id=f"m{i}", name="Small", width=10, depth=10, height=10, mass=1.0,
+                 priority=1, container_id=self.container.id,
+                 x_pos=(i % 5) * 20, y_pos=(i // 5) * 20, z_pos=0, rotated=False)
+            for i in range(20)
+        ]
+        for item in items:
+            self.octree.insert(item)
+        self.assertIsNotNone(self.octree.root.children)
+        
+        self.octree.move("m0", (50, 90, 90, False))
+        self.assertEqual(self.octree.query_box((0, 0, 0), (10, 10, 10)), [])
+        moved = self.octree.query_box((50, 90, 90), (60, 100, 100))
+        self.assertEqual([item.id for item in moved], ["m0"])
+        
+        # Removing everything collapses the tree back into the root
+        for item in items:
+            self.assertIsNotNone(self.octree.remove(item.id))
+        self.assertIsNone(self.octree.remove("m0"))
+        self.assertIsNone(self.octree.root.children)
+        self.assertEqual(self.octree.root.locator, {})
+        self.assertEqual(self.octree.find_empty_space(100, 100, 100), (0, 0, 0, False))
+
+    def test_bulk_load_matches_incremental_build(self):
+        """Bulk loading builds the same tree as inserting items one by one"""
+        items = [
+            Item(id=f"b{i}", name="Small", width=8, depth=12, height=10, mass=1.0,
+                 priority=1, container_id=self.container.id,
+                 x_pos=(i * 37) % 90, y_pos=(i * 53) % 85, z_pos=(i * 17) % 90, rotated=i % 3 == 0)
+            for i in range(60)
+        ]
+        bulk = Octree(self.container, items=items)
+        for item in items:
+            self.octree.insert(item)
+        
+        def layout(octree):
+            return {
+                item_id: sorted(tuple(node.center) + (node.size,) for node in nodes)
+                for item_id, nodes in octree.root.locator.items()
+            }
+        self.assertEqual(layout(bulk), layout(self.octree))
+        self.assertEqual(bulk.find_empty_space(30, 30, 30), self.octree.find_empty_space(30, 30, 30))
+
+    def test_query_boxes_matches_query_box(self):
+        """Batched queries return the same items as one query_box call per box"""
+        items = [
+            Item(id=f"q{i}", name="Small", width=10, depth=15, height=10, mass=1.0,
+                 priority=1, container_id=self.container.id,
+                 x_pos=(i % 6) * 15, y_pos=(i // 6) * 15, z_pos=(i % 4) * 20, rotated=i % 2 == 1)
+            for i in range(30)
+        ]
+        boxes = [
+            ((0, 0, 0), (100, 100, 100)), ((12, 7, 0), (40, 33, 25)),
+            ((15, 0, 0), (15, 100, 100)), ((95, 95, 95), (100, 100, 100))
+        ]
+        mins, maxs = [box[0] for box in boxes], [box[1] for box in boxes]
+        for octree in (Octree(self.container, items=items), ArrayOctree(self.container, items=items)):
+            indptr, hits = octree.query_boxes(mins, maxs)
+            self.assertEqual(len(indptr), len(boxes) + 1)
+            for i, box in enumerate(boxes):
+                self.assertEqual(
+                    sorted(item.id for item in hits[indptr[i]:indptr[i + 1]]),
+                    sorted(item.id for item in octree.query_box(*box))
+                )
+            
+            blockers = octree.get_items_blocking_paths(items)
+            for item in items:
+                self.assertEqual(
+                    sorted(other.id for other in blockers[item.id]),
+                    sorted(other.id for other in octree.get_items_blocking_path(item))
+                )
+
+    def test_array_octree_matches_octree(self):
+        """The array-backed tree answers box queries like the object tree"""
+        items = [
+            Item(id=f"a{i}", name="Small", width=10, depth=10, height=15, mass=1.0,
+                 priority=1, container_id=self.container.id,
+                 x_pos=(i % 5) * 20, y_pos=(i // 5) * 12.5, z_pos=(i % 3) * 30, rotated=i % 2 == 0)
+            for i in range(40)
+        ]
+        array_octree = ArrayOctree(self.container, items=items[:30])
+        for item in items:
+            self.octree.insert(item)
+        for item in items[30:]:
+            array_octree.insert(item)
+        for item in items[::4]:
+            self.octree.remove(item.id)
+            array_octree.remove(item.id)
+        
+        boxes = [((0, 0, 0), (100, 100, 100)), ((15, 10, 20), (45, 40, 50)), ((20, 0, 0), (20, 100, 100))]
+        for linear_scan_rows in (0, 4096):
+            with patch.object(ArrayOctree, 'linear_scan_rows', linear_scan_rows):
+                for box in boxes:
+                    self.assertEqual(
+                        sorted(item.id for item in array_octree.query_box(*box)),
+                        sorted(item.id for item in self.octree.query_box(*box))
+                    )
+        self.assertEqual(array_octree.find_empty_space(30, 30, 30), self.octree.find_empty_space(30, 30, 30))
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,90 @@
+import unittest
+import random
+from types import SimpleNamespace
+from occupancy import OccupancyGrid
+from octree import Octree
+from retrieval import BlockingGraph
+from snapshots import ItemSnapshot
+
+
+class BlockingGraphTestCase(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        self.container = SimpleNamespace(id="testCont", width=100, depth=100, height=60)
+
+    def test_matches_path_queries(self):
+        """The sweep finds the same direct blockers as one path query per item"""
+        rng = random.Random(3)
+        grid = OccupancyGrid.from_items(self.container, [])
+        items = []
+        for index in range(80):
+            w, d, h = (rng.choice([10, 15, 25]) for _ in range(3))
+            position = grid.find_empty_space(w, d, h)
+            if position is None:
+                continue
+            item = ItemSnapshot(f"i{index}", w, d, h, *position, self.container.id)
+            grid.add_item(item)
+            items.append(item)
+
+        graph = BlockingGraph(items)
+        expected = Octree(self.container, items=items).get_items_blocking_paths(items)
+        for item in items:
+            self.assertEqual(
+                sorted(graph.direct_blockers(item.id)),
+                sorted(other.id for other in expected[item.id] if item.y_pos > 0)
+            )
+
+    def test_transitive_blockers_and_removal_order(self):
+        """Blockers of blockers have to move first, front-most first"""
+        items = [
+            ItemSnapshot("back", 20, 20, 20, 0, 40, 0, False, self.container.id),
+            ItemSnapshot("middle", 30, 10, 20, 10, 20, 0, False, self.container.id),
+            ItemSnapshot("front", 10, 10, 20, 30, 0, 0, False, self.container.id),
+            ItemSnapshot("aside", 10, 10, 20, 80, 0, 0, False, self.container.id),
+        ]
+        graph = BlockingGraph(items)
+
+        self.assertEqual(graph.direct_blockers("back"), ["middle"])
+        self.assertEqual(graph.transitive_blockers("back"), {"middle", "front"})
+        self.assertEqual(graph.removal_order("back"), ["front", "middle"])
+        self.assertEqual(graph.blocking["front"], ["middle"])
+        self.assertEqual(graph.removal_order("aside"), [])
+
+    def test_plan_retrieval(self):
+        """Multi-item plans move every blocker once and hold as few items out as possible"""
+        boxes = {
+            # Column at x 0-10: p, then target t1, then r and target t3 behind it
+            "p": (0, 0), "t1": (0, 10), "r": (0, 30), "t3": (0, 40),
+            # Column at x 50-60: u, v, w in front of target t2
+            "u": (50, 0), "v": (50, 10), "w": (50, 20), "t2": (50, 30),
+        }
+        items = [
+            ItemSnapshot(item_id, 10, 10, 10, x, y, 0, False, self.container.id)
+            for item_id, (x, y) in boxes.items()
+        ]
+        graph = BlockingGraph(items)
+        targets = ["t1", "t2", "t3"]
+
+        plan = graph.plan_retrieval(targets)
+        self.assertTrue(plan['optimal'])
+        self.assertEqual(plan['max_held'], 3)
+        self.assertEqual(plan['moves'], 13)
+
+        # Replay the plan: every move needs a clear path, and only targets stay out
+        out = set()
+        for step in plan['steps']:
+            item_id = step['item_id']
+            self.assertTrue(set(graph.blockers[item_id]) <= out, step)
+            if step['action'] == 'place_back':
+                out.remove(item_id)
+            else:
+                self.assertNotIn(item_id, out)
+                out.add(item_id)
+        self.assertEqual(out, set(targets))
+
+        # Without time to search, targets are taken front to back
+        self.assertEqual(graph.plan_retrieval(targets, time_budget=0)['max_held'], 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+import unittest
+import random
+import time
+from types import SimpleNamespace
+from app import app
+from occupancy import OccupancyGrid
+from placement_pool import container_task, search_container, search_containers
+from snapshots import ItemSnapshot
+from spatial_cache import SPATIAL_BACKENDS, choose_backend, create_index
+
+
+class SpatialIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        self.container = SimpleNamespace(id="testCont", width=100, depth=80, height=60)
+        rng = random.Random(7)
+        self.items = []
+        for index in range(60):
+            w, d, h = (rng.choice([4, 8, 12.5, 30]) for _ in range(3))
+            self.items.append(ItemSnapshot(
+                f"i{index}", w, d, h,
+                rng.uniform(0, 100 - max(w, d)), rng.uniform(0, 80 - max(w, d)), rng.uniform(0, 60 - h),
+                rng.random() < 0.3, self.container.id
+            ))
+
+    def test_extreme_points_built_at_once(self):
+        """The first build of the extreme points matches adding the items one by one"""
+        index = SPATIAL_BACKENDS['grid'](self.container, items=self.items)
+        built = index.extreme_points
+        index._extreme_points = {(0, 0, 0)}
+        for item in self.items:
+            index._add_extreme_points(item)
+        # One by one, points inside items placed later are kept
+        expected = {
+            point for point in index.extreme_points
+            if not any(all(lo[a] <= point[a] < hi[a] for a in range(3)) for lo, hi in index.bounds.values())
+        }
+        self.assertEqual(built, expected)
+
+    def test_backends_agree(self):
+        """Every backend answers box queries and free-space searches alike"""
+        boxes = [
+            ((0, 0, 0), (100, 80, 60)), ((10, 5, 5), (35, 30, 20)),
+            ((50, 0, 0), (50, 80, 60)), ((90, 70, 50), (100, 80, 60))
+        ]
+        results = {}
+        for name, index_class in SPATIAL_BACKENDS.items():
+            index = index_class(self.container, items=self.items[:50])
+            for item in self.items[50:]:
+                index.insert(item)
+            for item in self.items[::5]:
+                index.remove(item.id)
+            index.move("i1", (0, 0, 0, False))
+            
+            indptr, hits = index.query_boxes([box[0] for box in boxes], [box[1] for box in boxes])
+            results[name] = (
+                [sorted(item.id for item in index.query_box(*box)) for box in boxes],
+                [sorted(item.id for item in hits[indptr[i]:indptr[i + 1]]) for i in range(len(boxes))],
+                index.find_empty_space(20, 20, 20),
+                index.copy().options() == index.options()
+            )
+        
+        reference = results.pop('octree')
+        self.assertEqual(reference[0], reference[1])
+        for name, result in results.items():
+            self.assertEqual(result, reference, name)
+
+    def test_coarse_to_fine_search(self):
+        """Each refinement pass matches a full grid search at its resolution"""
+        index = SPATIAL_BACKENDS['grid'](self.container, items=self.items)
+        grid = OccupancyGrid.from_items(self.container, self.items, resolution=5)
+        for dims in [(20, 20, 20), (12, 35, 10), (30, 5, 50)]:
+            self.assertEqual(
+                index.find_space_coarse_to_fine(*dims, min_resolution=5),
+                (grid.find_front_space(*dims), 5)
+            )
+        
+        # A 48 cm box fits beside a 52 cm item only on a grid finer than 5 cm
+        container = SimpleNamespace(id="tight", width=100, depth=100, height=100)
+        blocker = ItemSnapshot("wall", 52, 100, 100, 0, 0, 0, False, container.id)
+        index = SPATIAL_BACKENDS['grid'](container, items=[blocker])
+        self.assertIsNone(index.find_empty_space(48, 48, 10))
+        self.assertEqual(index.find_space_coarse_to_fine(48, 48, 10), ((52, 0, 0, False), 1))
+        self.assertEqual(index.find_space_coarse_to_fine(48, 48, 10, time_budget=0), ((52, 0, 0, False), 2))
+        
+        # Passes above MAX_PASS_CELLS are skipped however fine the requested resolution
+        self.assertEqual(index.find_space_coarse_to_fine(48, 48, 10, min_resolution=0.25), ((52, 0, 0, False), 0.5))
+
+    def test_pattern_search(self):
+        """Identical items get consecutive slots until something else lands in the block"""
+        container = SimpleNamespace(id="bulk", width=100, depth=100, height=100)
+        index = SPATIAL_BACKENDS['grid'](container, items=[])
+        positions = []
+        for number in range(12):
+            position = index.find_empty_space(20, 30, 50, mode='pattern')
+            positions.append(position)
+            index.insert(ItemSnapshot(f"box{number}", 20, 30, 50, *position, container.id))
+        # Two rows of five fill the front of the container before a new block starts
+        self.assertEqual(positions[:10], [(x, 0, z, False) for z in (0, 50) for x in (0, 20, 40, 60, 80)])
+        self.assertEqual(len(set(positions)), 12)
+        for item_id, (box_min, box_max) in index.bounds.items():
+            self.assertEqual([item.id for item in index.query_box(box_min, box_max)], [item_id])
+
+        # A different item in the block's next slot spoils the pattern
+        next_slot = index.find_empty_space(20, 30, 50, mode='pattern')
+        index.insert(ItemSnapshot("other", 10, 10, 10, *next_slot, container.id))
+        self.assertNotEqual(index.find_empty_space(20, 30, 50, mode='pattern')[:3], next_slot[:3])
+
+    def test_parallel_search_matches_in_process(self):
+        """Container snapshots searched on the process pool give the in-process answers"""
+        containers = [
+            SimpleNamespace(id=f"c{index}", width=100, depth=80, height=60) for index in range(3)
+        ]
+        contents = [self.items[:20], self.items[20:45], []]
+        tasks = [container_task(container, items) for container, items in zip(containers, contents)]
+        for mode in ('grid', 'front_first', 'coarse_to_fine'):
+            expected = []
+            for container, items in zip(containers, contents):
+                index = SPATIAL_BACKENDS['grid'](container, items=items)
+                if mode == 'coarse_to_fine':
+                    expected.append(index.find_space_coarse_to_fine(25, 15, 20, min_resolution=5))
+                else:
+                    expected.append((index.find_empty_space(25, 15, 20, mode=mode), None))
+            self.assertEqual(search_containers(tasks, (25, 15, 20), mode, 5, None, workers=2), expected)
+
+        # Workers skip searches whose deadline passed while they were queued
+        self.assertIsNone(search_container(tasks[0], (25, 15, 20), 'grid', 5, None, expires=time.time() - 1))
+
+    def test_choose_backend(self):
+        """The grid is picked unless big items would fill too many of its cells"""
+        def items_of_sizes(sizes):
+            return [ItemSnapshot(f"s{i}", size, size, size, 0, 0, 0) for i, size in enumerate(sizes)]
+        
+        self.assertEqual(choose_backend(self.container, [])[0], 'grid')
+        self.assertEqual(choose_backend(self.container, items_of_sizes([10] * 200)), ('grid', {'cell_size': 10.0}))
+        self.assertEqual(choose_backend(self.container, items_of_sizes([10] * 180 + [40] * 20))[0], 'grid')
+        self.assertEqual(choose_backend(self.container, items_of_sizes([5] * 150 + [50] * 50))[0], 'array_octree')
+        self.assertEqual(choose_backend(self.container, items_of_sizes([5] * 1500 + [50] * 500))[0], 'array_octree')
+
+    def test_configured_backend(self):
+        """The SPATIAL_INDEX_BACKEND setting overrides the automatic choice"""
+        previous = app.config['SPATIAL_INDEX_BACKEND']
+        try:
+            app.config['SPATIAL_INDEX_BACKEND'] = 'rtree'
+            self.assertEqual(type(create_index(self.container, self.items)).__name__, 'RTreeIndex')
+            app.config['SPATIAL_INDEX_BACKEND'] = 'unknown'
+            with self.assertRaises(ValueError):
+                create_index(self.container, self.items)
+        finally:
+            app.config['SPATIAL_INDEX_BACKEND'] = previous
+
+
+if __name__ == '__main__':
+    unittest.main()
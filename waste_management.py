@@ -2,8 +2,9 @@ from models import Item, UsageLog, Container
 from app import db, logger
 from datetime import datetime
 import numpy as np
-from octree import Octree
 from algorithms import optimize_waste_return
+from snapshots import ItemSnapshot
+from spatial_cache import build_index, notify_items_committed
 
 def check_for_waste_items():
     """Check all items for waste status and update the database."""
@@ -61,11 +62,8 @@ def move_waste_to_container(waste_item_id, container_id):
         if not container:
             return None, f"Container with ID {container_id} not found"
         
-        # Create octree for the container
-        octree = Octree(container)
-        
-        # Find empty space in the container
-        position = octree.find_empty_space(item.width, item.depth, item.height)
+        # Find empty space among the container's current items
+        position = build_index(container).find_empty_space(item.width, item.depth, item.height)
         
         if not position:
             return None, f"No suitable space found in container {container_id}"
@@ -81,8 +79,10 @@ def move_waste_to_container(waste_item_id, container_id):
         item.y_pos = y
         item.z_pos = z
         item.rotated = rotated
+        placed = ItemSnapshot.from_item(item)
         
         db.session.commit()
+        notify_items_committed(removed=[(previous_container_id, waste_item_id)], placed=[placed])
         
         # Log the movement
         log = UsageLog(
@@ -144,6 +144,7 @@ def process_undock_event(container_id):
             item.z_pos = None
         
         db.session.commit()
+        notify_items_committed(removed=[(container_id, item_data['id']) for item_data in waste_manifest['items']])
         
         return waste_manifest, None
     except Exception as e: